@@ -0,0 +1,404 @@
+# dense area x occupation aggregates
+# every callback used to filter all ~38k rows with boolean masks and then groupby the result.
+# the dataset is static, so the per (area, occupation) aggregates are computed once into
+# 52 x ~1,150 matrices and the callbacks only index into them.
+# besides the states, the area axis can hold metropolitan areas (the MSA files of OEWS). the
+# state-level areas are the ones drawn on the maps and ranked in the by-state tables and
+# histograms; those, and the top of every table, are precomputed per slice so that a callback
+# costs the same however many areas there are.
+# a new version of the dataset on the same axes (see updated) only recomputes the histograms
+# and the ranks of the areas and occupations with a changed cell.
+#
+# the callbacks and the data api query the data through select, cells, top_cells and
+# growth_from of Aggregates and value, area_histogram, occupation_histogram, top_by_area,
+# top_by_occupation, map_values and the growth_ methods of Selection; database.py implements
+# that interface on an sqlite file. the other methods only work on the matrices.
+import numpy as np
+import pandas as pd
+
+
+class Aggregates:
+
+    def __init__(self, data, areas, occupations, total_area='U.S.', total_occupation='All Occupations', states=None):
+        # states: the state-level areas, every area but the total by default
+        self.areas = list(areas)
+        self.occupations = list(occupations)
+        self.area_index = {a: i for i, a in enumerate(self.areas)}
+        self.occ_index = {o: i for i, o in enumerate(self.occupations)}
+        self.total_area = total_area
+        self.total_occupation = total_occupation
+        if states is None:
+            self.state_mask = np.array([a != total_area for a in self.areas])
+        else:
+            states = set(states)
+            self.state_mask = np.array([a in states for a in self.areas])
+        self._aggregate(data)
+        self._index()
+
+    def _aggregate(self, data):
+        # gauge ranges are taken over every row of the dataset
+        self.income_range = [data['Annual Median Income'].min(), data['Annual Median Income'].max()]
+        self.employment_range = [data['Total Employment'].min(), data['Total Employment'].max()]
+
+        # integer codes for both axes
+        codes = pd.DataFrame({
+            'area': data['AREA_TITLE'].map(self.area_index),
+            'occ': data['OCC_TITLE'].map(self.occ_index),
+            'income': data['Annual Median Income'],
+            'employment': data['Total Employment'],
+        }).dropna(subset=['area', 'occ'])
+        stats = codes.groupby([codes['area'].astype(int), codes['occ'].astype(int)]).agg(
+            income=('income', 'median'),
+            employment=('employment', 'sum'),
+            employment_value=('employment', 'median'),
+            rows=('income', 'size'),
+        )
+        a = stats.index.get_level_values(0).to_numpy()
+        o = stats.index.get_level_values(1).to_numpy()
+
+        shape = (len(self.areas), len(self.occupations))
+        # median income of the rows in each cell (NaN if missing)
+        self.income = np.full(shape, np.nan)
+        self.income[a, o] = stats['income'].to_numpy()
+        # total employment of the rows in each cell (0 if missing, like an empty .sum())
+        self.employment = np.zeros(shape)
+        self.employment[a, o] = stats['employment'].to_numpy()
+        # employment of a single row, duplicated rows of a cell carry the same values
+        self.employment_value = np.full(shape, np.nan)
+        self.employment_value[a, o] = stats['employment_value'].to_numpy()
+        # number of rows behind each cell, used to weight histograms like the raw rows did
+        self.rows = np.zeros(shape, dtype=np.int32)
+        self.rows[a, o] = stats['rows'].to_numpy()
+
+    def _index(self):
+        self._names()
+        self._histograms()
+        self._maps()
+        self._ranks()
+
+    def _names(self):
+        self.area_names = np.array(self.areas, dtype=object)
+        self.occ_names = np.array(self.occupations, dtype=object)
+        # every occupation except the all occupations total (the states are set by the constructor)
+        self.detail_mask = self.occ_names != self.total_occupation
+
+    def updated(self, data):
+        # aggregates of another version of the dataset on the same areas and occupations: the
+        # matrices are aggregated again, the histograms and ranks are only recomputed for the
+        # occupations (columns) and areas (rows) that have a changed cell
+        new = self.__class__.__new__(self.__class__)
+        for name in ['areas', 'occupations', 'area_index', 'occ_index', 'total_area', 'total_occupation', 'state_mask']:
+            setattr(new, name, getattr(self, name))
+        new._aggregate(data)
+        new._names()
+        changed = changes(self, new)
+        occupations = np.flatnonzero(changed.any(axis=0))
+        areas = np.flatnonzero(changed.any(axis=1))
+        new._histograms(previous=self, occupations=occupations, areas=areas)
+        new._maps()
+        new._ranks(previous=self, occupations=occupations, areas=areas)
+        return new
+
+    # matrices drawn as histograms: one value per row of the dataset
+    histogram_matrices = ['income', 'employment_value']
+
+    def _histograms(self, nbins=30, previous=None, occupations=None, areas=None):
+        # bin edges and counts of every by-state histogram (one per occupation) and every
+        # by-occupation histogram (one per state), weighted by the rows behind each cell.
+        # with previous, only the given occupations and areas are binned, the other
+        # histograms are taken from the previous aggregates
+        if previous is None:
+            occupations, areas = range(len(self.occupations)), range(len(self.areas))
+        self.area_histograms = {}
+        self.occupation_histograms = {}
+        for name in self.histogram_matrices:
+            matrix = getattr(self, name)
+            states = matrix[self.state_mask]
+            state_rows = self.rows[self.state_mask]
+            by_area = list(previous.area_histograms[name]) if previous is not None else [None] * len(self.occupations)
+            for o in occupations:
+                by_area[o] = histogram(states[:, o], state_rows[:, o], nbins)
+            self.area_histograms[name] = by_area
+            details = matrix[:, self.detail_mask]
+            detail_rows = self.rows[:, self.detail_mask]
+            by_occupation = list(previous.occupation_histograms[name]) if previous is not None else [None] * len(self.areas)
+            for a in areas:
+                by_occupation[a] = histogram(details[a], detail_rows[a], nbins)
+            self.occupation_histograms[name] = by_occupation
+
+    # matrices drawn as maps
+    map_matrices = ['income', 'employment']
+
+    def _maps(self):
+        # z vector of every map, one row per occupation in the order of the states:
+        # the value of the state, NaN (no fill) where the state has no rows for the occupation
+        self.maps = {}
+        state_rows = self.rows[self.state_mask]
+        for name in self.map_matrices:
+            values = np.where(state_rows > 0, getattr(self, name)[self.state_mask], np.nan)
+            self.maps[name] = np.ascontiguousarray(values.T)
+
+    # matrices of the top 5 tables
+    ranked_matrices = ['income', 'employment']
+    top_n = 5
+
+    def _ranks(self, previous=None, occupations=None, areas=None):
+        # positions of the top_n states of every occupation (area_ranks, one row per occupation)
+        # and of the top_n detailed occupations of every area (occupation_ranks, one row per
+        # area) among the cells that have rows, -1 past the end of a short slice.
+        # with previous, only the rows of the given occupations and areas are ranked again
+        self.area_ranks = {}
+        self.occupation_ranks = {}
+        for name in self.ranked_matrices:
+            matrix = getattr(self, name)
+            area_keep = (self.rows > 0).T & self.state_mask
+            occupation_keep = (self.rows > 0) & self.detail_mask
+            if previous is None:
+                self.area_ranks[name] = ranks(matrix.T, area_keep, self.top_n)
+                self.occupation_ranks[name] = ranks(matrix, occupation_keep, self.top_n)
+                continue
+            self.area_ranks[name] = previous.area_ranks[name].copy()
+            self.area_ranks[name][occupations] = ranks(matrix.T[occupations], area_keep[occupations], self.top_n)
+            self.occupation_ranks[name] = previous.occupation_ranks[name].copy()
+            self.occupation_ranks[name][areas] = ranks(matrix[areas], occupation_keep[areas], self.top_n)
+
+    # plain numpy arrays of the aggregates, e.g. to publish them in shared memory
+    matrices = ['income', 'employment', 'employment_value', 'rows']
+
+    def to_arrays(self):
+        arrays = {name: getattr(self, name) for name in self.matrices}
+        arrays['areas'] = np.array(self.areas, dtype=str)
+        arrays['occupations'] = np.array(self.occupations, dtype=str)
+        arrays['totals'] = np.array([self.total_area, self.total_occupation], dtype=str)
+        arrays['income_range'] = np.array(self.income_range, dtype=np.float64)
+        arrays['employment_range'] = np.array(self.employment_range, dtype=np.float64)
+        arrays['state_mask'] = self.state_mask
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        # the matrices are used as they are, without copying
+        self = cls.__new__(cls)
+        self.areas = arrays['areas'].tolist()
+        self.occupations = arrays['occupations'].tolist()
+        self.area_index = {a: i for i, a in enumerate(self.areas)}
+        self.occ_index = {o: i for i, o in enumerate(self.occupations)}
+        self.total_area, self.total_occupation = arrays['totals'].tolist()
+        self.income_range = arrays['income_range'].tolist()
+        self.employment_range = arrays['employment_range'].tolist()
+        for name in cls.matrices:
+            setattr(self, name, arrays[name])
+        # files written before the area levels only had the states
+        if 'state_mask' in arrays:
+            self.state_mask = arrays['state_mask']
+        else:
+            self.state_mask = np.array([a != self.total_area for a in self.areas])
+        self._index()
+        return self
+
+    def select(self, state, occupation, title=None, growth=None, period=None):
+        return Selection(self, state, occupation, title, growth, period)
+
+    def cells(self, a=None, o=None):
+        # positions and values of the cells with rows: the cell (a, o), the detailed occupations
+        # of area a, or every area of occupation o
+        if a is not None and o is not None:
+            areas, occupations = (np.array([a]), np.array([o])) if self.rows[a, o] > 0 else (np.array([], dtype=np.int64),) * 2
+        elif a is not None:
+            occupations = np.flatnonzero((self.rows[a] > 0) & self.detail_mask)
+            areas = np.full(len(occupations), a)
+        else:
+            areas = np.flatnonzero(self.rows[:, o] > 0)
+            occupations = np.full(len(areas), o)
+        return self._cells(areas, occupations)
+
+    def top_cells(self, name, n, a=None, o=None):
+        # cells of the n largest values of a ranked matrix, in the order of top(): the states of
+        # occupation o, or the detailed occupations of area a
+        matrix = getattr(self, name)
+        if o is not None:
+            if n <= self.top_n:
+                order = self.area_ranks[name][o]
+            else:
+                order = ranks(matrix[:, o][None], ((self.rows[:, o] > 0) & self.state_mask)[None], n)[0]
+            order = order[order >= 0][:n]
+            return self._cells(order, np.full(len(order), o))
+        if n <= self.top_n:
+            order = self.occupation_ranks[name][a]
+        else:
+            order = ranks(matrix[a][None], ((self.rows[a] > 0) & self.detail_mask)[None], n)[0]
+        order = order[order >= 0][:n]
+        return self._cells(np.full(len(order), a), order)
+
+    def _cells(self, areas, occupations):
+        return {
+            'area': areas,
+            'occupation': occupations,
+            'income': self.income[areas, occupations],
+            'employment': self.employment[areas, occupations],
+            'rows': self.rows[areas, occupations],
+        }
+
+    def growth_from(self, old):
+        # what Selection takes as growth: the growth matrices from an older year
+        return growth(old, self)
+
+
+class Selection:
+    # one (state, occupation) slice of the aggregates, shared by all eight figures
+
+    def __init__(self, agg, state, occupation, title=None, growth=None, period=None):
+        self.agg = agg
+        self.state = state
+        self.occupation = occupation
+        self.title = occupation if title is None else title
+        # year over year growth matrices aligned with agg (see years.growth) and their
+        # (from, to) years, when the selection is compared with another year
+        self.growth = growth
+        self.period = period
+        self.a = agg.area_index[state]
+        self.o = agg.occ_index[occupation]
+
+    def value(self, name):
+        # value of the selected cell in a matrix of the aggregates
+        return getattr(self.agg, name)[self.a, self.o]
+
+    def by_area(self, matrix, exclude_total=True):
+        # column slice: (area names, values) of the areas that have rows for the occupation,
+        # only the states with exclude_total
+        keep = self.agg.rows[:, self.o] > 0
+        if exclude_total:
+            keep &= self.agg.state_mask
+        return self.agg.area_names[keep], matrix[keep, self.o]
+
+    def by_occupation(self, matrix):
+        # row slice: (occupation names, values) of the detailed occupations in the state
+        keep = (self.agg.rows[self.a] > 0) & self.agg.detail_mask
+        return self.agg.occ_names[keep], matrix[self.a, keep]
+
+    def area_histogram(self, name):
+        # (edges, counts) of the occupation across the states
+        return self.agg.area_histograms[name][self.o]
+
+    def occupation_histogram(self, name):
+        # (edges, counts) of the detailed occupations in the state
+        return self.agg.occupation_histograms[name][self.a]
+
+    def top_by_area(self, name):
+        # top(*by_area(matrix)) of a ranked matrix, from the precomputed ranks
+        order = self.agg.area_ranks[name][self.o]
+        order = order[order >= 0]
+        return self.agg.area_names[order], getattr(self.agg, name)[order, self.o]
+
+    def top_by_occupation(self, name):
+        # top(*by_occupation(matrix)) of a ranked matrix
+        order = self.agg.occupation_ranks[name][self.a]
+        order = order[order >= 0]
+        return self.agg.occ_names[order], getattr(self.agg, name)[self.a, order]
+
+    def map_values(self, name):
+        # z vector of the occupation's map, the states are in the order of agg.area_names[agg.state_mask]
+        return self.agg.maps[name][self.o]
+
+    def growth_by_area(self, name):
+        # by_area of the growth from the compared year, NaN where it has no rows
+        return self.by_area(self.growth[name])
+
+    def growth_by_occupation(self, name):
+        return self.by_occupation(self.growth[name])
+
+    def growth_map(self, name):
+        # growth of every state, in the order of map_values
+        return self.growth[name][self.agg.state_mask, self.o]
+
+    def area_rows(self, matrix):
+        # one value per row of the dataset, as the histograms were drawn from the rows
+        keep = self.agg.state_mask
+        return np.repeat(matrix[keep, self.o], self.agg.rows[keep, self.o])
+
+    def occupation_rows(self, matrix):
+        keep = self.agg.detail_mask
+        return np.repeat(matrix[self.a, keep], self.agg.rows[self.a, keep])
+
+
+def alignment(old, new):
+    # positions of the areas / occupations of new in old, -1 where old does not have them
+    areas = np.array([old.area_index.get(a, -1) for a in new.areas], dtype=np.int64)
+    occupations = np.array([old.occ_index.get(o, -1) for o in new.occupations], dtype=np.int64)
+    return areas, occupations
+
+
+def growth(old, new, names=('income', 'employment')):
+    # relative change of every cell from old to new, on the axes of new. NaN where either
+    # year has no rows for the cell
+    areas, occupations = alignment(old, new)
+    ix = np.ix_(np.maximum(areas, 0), np.maximum(occupations, 0))
+    present = (areas >= 0)[:, None] & (occupations >= 0)[None, :] & (old.rows[ix] > 0) & (new.rows > 0)
+    result = {}
+    for name in names:
+        before = getattr(old, name)[ix]
+        after = getattr(new, name)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = after / before - 1
+        result[name] = np.where(present & (before != 0), change, np.nan)
+    return result
+
+
+def changes(old, new):
+    # cells of two aggregates on the same axes that differ in any matrix,
+    # None if the areas, the occupations or the states differ
+    if old.areas != new.areas or old.occupations != new.occupations or not np.array_equal(old.state_mask, new.state_mask):
+        return None
+    changed = np.zeros((len(new.areas), len(new.occupations)), dtype=bool)
+    for name in new.matrices:
+        before, after = getattr(old, name), getattr(new, name)
+        changed |= ~((before == after) | (np.isnan(before) & np.isnan(after)))
+    return changed
+
+
+def top(names, values, n=5):
+    # largest n values, missing values last in order of position. equal values come out in
+    # reverse order of position, always: sort_values(ascending = False) of the baseline used an
+    # unstable quicksort, so its order of ties depended on the column and is not kept
+    valid = np.flatnonzero(~np.isnan(values))
+    order = valid[np.argsort(values[valid], kind='stable')[::-1]]
+    if len(order) < n:
+        order = np.concatenate([order, np.flatnonzero(np.isnan(values))])
+    order = order[:n]
+    return names[order], values[order]
+
+
+def ranks(values, keep, n=5):
+    # top() of every row of values at once, restricted to the kept cells: the column positions
+    # of the n largest values, missing values after them, -1 past the kept cells of a row
+    missing = np.isnan(values)
+    position = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+    # kept values first, kept missing values next; ties in reverse order of position
+    tier = np.where(keep, missing.astype(np.int8), 2)
+    value = np.where(keep & ~missing, -values, 0)
+    tiebreak = np.where(missing, position, -position)
+    order = np.lexsort((tiebreak, value, tier))[:, :n]
+    order[np.take_along_axis(tier, order, axis=1) == 2] = -1
+    return order.astype(np.int32)
+
+
+def nice_size(size):
+    # smallest of 1, 2, 2.5, 5 x 10^k that is >= size
+    magnitude = 10 ** np.floor(np.log10(size))
+    for step in [1, 2, 2.5, 5, 10]:
+        if step * magnitude >= size:
+            return step * magnitude
+
+
+def histogram(values, weights, nbins=30):
+    # at most nbins bins of a round width, like plotly's nbinsx, computed on the server
+    keep = ~np.isnan(values) & (weights > 0)
+    values, weights = values[keep], weights[keep]
+    if not len(values):
+        return np.array([]), np.array([], dtype=np.int64)
+    low, high = values.min(), values.max()
+    size = nice_size((high - low) / nbins if high > low else max(abs(high), 1) / 10)
+    start = np.floor(low / size) * size
+    edges = start + size * np.arange(int(np.floor((high - start) / size)) + 2)
+    counts, edges = np.histogram(values, edges, weights=weights)
+    return edges, counts.astype(np.int64)
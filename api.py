@@ -0,0 +1,200 @@
+# read-only data api
+# the slices behind the figures as data rather than figure json: one cell, the occupations of an
+# area, the areas of an occupation and the top n of either, as json, csv or arrow ipc. a response
+# only depends on the dataset and the query, so its etag is a hash of the dataset version and the
+# query: clients and proxies revalidate with If-None-Match and get an empty 304 back.
+import csv
+import gzip
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# arrow ipc needs pyarrow, json and csv work without it
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+COLUMNS = ['area', 'level', 'occupation', 'annual_median_income', 'total_employment', 'rows']
+MEDIA_TYPES = {
+    'json': 'application/json',
+    'csv': 'text/csv; charset=utf-8',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+# query parameters that select a slice, the others are ignored (and not part of the etag)
+PARAMETERS = ['area', 'occupation', 'metric', 'n', 'year']
+METRICS = ['income', 'employment']
+MAX_N = 1000
+# smaller responses are sent uncompressed
+GZIP_MIN_BYTES = 1000
+
+
+class ApiError(Exception):
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+        self.message = message
+
+
+def area_levels(agg):
+    return np.where(agg.area_names == agg.total_area, 'total', np.where(agg.state_mask, 'state', 'metro'))
+
+
+def cells(agg, result):
+    # columns of the cells of agg.cells / agg.top_cells
+    a, o = result['area'], result['occupation']
+    return {
+        'area': agg.area_names[a],
+        'level': area_levels(agg)[a],
+        'occupation': agg.occ_names[o],
+        'annual_median_income': result['income'],
+        'total_employment': result['employment'].astype(np.int64),
+        'rows': result['rows'].astype(np.int64),
+    }
+
+
+def area_position(agg, params):
+    area = params.get('area')
+    if area is None:
+        raise ApiError(400, 'area is required')
+    if area not in agg.area_index:
+        raise ApiError(404, 'unknown area: {}'.format(area))
+    return agg.area_index[area]
+
+
+def occupation_position(agg, params):
+    occupation = params.get('occupation')
+    if occupation is None:
+        raise ApiError(400, 'occupation is required')
+    if occupation not in agg.occ_index:
+        raise ApiError(404, 'unknown occupation: {}'.format(occupation))
+    return agg.occ_index[occupation]
+
+
+def cell(agg, params):
+    # the value of one gauge, no rows if the workbook has none for the cell
+    return cells(agg, agg.cells(area_position(agg, params), occupation_position(agg, params)))
+
+
+def area(agg, params):
+    # the detailed occupations of an area, the by-occupation table and histogram
+    return cells(agg, agg.cells(a = area_position(agg, params)))
+
+
+def occupation(agg, params):
+    # every area with rows for an occupation: the total, the states (the by-state table,
+    # histogram and map) and any other area
+    return cells(agg, agg.cells(o = occupation_position(agg, params)))
+
+
+def top(agg, params):
+    # the n largest values of a metric: the states of an occupation, or the detailed
+    # occupations of an area, in the order of the top 5 tables
+    metric = params.get('metric', 'income')
+    if metric not in METRICS:
+        raise ApiError(400, 'metric must be one of {}'.format(', '.join(METRICS)))
+    try:
+        n = int(params.get('n', agg.top_n))
+    except ValueError:
+        raise ApiError(400, 'n must be an integer')
+    if not 1 <= n <= MAX_N:
+        raise ApiError(400, 'n must be between 1 and {}'.format(MAX_N))
+    if ('area' in params) == ('occupation' in params):
+        raise ApiError(400, 'either area or occupation is required')
+    if 'occupation' in params:
+        return cells(agg, agg.top_cells(metric, n, o = occupation_position(agg, params)))
+    return cells(agg, agg.top_cells(metric, n, a = area_position(agg, params)))
+
+
+QUERIES = {'cell': cell, 'area': area, 'occupation': occupation, 'top': top}
+
+
+def slice_parameters(args):
+    # the parameters of a request that select the slice, in a fixed order
+    return tuple((k, args[k]) for k in PARAMETERS if k in args)
+
+
+def negotiate(format, accept=''):
+    # format from the `format` parameter, else from the Accept header, json by default
+    if format:
+        if format not in MEDIA_TYPES:
+            raise ApiError(400, 'format must be one of {}'.format(', '.join(MEDIA_TYPES)))
+        return format
+    for name in ['arrow', 'csv']:
+        if MEDIA_TYPES[name].split(';')[0] in accept:
+            return name
+    return 'json'
+
+
+def etag(version, kind, params, format):
+    # strong etag: the same dataset version and query always give the same bytes
+    key = json.dumps([version, kind, params, format], separators=(',', ':'))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def values_list(values):
+    # python values of a column, None for missing values
+    if values.dtype.kind == 'f':
+        return [None if v != v else v for v in values.tolist()]
+    return values.tolist()
+
+
+def encode(columns, format, meta):
+    # meta: dataset version and year, in the json body, the arrow schema and not in the csv
+    if format == 'json':
+        data = {name: values_list(columns[name]) for name in COLUMNS}
+        records = [dict(zip(COLUMNS, row)) for row in zip(*(data[name] for name in COLUMNS))]
+        return json.dumps(dict(meta, columns=COLUMNS, data=records), separators=(',', ':')).encode('utf-8')
+
+    if format == 'csv':
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(COLUMNS)
+        writer.writerows(zip(*(['' if v is None else v for v in values_list(columns[name])] for name in COLUMNS)))
+        return out.getvalue().encode('utf-8')
+
+    if pyarrow is None:
+        raise ApiError(406, 'arrow responses need pyarrow on the server')
+    # from_pandas: NaN is null
+    table = pyarrow.table({name: pyarrow.array(columns[name], from_pandas=True) for name in COLUMNS})
+    table = table.replace_schema_metadata({k: str(v) for k, v in meta.items()})
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def compress(body):
+    # gzipped body, None when compressing is not worth it
+    if len(body) < GZIP_MIN_BYTES:
+        return None
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+class BodyCache:
+    # encoded bodies by etag: (body, gzipped body or None), least recently used first
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
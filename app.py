@@ -1,25 +1,43 @@
 # data manipulation
-import pandas as pd
-
-# plotly 
-import plotly.express as px
-import plotly.graph_objects as go
+import os
+import time
+import json
+import hmac
+import numpy as np
 
 # dashboards
-from dash import Dash, dcc, html, dash_table
-from dash.dependencies import Input, Output
+from dash import Dash, dcc, html, dash_table, no_update
+from dash.exceptions import PreventUpdate
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from flask import g, has_request_context, request
 import dash_bootstrap_components as dbc #for dashboard theme
 from datetime import date
 
-
-# read excel file
-# estimated run time = 2.21s
-data = pd.read_excel('OEWS_2021_Data.xlsx')
-
-# cleaning
-data['A_MEDIAN'] = [i if type(i) == int else None for i in data["A_MEDIAN"]]
-data['TOT_EMP'] = [i if type(i) == int else None for i in data["TOT_EMP"]]
-data = data.rename(columns = {'A_MEDIAN':'Annual Median Income', 'TOT_EMP':'Total Employment'})
+# data loading
+from loader import compact, load_data, memory_table, source_hash
+from aggregates import Aggregates, changes, top
+from figures import Choropleth, bars, encoded, gauge, placeholder, title_font, top_table
+from cache import DiskStore, FigureCache, figure_json, plotly_json
+from clientside import build_bundle
+from prerender import open_store, store_path
+from shared import attach, memory_report, publish, shared_path
+from search import OccupationIndex
+from years import Dataset, YearRegistry, discover
+from api import MEDIA_TYPES, QUERIES, ApiError, BodyCache, compress, encode, etag, negotiate, slice_parameters
+from metrics import BYTE_BUCKETS, Registry, profile_summary, start_profile
+from hotreload import FileLock, Reloader, refresh_cache
+from database import database_path, open_database, write_database
+from singleflight import Abandoned, SingleFlight, Sessions
+
+
+# startup time by phase, exposed by /metrics
+startup_start = time.perf_counter()
+startup_seconds = {}
+
+# version of the dataset, used to namespace anything derived from it.
+# it changes when the workbook is reloaded, see reload_data
+workbook = 'OEWS_2021_Data.xlsx'
+data_version = source_hash(workbook)
 
 
 # list of all indicators
@@ -78,11 +96,126 @@ state_dict = {
     "Wyoming": "WY"
 }
 
-occupation_list = ['All Occupations'] + sorted([x for x in data.OCC_TITLE.unique() if x != 'All Occupations'])
 state_list = state_dict.keys()
 
+
+# area x occupation aggregates used by the callbacks.
+# the states come first, then any other area of the workbook (the metropolitan areas of the
+# MSA files), which can be selected but are not drawn on the maps or ranked with the states
+def aggregate_axes(data):
+    occupation_list = ['All Occupations'] + sorted([x for x in data.OCC_TITLE.unique() if x != 'All Occupations'])
+    area_list = list(state_list) + sorted(set(data.AREA_TITLE.unique()) - set(state_list))
+    return area_list, occupation_list
+
+def build_aggregates(data):
+    area_list, occupation_list = aggregate_axes(data)
+    return Aggregates(data, area_list, occupation_list, states = [i for i in state_list if i != 'U.S.'])
+
+# aggregates of a new version of the data: only the changed rows and columns are binned and
+# ranked again when the areas and occupations are the same
+def rebuild_aggregates(previous, data):
+    area_list, occupation_list = aggregate_axes(data)
+    if area_list == previous.areas and occupation_list == previous.occupations:
+        return previous.updated(data)
+    return build_aggregates(data)
+
+
+# read data
+# parsing the excel file takes ~2.2s, load_data reads the cached .npz built from it instead.
+# with SHARED_DATA=1 the aggregates are read from a memory-mapped file shared by all the workers
+# (gunicorn.conf.py preloads the app, so that only the master builds it). the callbacks only
+# read the aggregates, so the cleaned rows are neither written to the file nor kept
+shared_data = os.environ.get('SHARED_DATA', '0') == '1'
+
+# cleaned rows of a workbook and its aggregates: (rows, None) without SHARED_DATA, the
+# aggregates are built from the rows, (None, aggregates) with it
+def read_dataset(path, version):
+    if not shared_data:
+        return load_data(path), None
+    with FileLock(shared_path(path) + '.lock'):
+        shared = attach(shared_path(path), version)
+        if shared is None:
+            arrays = build_aggregates(load_data(path)).to_arrays()
+            publish(shared_path(path), {'agg/' + k: v for k, v in arrays.items()}, version)
+            shared = attach(shared_path(path), version)
+    return None, Aggregates.from_arrays({k[4:]: v for k, v in shared.items() if k.startswith('agg/')})
+
+# CLIENTSIDE=1 ships the aggregates to the browser once and renders the figures there,
+# see clientside.py. the bundle is compressed with the rest of the responses
+clientside = os.environ.get('CLIENTSIDE', '0') == '1'
+
+# QUERY_BACKEND=sqlite answers the callbacks and the data api from an indexed sqlite file next
+# to each workbook (database.py) instead of the aggregates in memory. the file is written from
+# the aggregates when it is missing or stale, the rows are not kept. the clientside bundle is
+# built from the aggregates in memory
+query_backend = 'memory' if clientside else os.environ.get('QUERY_BACKEND', 'memory')
+
+# the sqlite file of a workbook, written by one worker at a time
+def query_database(path, version):
+    file = database_path(path)
+    with FileLock(file + '.lock'):
+        db = open_database(file, version)
+        if db is None:
+            write_database(file, build_aggregates(compact(load_data(path))), version)
+            db = open_database(file, version)
+    return db
+
+phase_start = time.perf_counter()
+if query_backend == 'sqlite':
+    data = data_memory = None
+    agg = query_database(workbook, data_version)
+    startup_seconds['load'] = time.perf_counter() - phase_start
+else:
+    raw, agg = read_dataset(workbook, data_version)
+
+    # compact in-memory representation: categorical titles and downcast values.
+    # data_memory holds the bytes per column before and after, MEMORY_REPORT=1 prints it at startup
+    startup_seconds['load'] = time.perf_counter() - phase_start
+    data = data_memory = None
+    if raw is not None:
+        data = compact(raw)
+        data_memory = memory_table(raw, data)
+        del raw
+    if agg is None:
+        phase_start = time.perf_counter()
+        agg = build_aggregates(data)
+        startup_seconds['aggregates'] = time.perf_counter() - phase_start
+    if os.environ.get('MEMORY_REPORT', '0') == '1' and data_memory is not None:
+        print(data_memory, flush = True)
+
+occupation_list = agg.occupations
+
+# the occupation dropdown only ships a short list, the rest is found by occupation_options.
+# before anything is typed it offers all occupations and the largest occupations in the U.S.
+occupation_index = OccupationIndex(occupation_list)
+
+def largest_occupations(agg):
+    return ['All Occupations'] + list(agg.occ_names[agg.top_cells('employment', 25, a = agg.area_index['U.S.'])['occupation']])
+
+default_occupations = largest_occupations(agg)
+
+
+# other years: every OEWS_<year>_Data.xlsx next to this one is loaded the first time it is
+# selected. OEWS_YEARS_RESIDENT bounds the years kept in memory, 2021 always stays
+default_year = 2021
+
+def load_year(year, path):
+    version = source_hash(path)
+    if query_backend == 'sqlite':
+        year_agg = query_database(path, version)
+    else:
+        year_agg = build_aggregates(compact(load_data(path)))
+    return Dataset(year, version, year_agg, OccupationIndex(year_agg.occupations))
+
+years = YearRegistry(discover('.'), load_year, max_resident = int(os.environ.get('OEWS_YEARS_RESIDENT', 3)))
+years.pin(Dataset(default_year, data_version, agg, occupation_index))
+# the year selector and the growth tab only show up with more than one workbook,
+# the clientside bundle only holds the default year
+multi_year = len(years.years) > 1 and not clientside
+year_options = [{'label': str(i), 'value': i} for i in years.years]
+
 # app
-app = Dash(__name__, external_stylesheets=[dbc.themes.LUMEN])
+app = Dash(__name__, external_stylesheets=[dbc.themes.LUMEN], compress = clientside)
 server = app.server
 
 
@@ -99,7 +232,7 @@ app.layout = html.Div([
             dcc.Dropdown(
                 id = 'state_list',
                 value = 'U.S.',
-                options = [{'label': i, 'value': i} for i in state_list]
+                options = [{'label': i, 'value': i} for i in agg.areas]
                 ),
             ], style = {'width': '45%', 'height':'100px', 'display': 'inline-block', 'text-align':'left'}
         ),
@@ -109,16 +242,16 @@ app.layout = html.Div([
             dcc.Dropdown(
                 id='occupation_list',
                 value = 'All Occupations',
-                options = [{'label': i, 'value': i} for i in occupation_list]
+                options = [{'label': i, 'value': i} for i in default_occupations]
                 ),
             ], style = {'width': '45%', 'height':'100px', 'display': 'inline-block', 'text-align':'left'}
         ),
     ], style={'width': '100%', "display":"inline-block", 'text-align':'center'}),
     
     #Graphs
-    dcc.Tabs([
+    dcc.Tabs(id = 'tabs', value = 'salary', children = [
             #tab1 (salary)
-            dcc.Tab(label = 'Median Salary', children = [
+            dcc.Tab(label = 'Median Salary', value = 'salary', children = [
                 html.Div([
                     html.Div([
                         html.Div([
@@ -156,7 +289,7 @@ app.layout = html.Div([
 
 
             #tab2 (employment)
-            dcc.Tab(label = '# of Employment', children = [
+            dcc.Tab(label = '# of Employment', value = 'employment', children = [
                 html.Div([
                     html.Div([
                         html.Div([
@@ -195,19 +328,43 @@ app.layout = html.Div([
 ])
 
 
+# with more than one workbook: the year to show, a year to compare it with, and the growth
+# between the two by state and by occupation
+def graph_row(left, right):
+    return html.Div([
+        html.Div([dcc.Loading(dcc.Graph(id = left))], style={'width': '45%', "display":"inline-block", 'text-align':'left'}),
+        html.Div([dcc.Loading(dcc.Graph(id = right))], style={'width': '45%', "display":"inline-block", 'text-align':'left'}),
+    ], style={'width': '100%', "display":"inline-block", 'text-align':'center'})
 
-# Functions
+if multi_year:
+    app.layout.children[0].children = 'Median Salary/Employment Dashboard from OEWS'
+    app.layout.children.insert(5, html.Div([
+        html.Div(children = [
+            html.Label('Select Year'),
+            html.Br(),
+            dcc.Dropdown(id = 'year', value = default_year, clearable = False, options = year_options),
+            ], style = {'width': '45%', 'height':'100px', 'display': 'inline-block', 'text-align':'left'}
+        ),
+        html.Div(children = [
+            html.Label('Compare With'),
+            html.Br(),
+            dcc.Dropdown(id = 'compare_year', value = None, placeholder = 'Select a year to compare', options = year_options),
+            ], style = {'width': '45%', 'height':'100px', 'display': 'inline-block', 'text-align':'left'}
+        ),
+    ], style={'width': '100%', "display":"inline-block", 'text-align':'center'}))
+    app.layout.children[-1].children.append(dcc.Tab(label = 'Growth', value = 'growth', children = [
+        html.Div([
+            graph_row('salary_growth_table', 'salary_growth_map'),
+            graph_row('employment_growth_table', 'employment_growth_map'),
+        ]),
+    ]))
 
-# Salary Function
 
-# number function    
-@app.callback(
-    Output('salary_number', 'figure'),
-    Input('state_list', 'value'),
-    Input('occupation_list', 'value')
-)
-def salary_number(state, occupation):
-    
+
+# Functions
+
+# shortened occupation title used in the figure titles
+def short_title(occupation):
     if len(occupation) > len('All Occupations'):
         if ',' in occupation:
             occupation_title = occupation.replace(',', '...?').replace(' and ', '...?')
@@ -219,225 +376,101 @@ def salary_number(state, occupation):
         occupation_title = occupation_title.split('?')[0]
     else: 
         occupation_title = occupation
+    return occupation_title
+
+# shortened titles of every occupation, computed once
+short_titles = {o: short_title(o) for o in occupation_list}
+
+
+# slice of the aggregates shared by the figures of one (state, occupation) change in a year,
+# with the growth from the compared year when there is one. None if the year's workbook does
+# not have the location or the occupation, e.g. when a dropdown was cleared
+def select(state, occupation, year = None, compare = None):
+    year = default_year if year is None else year
+    dataset = years.get(year)
+    if state not in dataset.agg.area_index or occupation not in dataset.agg.occ_index:
+        return None
+    title = short_titles[occupation] if occupation in short_titles else short_title(occupation)
+    growth, period = None, None
+    if compare is not None and compare != year:
+        # change from the compared year to the shown one, on the axes of the shown one
+        period = (compare, year)
+        growth = years.growth(compare, year)
+    return dataset.agg.select(state, occupation, title, growth, period)
+
+
+# gauge value, empty gauge if the value is not available
+def gauge_value(value):
+    return None if np.isnan(value) else int(value)
+
+
+# Salary Function
+
+# number function    
+def salary_number(sel):
+    state, occupation, occupation_title = sel.state, sel.occupation, sel.title
     title = 'Annual Median Income of {} in {}'.format(occupation_title, state)
 
-    fig1 = go.Figure()
-    
-    fig1.add_trace(go.Indicator(
-        mode = "gauge+number",
-        value = int(data.loc[(data.AREA_TITLE == state) & (data.OCC_TITLE == occupation), 'Annual Median Income'].median()),
-        number={'font_color':'blue', 'font_size':80, 'prefix': '$'},
-        domain = {'row': 0, 'column': 1},
-        gauge = {
-            'axis': {'range': [data['Annual Median Income'].min(), data['Annual Median Income'].max()], 'tickwidth': 1, 'tickcolor': "darkblue"},
-                'bar': {'color': "blue"},
-            }    
-    ))
-    
-    fig1.update_layout(
-        template = {'data' : {'indicator': [{
-            'title': {'text': title, 'font':{'size':18}},
-            }]
-         }})
-    return fig1
+    return gauge(gauge_value(sel.value('income')), title, sel.agg.income_range, 'blue', prefix = '$', tickcolor = 'darkblue')
 
 
 # histogram function
-@app.callback(
-    Output('salary_histogram', 'figure'),
-    Input('state_list', 'value'),
-    Input('occupation_list', 'value')
-)
-def salary_hist(state, occupation):
-
-    if len(occupation) > len('All Occupations'):
-        if ',' in occupation:
-            occupation_title = occupation.replace(',', '...?').replace(' and ', '...?')
-        else:
-            occupation_title = occupation.replace(' ', '...?')
-    else: 
-        occupation_title = occupation
-    if '...?' in occupation_title:
-        occupation_title = occupation_title.split('?')[0]
-    else: 
-        occupation_title = occupation
+def salary_hist(sel):
+    state, occupation, occupation_title = sel.state, sel.occupation, sel.title
 
     if state == 'U.S.':
-        fig2 = px.histogram(data[(data.AREA_TITLE.isin([x for x in state_list if x != 'U.S.'])) & (data.OCC_TITLE == occupation)], x="Annual Median Income", nbins = 30)
-        fig2.update_layout(
-            title = dict(
-                text='Annual Median Income of {} in {} by State'.format(occupation_title, state),
-                font = dict(size = 18),
-                ),
-            xaxis_title="Annual Median Income ($)"
+        fig2 = bars(
+            sel.area_histogram('income'), "Annual Median Income",
+            'Annual Median Income of {} in {} by State'.format(occupation_title, state),
+            xaxis_title="Annual Median Income ($)",
             )
     elif occupation == 'All Occupations':
-        fig2 = px.histogram(data[(data.AREA_TITLE == state) & (data.OCC_TITLE.isin([x for x in occupation_list if x != 'All Occupations']))], x="Annual Median Income", nbins = 30)
-        fig2.update_layout(
-            title = dict(
-                text = 'Annual Median Income of {} in {} by Occupation'.format(occupation_title, state),
-                font = dict(size = 18),
-                ),
-            xaxis_title="Annual Median Income ($)"
-        )
+        fig2 = bars(
+            sel.occupation_histogram('income'), "Annual Median Income",
+            'Annual Median Income of {} in {} by Occupation'.format(occupation_title, state),
+            xaxis_title="Annual Median Income ($)",
+            )
     else:
-        fig2 = go.Figure()
-    
-        fig2.add_trace(go.Indicator(
-            number = {'font': {'size': 1}
-                    },
-            value = None
-            ))
-
-        fig2.update_layout(
-        template = {'data' : {'indicator': [{
-            'title': {'text': 'No Histogram', 'font':{'size': 80}}
-            }]
-        }})
+        fig2 = placeholder('No Histogram')
         
     return fig2
 
 
 # table function
-@app.callback(
-    Output('salary_table', 'figure'),
-    Input('state_list', 'value'),
-    Input('occupation_list', 'value')
-)
-def salary_table(state, occupation):
-    if len(occupation) > len('All Occupations'):
-        if ',' in occupation:
-            occupation_title = occupation.replace(',', '...?').replace(' and ', '...?')
-        else:
-            occupation_title = occupation.replace(' ', '...?')
-    else: 
-        occupation_title = occupation
-    if '...?' in occupation_title:
-        occupation_title = occupation_title.split('?')[0]
-    else: 
-        occupation_title = occupation
+def salary_table(sel):
+    state, occupation, occupation_title = sel.state, sel.occupation, sel.title
 
     if state == 'U.S.':
-        table = data[(data.AREA_TITLE.isin([x for x in state_list if x != 'U.S.'])) & (data.OCC_TITLE == occupation)].groupby(
-            'AREA_TITLE'
-        ).agg(
-            {'Annual Median Income':'median'
-            }
-        ).sort_values('Annual Median Income', ascending = False).reset_index().rename(columns = {'AREA_TITLE': 'State'}).head()
-        fig3 = go.Figure(data=[go.Table(
-            header=dict(values=list(table.columns),
-                        fill_color='paleturquoise',
-                        align='left'),
-            cells=dict(values=[table.State, table['Annual Median Income']],
-                       fill_color='lavender',
-                       align='left',
-                       format=['', "$,"]),
-            )
-        ])
-        fig3.update_layout(
-            title = dict(
-                text= 'Top 5 States by Annual Median Income of {}'.format(occupation_title),
-                font = dict(size = 18)
-                )         
+        fig3 = top_table(
+            sel.top_by_area('income'), ['State', 'Annual Median Income'], 'paleturquoise', 'lavender', "$,",
+            title_font('Top 5 States by Annual Median Income of {}'.format(occupation_title)),
             )
 
     elif occupation == 'All Occupations':
-        table = data[(data.AREA_TITLE == state) & (data.OCC_TITLE.isin([x for x in occupation_list if x != 'All Occupations']))].groupby(
-            'OCC_TITLE'
-        ).agg(
-            {'Annual Median Income':'median'
-            }
-        ).sort_values('Annual Median Income', ascending = False).reset_index().rename(columns = {'OCC_TITLE': 'State'}).head()
-        fig3 = go.Figure(data=[go.Table(
-            header=dict(values=list(table.columns),
-                        fill_color='paleturquoise',
-                        align='left'),
-            cells=dict(values=[table.State, table['Annual Median Income']],
-                       fill_color='lavender',
-                       align='left',
-                       format=['', "$,"]))
-        ])
-        fig3.update_layout(
-            title = dict(
-                text='Top 5 Occupations by Annual Median Income of {}'.format(state),
-                font = dict(size = 18)
-                )         
+        fig3 = top_table(
+            sel.top_by_occupation('income'), ['State', 'Annual Median Income'], 'paleturquoise', 'lavender', "$,",
+            title_font('Top 5 Occupations by Annual Median Income of {}'.format(state)),
             )
     else:
-        fig3 = go.Figure()
-    
-        fig3.add_trace(go.Indicator(
-            number = {'font': {'size': 1}
-                    },
-            value = None
-            ))
-
-        fig3.update_layout(
-        template = {'data' : {'indicator': [{
-            'title': {'text': 'No Table', 'font':{'size': 80}}
-            }]
-        }})
+        fig3 = placeholder('No Table')
     return fig3
 
 
 
-# map function
-@app.callback(
-    Output('salary_map', 'figure'),
-    Input('state_list', 'value'),
-    Input('occupation_list', 'value')
-)
-def salary_map(state, occupation):
+# maps of the states, the locations and the layout are built once per metric
+map_codes = [state_dict[i] for i in agg.area_names[agg.state_mask]]
+salary_choropleth = Choropleth(map_codes, 'Annual Median Income', 'blues')
+employment_choropleth = Choropleth(map_codes, 'Total Employment', 'reds')
 
-    if len(occupation) > len('All Occupations'):
-        if ',' in occupation:
-            occupation_title = occupation.replace(',', '...?').replace(' and ', '...?')
-        else:
-            occupation_title = occupation.replace(' ', '...?')
-    else: 
-        occupation_title = occupation
-    if '...?' in occupation_title:
-        occupation_title = occupation_title.split('?')[0]
-    else: 
-        occupation_title = occupation
 
-    map_df = data[(data.AREA_TITLE.isin([x for x in state_list if x != 'US'])) & (data.OCC_TITLE == occupation)].groupby(
-                                'AREA_TITLE'
-                            ).agg(
-                                {'Annual Median Income':'median',
-                                }
-                            ).reset_index().rename(columns = {'AREA_TITLE': 'State'})
-    map_df['state_code'] = [state_dict[i] for i in map_df['State']]
-    if state == 'U.S.':
-        fig4 = px.choropleth(
-                            map_df,
-                            locations= 'state_code', 
-                            locationmode="USA-states", 
-                            scope="usa",
-                            color='Annual Median Income',
-                            color_continuous_scale="blues"
-                            )
-        fig4.update_layout(
-             title = dict(
-                text ='Annual Median Income of {} in U.S.'.format(occupation),
-                font = dict(size = 18)
-                )         
-            )
+# map function
+def salary_map(sel):
+    state, occupation, occupation_title = sel.state, sel.occupation, sel.title
 
+    if state == 'U.S.':
+        fig4 = salary_choropleth(sel.map_values('income'), 'Annual Median Income of {} in U.S.'.format(occupation))
     else:
-        fig4 = go.Figure()
-    
-        fig4.add_trace(go.Indicator(
-            number = {'font': {'size': 1}
-                    },
-            value = None
-            ))
-
-        fig4.update_layout(
-        template = {'data' : {'indicator': [{
-            'title': {'text': 'No Map', 'font':{'size': 80}}
-            }]
-        }})
+        fig4 = placeholder('No Map')
     return fig4
 
 
@@ -448,250 +481,693 @@ def salary_map(state, occupation):
 
 # Employment Functions
 # number function    
-@app.callback(
-    Output('employment_number', 'figure'),
-    Input('state_list', 'value'),
-    Input('occupation_list', 'value')
-)
-def employment_number(state, occupation):
+def employment_number(sel):
+    state, occupation, occupation_title = sel.state, sel.occupation, sel.title
+    title = 'Total # of Employment of {} in {}'.format(occupation_title, state)
 
-    if len(occupation) > len('All Occupations'):
-        if ',' in occupation:
-            occupation_title = occupation.replace(',', '...?').replace(' and ', '...?')
-        else:
-            occupation_title = occupation.replace(' ', '...?')
-    else: 
-        occupation_title = occupation
-    if '...?' in occupation_title:
-        occupation_title = occupation_title.split('?')[0]
-    else: 
-        occupation_title = occupation
-
-    fig5 = go.Figure()
-    
-    fig5.add_trace(go.Indicator(
-        mode = "gauge+number",
-        value = int(data.loc[(data.AREA_TITLE == state) & (data.OCC_TITLE == occupation), 'Total Employment'].sum()),
-        number={'font_color':'red', 'font_size':80},
-        domain = {'row': 0, 'column': 1},
-        gauge = {
-            'axis': {'range': [data['Total Employment'].min(), data['Total Employment'].max()], 'tickwidth': 1},
-                'bar': {'color': "red"},
-        }
-    ))
-    
-    fig5.update_layout(
-        template = {'data' : {'indicator': [{
-            'title': {'text': 'Total # of Employment of {} in {}'.format(occupation_title, state), 'font':{'size':18}},
-            }]
-         }})
-    return fig5
+    return gauge(gauge_value(sel.value('employment')), title, sel.agg.employment_range, 'red')
 
 
 # histogram function
-@app.callback(
-    Output('employment_histogram', 'figure'),
-    Input('state_list', 'value'),
-    Input('occupation_list', 'value')
-)
-def employment_hist(state, occupation):
-
-    if len(occupation) > len('All Occupations'):
-        if ',' in occupation:
-            occupation_title = occupation.replace(',', '...?').replace(' and ', '...?')
-        else:
-            occupation_title = occupation.replace(' ', '...?')
-    else: 
-        occupation_title = occupation
-    if '...?' in occupation_title:
-        occupation_title = occupation_title.split('?')[0]
-    else: 
-        occupation_title = occupation
+def employment_hist(sel):
+    state, occupation, occupation_title = sel.state, sel.occupation, sel.title
 
     if state == 'U.S.':
-        fig6 = px.histogram(data[(data.AREA_TITLE.isin([x for x in state_list if x != 'U.S.'])) & (data.OCC_TITLE == occupation)],
-                            x="Total Employment",
-                            nbins = 30,
-                            color_discrete_sequence=['indianred'])
-        fig6.update_layout(plot_bgcolor = "#ffe6e6",
-                           title = dict(
-                                text='Total # of Employment of {} in {} by State'.format(occupation_title, state),
-                                font = dict(size = 18)
-                                )                                                   
-                        )
+        fig6 = bars(
+            sel.area_histogram('employment_value'), "Total Employment",
+            'Total # of Employment of {} in {} by State'.format(occupation_title, state),
+            color = 'indianred', plot_bgcolor = "#ffe6e6",
+            )
     elif occupation == 'All Occupations':
-        fig6 = px.histogram(data[(data.AREA_TITLE == state) & (data.OCC_TITLE.isin([x for x in occupation_list if x != 'All Occupations']))], 
-                            x="Total Employment", 
-                            nbins = 30, 
-                            color_discrete_sequence=['indianred'])
-        fig6.update_layout(plot_bgcolor = "#ffe6e6",
-                             title = dict(
-                                text='Total # of Employment of {} in {} by Occupation'.format(occupation_title, state),
-                                font = dict(size = 18)
-                                )                                                            
-                        )
+        fig6 = bars(
+            sel.occupation_histogram('employment_value'), "Total Employment",
+            'Total # of Employment of {} in {} by Occupation'.format(occupation_title, state),
+            color = 'indianred', plot_bgcolor = "#ffe6e6",
+            )
     else:
-        fig6 = go.Figure()
-    
-        fig6.add_trace(go.Indicator(
-            number = {'font': {'size': 1}
-                    },
-            value = None
-            ))
-
-        fig6.update_layout(
-        template = {'data' : {'indicator': [{
-            'title': {'text': 'No Histogram', 'font':{'size': 80}}
-            }]
-        }})
+        fig6 = placeholder('No Histogram')
     return fig6
 
 # table function
-@app.callback(
-    Output('employment_table', 'figure'),
-    Input('state_list', 'value'),
-    Input('occupation_list', 'value')
-)
-def employment_table(state, occupation):
-
-    if len(occupation) > len('All Occupations'):
-        if ',' in occupation:
-            occupation_title = occupation.replace(',', '...?').replace(' and ', '...?')
-        else:
-            occupation_title = occupation.replace(' ', '...?')
-    else: 
-        occupation_title = occupation
-    if '...?' in occupation_title:
-        occupation_title = occupation_title.split('?')[0]
-    else: 
-        occupation_title = occupation
+def employment_table(sel):
+    state, occupation, occupation_title = sel.state, sel.occupation, sel.title
 
     if state == 'U.S.':
-        table = data[(data.AREA_TITLE.isin([x for x in state_list if x != 'U.S.'])) & (data.OCC_TITLE == occupation)].groupby(
-            'AREA_TITLE'
-        ).agg(
-            {'Total Employment':'sum'
-            }
-        ).sort_values('Total Employment', ascending = False).reset_index().rename(columns = {'AREA_TITLE': 'State'}).head()
-        fig7 = go.Figure(data=[go.Table(
-            header=dict(values=list(table.columns),
-                        fill_color='Salmon',
-                        align='left'),
-            cells=dict(values=[table.State, table['Total Employment']],
-                       fill_color='Pink',
-                       align='left',
-                       format = ["",","]
-                       ),
-            )
-        ])
-        fig7.update_layout(
-             title = dict(
-                        text='Top 5 States by Total # of Employment of {}'.format(occupation_title),
-                        font = dict(size = 18)
-                        )                  
+        fig7 = top_table(
+            sel.top_by_area('employment'), ['State', 'Total Employment'], 'Salmon', 'Pink', ",",
+            title_font('Top 5 States by Total # of Employment of {}'.format(occupation_title)),
             )
 
     elif occupation == 'All Occupations':
-        table = data[(data.AREA_TITLE == state) & (data.OCC_TITLE.isin([x for x in occupation_list if x != 'All Occupations']))].groupby(
-            'OCC_TITLE'
-        ).agg(
-            {'Total Employment':'sum'
-            }
-        ).sort_values('Total Employment', ascending = False).reset_index().rename(columns = {'OCC_TITLE': 'State'}).head()
-        fig7 = go.Figure(data=[go.Table(
-            header=dict(values=list(table.columns),
-                        fill_color='Salmon',
-                        align='left'),
-            cells=dict(values=[table.State, table['Total Employment']],
-                       fill_color='Pink',
-                       align='left',
-                        format = ["",","]
-                      )
+        fig7 = top_table(
+            sel.top_by_occupation('employment'), ['State', 'Total Employment'], 'Salmon', 'Pink', ",",
+            {'text': 'Top 5 Occupations by Total # of Employment of {}'.format(state)},
             )
-        ])
-        fig7.update_layout(
-            title={
-                'text': 'Top 5 Occupations by Total # of Employment of {}'.format(state)
-            })
         
     else:
-        fig7 = go.Figure()
-    
-        fig7.add_trace(go.Indicator(
-            number = {'font': {'size': 1}
-                    },
-            value = None
-            ))
-
-        fig7.update_layout(
-        template = {'data' : {'indicator': [{
-            'title': {'text': 'No Table', 'font':{'size': 80}}
-            }]
-        }})
+        fig7 = placeholder('No Table')
     return fig7
 
 
 
 # map function
-@app.callback(
-    Output('employment_map', 'figure'),
-    Input('state_list', 'value'),
-    Input('occupation_list', 'value')
-)
-def employment_map(state, occupation):
+def employment_map(sel):
+    state, occupation, occupation_title = sel.state, sel.occupation, sel.title
 
-    if len(occupation) > len('All Occupations'):
-        if ',' in occupation:
-            occupation_title = occupation.replace(',', '...?').replace(' and ', '...?')
-        else:
-            occupation_title = occupation.replace(' ', '...?')
-    else: 
-        occupation_title = occupation
-    if '...?' in occupation_title:
-        occupation_title = occupation_title.split('?')[0]
-    else: 
-        occupation_title = occupation
-
-    map_df = data[(data.AREA_TITLE.isin([x for x in state_list if x != 'US'])) & (data.OCC_TITLE == occupation)].groupby(
-                                'AREA_TITLE'
-                            ).agg(
-                                {'Total Employment':'sum',
-                                }
-                            ).reset_index().rename(columns = {'AREA_TITLE': 'State'})
-    map_df['state_code'] = [state_dict[i] for i in map_df['State']]
     if state == 'U.S.':
-        fig8 = px.choropleth(
-                            map_df,
-                            locations= 'state_code', 
-                            locationmode="USA-states", 
-                            scope="usa",
-                            color='Total Employment',
-                            color_continuous_scale="reds",
-                            )
-        fig8.update_layout(
-                     title = dict(
-                        text='Total # of Employment of {} in U.S.'.format(occupation_title),
-                        font = dict(size = 18)
-                        )                         
-                    )
+        fig8 = employment_choropleth(sel.map_values('employment'), 'Total # of Employment of {} in U.S.'.format(occupation_title))
     else:
-        fig8 = go.Figure()
-    
-        fig8.add_trace(go.Indicator(
-            number = {'font': {'size': 1}
-                    },
-            value = None
-            ))
-
-        fig8.update_layout(
-        template = {'data' : {'indicator': [{
-            'title': {'text': 'No Map', 'font':{'size': 80}}
-            }]
-        }})
+        fig8 = placeholder('No Map')
     return fig8
 
 
 
+# Growth Functions
+# change from the compared year in percent, for the cells that have rows in both years
+growth_choropleths = {
+    'income': Choropleth(map_codes, 'Annual Median Income Growth (%)', 'RdBu', midpoint = 0),
+    'employment': Choropleth(map_codes, 'Total Employment Growth (%)', 'RdBu', midpoint = 0),
+}
+growth_labels = {'income': 'Annual Median Income', 'employment': 'Total # of Employment'}
+
+
+def growth_table(sel, name, header_color, cell_color):
+    state, occupation, occupation_title = sel.state, sel.occupation, sel.title
+    if sel.growth is None:
+        return placeholder('No Comparison')
+    label = '{} Growth (%)'.format(growth_labels[name])
+    period = '{} to {}'.format(*sel.period)
+
+    if state == 'U.S.':
+        names, values = sel.growth_by_area(name)
+        columns = ['State', label]
+        title = 'Top 5 States by {} of {}, {}'.format(label, occupation_title, period)
+    elif occupation == 'All Occupations':
+        names, values = sel.growth_by_occupation(name)
+        columns = ['Occupation', label]
+        title = 'Top 5 Occupations by {} in {}, {}'.format(label, state, period)
+    else:
+        return placeholder('No Table')
+    # cells missing in the compared year are left out
+    values = values * 100
+    keep = ~np.isnan(values)
+    return top_table(top(names[keep], values[keep]), columns, header_color, cell_color, "+.1f", title_font(title))
+
+
+def growth_map(sel, name):
+    state, occupation, occupation_title = sel.state, sel.occupation, sel.title
+    if sel.growth is None:
+        return placeholder('No Comparison')
+    if state != 'U.S.':
+        return placeholder('No Map')
+    z = sel.growth_map(name) * 100
+    return growth_choropleths[name](z, '{} Growth of {} in U.S., {} to {}'.format(growth_labels[name], occupation_title, *sel.period))
+
+
+def salary_growth_table(sel):
+    return growth_table(sel, 'income', 'paleturquoise', 'lavender')
+
+def salary_growth_map(sel):
+    return growth_map(sel, 'income')
+
+def employment_growth_table(sel):
+    return growth_table(sel, 'employment', 'Salmon', 'Pink')
+
+def employment_growth_map(sel):
+    return growth_map(sel, 'employment')
+
+
+
+# occupations matching what is typed in the dropdown, the selected occupation stays an option.
+# the titles are searched in the selected year, a cleared search lists its largest occupations
+# again as the layout does
+def occupation_options(search_value, value, year = None):
+    dataset = years.get(default_year if year is None else year)
+    index = dataset.index
+    if search_value:
+        matches = index.search(search_value, limit = 50)
+    else:
+        matches = largest_occupations(dataset.agg)
+    if value in index.titles and value not in matches:
+        matches.append(value)
+    return [{'label': i, 'value': i} for i in matches]
+
+search_states = [State('occupation_list', 'value')]
+if multi_year:
+    search_states.append(State('year', 'value'))
+app.callback(Output('occupation_list', 'options'), Input('occupation_list', 'search_value'), search_states)(occupation_options)
+
+
+
+# figures of each tab, in the order of the outputs
+figures = {
+    'salary': [
+        ('salary_number', salary_number),
+        ('salary_histogram', salary_hist),
+        ('salary_table', salary_table),
+        ('salary_map', salary_map),
+    ],
+    'employment': [
+        ('employment_number', employment_number),
+        ('employment_histogram', employment_hist),
+        ('employment_table', employment_table),
+        ('employment_map', employment_map),
+    ],
+}
+if multi_year:
+    figures['growth'] = [
+        ('salary_growth_table', salary_growth_table),
+        ('salary_growth_map', salary_growth_map),
+        ('employment_growth_table', employment_growth_table),
+        ('employment_growth_map', employment_growth_map),
+    ]
+figure_ids = [i for tab in figures.values() for i, _ in tab]
+
+# RENDER_ACTIVE_TAB=1 renders only the four figures of the visible tab,
+# the other tab is rendered when it is selected
+render_active_tab = os.environ.get('RENDER_ACTIVE_TAB', '0') == '1'
+
+
+# cache of rendered figures keyed by (data version, state, occupation, figure id), with the
+# year and the compared year after the version for the other years and the growth figures
+# FIGURE_CACHE_ENTRIES / FIGURE_CACHE_BYTES bound the per-worker LRU (0 = no limit),
+# FIGURE_CACHE_DIR adds a directory shared by all the workers, bounded by FIGURE_CACHE_DIR_BYTES
+figure_store_bytes = int(os.environ.get('FIGURE_CACHE_DIR_BYTES', 256 * 2 ** 20))
+
+def figure_disk_store(version):
+    return DiskStore(os.environ['FIGURE_CACHE_DIR'], version, figure_store_bytes) if os.environ.get('FIGURE_CACHE_DIR') else None
+
+figure_cache = FigureCache(
+    max_entries = int(os.environ.get('FIGURE_CACHE_ENTRIES', 2048)),
+    max_bytes = int(os.environ.get('FIGURE_CACHE_BYTES', 0)),
+    store = figure_disk_store(data_version),
+)
+
+
+# metrics of this worker, served as text at /metrics
+registry = Registry('oews_')
+request_seconds = registry.histogram('request_seconds', 'time to answer a request', ['path'])
+response_bytes = registry.histogram('response_bytes', 'size of the responses', ['path'], BYTE_BUCKETS)
+callback_seconds = registry.histogram(
+    'callback_seconds',
+    'render callback time by phase: cache (lookups), data (slice of the aggregates), build (figures), '
+    'serialize (json encoding and the rest of the request), wait (for an identical request in flight)',
+    ['phase'])
+figure_seconds = registry.histogram('figure_build_seconds', 'time to build a figure', ['figure'])
+store_responses = registry.counter('store_responses_total', 'render requests answered from the pre-rendered figure store')
+registry.gauge('startup_seconds', 'time to start the app by phase', ['phase'],
+               collect = lambda: {(k,): v for k, v in startup_seconds.items()})
+registry.gauge('figure_cache', 'figure cache statistics', ['stat'],
+               collect = lambda: {(k,): v for k, v in figure_cache.stats().items()})
+registry.gauge('years', 'year datasets: available, resident, loads, evictions', ['stat'],
+               collect = lambda: {(k,): v for k, v in years.stats().items()})
+
+
+# single flight and superseded requests, see singleflight.py. SINGLE_FLIGHT=0 answers every render
+# request on its own, DROP_SUPERSEDED=0 renders the requests a later one of the same page replaced
+single_flight = os.environ.get('SINGLE_FLIGHT', '1') == '1'
+drop_superseded = os.environ.get('DROP_SUPERSEDED', '1') == '1'
+flights = SingleFlight()
+sessions = Sessions()
+render_shared = registry.counter('render_shared_total', 'render requests answered with the response of an identical request in flight')
+render_superseded = registry.counter(
+    'render_superseded_total',
+    'render requests dropped for a later request of the same page, by stage: queued (before the render), '
+    'running (between two figures)',
+    ['stage'])
+registry.gauge('single_flight', 'render requests in flight, run and shared, and the pages tracked', ['stat'],
+               collect = lambda: {(k,): v for k, v in dict(flights.stats(), sessions = len(sessions)).items()})
+
+
+# key of a figure in figure_cache: the figures of the default year are keyed by (version,
+# state, occupation, figure id), only the growth figures depend on the compared year. the
+# version is the one of the default year when the render started, so a render that was in
+# flight during a reload does not cache its figures under the new version
+def cache_key(version, state, occupation, figure_id, year, compare, tab):
+    if tab != 'growth':
+        compare = None
+    if year == default_year and compare is None:
+        return (version, state, occupation, figure_id)
+    return (version, year, compare, state, occupation, figure_id)
+
+
+# the figures of a render that are not in figure_cache, the render stops when it was abandoned
+def render_figures(version, state, occupation, tab, year, compare, timings, abandoned):
+    sel = selected = None
+    outputs = []
+    for name, tab_figures in figures.items():
+        for figure_id, figure in tab_figures:
+            if tab is not None and tab != name:
+                outputs.append(no_update)
+                continue
+            key = cache_key(version, state, occupation, figure_id, year, compare, name)
+            t = time.perf_counter()
+            fig = figure_cache.get(key)
+            timings['cache'] += time.perf_counter() - t
+            if fig is None:
+                if abandoned():
+                    raise Abandoned()
+                # the shared slice is only built when something has to be rendered
+                if not selected:
+                    t = time.perf_counter()
+                    sel, selected = select(state, occupation, year, compare), True
+                    timings['data'] += time.perf_counter() - t
+                if sel is None:
+                    # the location or the occupation is not in the year's workbook
+                    outputs.append(placeholder('No Data'))
+                    continue
+                t = time.perf_counter()
+                fig = figure(sel)
+                elapsed = time.perf_counter() - t
+                timings['build'] += elapsed
+                figure_seconds.observe(elapsed, figure = figure_id)
+                # the placeholders are shared, they would only take room in the cache
+                if encoded(fig) is None:
+                    fig = figure_cache.set(key, fig)
+            outputs.append(fig)
+    return outputs
+
+
+# (page, sequence) of a render request, sent by the request_pre hook of the page.
+# None for the requests of other clients, they are never dropped
+def request_session():
+    body = request.get_json(silent = True)
+    if not isinstance(body, dict):
+        return None
+    session, sequence = body.get('session'), body.get('sequence')
+    if not isinstance(session, str) or type(sequence) is not int:
+        return None
+    return (session, body.get('output')), sequence
+
+
+# one callback for all the figures: one request and one data pass per dropdown change.
+# a render replaced by a later request of its page answers with no update, unless other
+# requests wait for its response (see answer_render)
+def render(state, occupation, tab = None, year = None, compare = None):
+    start = time.perf_counter()
+    timings = {'cache': 0.0, 'data': 0.0, 'build': 0.0}
+    year = default_year if year is None else year
+    version = data_version
+    session = request_session() if drop_superseded and has_request_context() else None
+    if session is not None and not sessions.begin(*session):
+        render_superseded.inc(stage = 'queued')
+        g.superseded = True
+        raise PreventUpdate
+
+    def abandoned():
+        if session is None:
+            return False
+        flight = g.get('flight')
+        return (flight is None or flight.followers == 0) and sessions.superseded(*session)
+
+    try:
+        outputs = render_figures(version, state, occupation, tab, year, compare, timings, abandoned)
+    except Abandoned:
+        render_superseded.inc(stage = 'running')
+        g.superseded = True
+        raise PreventUpdate
+    finally:
+        for phase, seconds in timings.items():
+            callback_seconds.observe(seconds, phase = phase)
+    if has_request_context():
+        # the rest of the request is timed by record_request
+        g.callback_seconds = time.perf_counter() - start
+    return outputs
+
+
+render_inputs = [Input('state_list', 'value'), Input('occupation_list', 'value')]
+if render_active_tab:
+    render_inputs.append(Input('tabs', 'value'))
+if multi_year:
+    render_inputs += [Input('year', 'value'), Input('compare_year', 'value')]
+
+
+# the callback gets the values of render_inputs in order, render takes them by name
+render_names = {'state_list': 'state', 'occupation_list': 'occupation', 'tabs': 'tab', 'year': 'year', 'compare_year': 'compare'}
+render_arguments = [render_names[i.component_id] for i in render_inputs]
+
+def render_callback(*values):
+    return render(**dict(zip(render_arguments, values)))
+
+# skeletons of the figures and of the placeholders, filled in by assets/clientside.js
+def clientside_bundle():
+    detailed = select('U.S.', 'All Occupations')
+    empty = select('Alabama', occupation_list[1])
+    return build_bundle(
+        agg,
+        short_titles,
+        {i: plotly_json(figure(detailed)) for tab in figures.values() for i, figure in tab},
+        {
+            'histogram': plotly_json(salary_hist(empty)),
+            'table': plotly_json(salary_table(empty)),
+            'map': plotly_json(salary_map(empty)),
+            'data': plotly_json(placeholder('No Data')),
+        },
+        data_version,
+    )
+
+if clientside:
+    app.layout.children.append(dcc.Store(id = 'bundle', data = clientside_bundle()))
+    app.clientside_callback(
+        ClientsideFunction('oews', 'render'),
+        [Output(i, 'figure') for i in figure_ids],
+        render_inputs[:2],
+        [State('bundle', 'data')],
+    )
+else:
+    app.callback([Output(i, 'figure') for i in figure_ids], render_inputs)(render_callback)
+    # every page numbers its callback requests, so that the server can tell the ones a later
+    # request replaced (see render)
+    app.renderer = """var renderer = new DashRenderer({
+    request_pre: (function () {
+        var session = Math.random().toString(36).slice(2), sequence = 0;
+        return function (payload) {
+            payload.session = session;
+            payload.sequence = ++sequence;
+        };
+    })()
+});"""
+
+
+# pre-rendered figures written by prerender.py, FIGURE_STORE overrides the path.
+# when the store matches the workbook, the render callback is answered with the stored json
+figure_store = open_store(os.environ.get('FIGURE_STORE', store_path('OEWS_2021_Data.xlsx')), data_version)
+render_path = app.config.routes_pathname_prefix + '_dash-update-component'
+render_output = '..' + '...'.join('{}.figure'.format(i) for i in figure_ids) + '..'
+
+
+# request timing, registered before render_from_store so that stored responses are timed too.
+# with PROFILE_REQUESTS=1, a request sent with the header `X-Profile: 1` is run under cProfile
+# and answered with the profile summary instead of its response
+profile_requests = os.environ.get('PROFILE_REQUESTS', '0') == '1'
+
+
+@server.before_request
+def start_request():
+    g.request_start = time.perf_counter()
+    if profile_requests and request.headers.get('X-Profile') == '1':
+        g.profile = start_profile()
+
+
+@server.after_request
+def record_request(response):
+    elapsed = time.perf_counter() - g.request_start
+    path = request.url_rule.rule if request.url_rule is not None else 'other'
+    request_seconds.observe(elapsed, path = path)
+    if not response.direct_passthrough:
+        response_bytes.observe(response.calculate_content_length() or 0, path = path)
+    if 'callback_seconds' in g:
+        callback_seconds.observe(elapsed - g.callback_seconds, phase = 'serialize')
+    if 'profile' in g:
+        g.profile.disable()
+        return server.response_class(profile_summary(g.profile), mimetype = 'text/plain')
+    return response
+
+
+@server.route('/metrics')
+def metrics():
+    return server.response_class(registry.render(), mimetype = 'text/plain; version=0.0.4')
+
+
+# read-only data api, see api.py:
+#   /api/cell?area=&occupation=   /api/area?area=   /api/occupation?occupation=
+#   /api/top?area= or occupation=&metric=income|employment&n=5
+# with year= for the other years and format=json|csv|arrow (or an Accept header).
+# the etag of a response is strong and only changes with the dataset, gzipped bodies get their own
+api_bodies = BodyCache(int(os.environ.get('API_CACHE_ENTRIES', 256)))
+api_responses = registry.counter('api_responses_total', 'data api responses by status', ['status'])
+
+
+def api_response(body, status, content_type, headers):
+    api_responses.inc(status = status)
+    return server.response_class(body, status = status, content_type = content_type, headers = headers)
+
+
+@server.route('/api/<kind>')
+def data_api(kind):
+    try:
+        if kind not in QUERIES:
+            raise ApiError(404, 'unknown endpoint: {}'.format(kind))
+        format = negotiate(request.args.get('format'), request.headers.get('Accept', ''))
+        params = slice_parameters(request.args)
+        try:
+            year = int(request.args.get('year', default_year))
+        except ValueError:
+            raise ApiError(400, 'year must be an integer')
+        try:
+            dataset = years.get(year)
+        except KeyError:
+            raise ApiError(404, 'unknown year: {}'.format(year))
+
+        # the quality of gzip, 0 when it is refused (gzip;q=0) or not listed
+        gzipped = request.accept_encodings['gzip'] > 0
+        tag = etag(dataset.version, kind, params, format)
+        headers = {'Cache-Control': 'public, max-age=300', 'Vary': 'Accept, Accept-Encoding'}
+        # the gzipped body is another representation with its own etag, either one the client
+        # holds is still valid
+        for held in [tag, tag + '-gzip']:
+            if request.if_none_match.contains(held):
+                return api_response(b'', 304, None, dict(headers, ETag = '"{}"'.format(held)))
+
+        entry = api_bodies.get(tag)
+        if entry is None:
+            body = encode(QUERIES[kind](dataset.agg, dict(params)), format, {'version': dataset.version, 'year': year})
+            entry = api_bodies.set(tag, (body, compress(body)))
+        body, compressed = entry
+        if gzipped and compressed is not None:
+            body, tag = compressed, tag + '-gzip'
+            headers['Content-Encoding'] = 'gzip'
+        headers['ETag'] = '"{}"'.format(tag)
+        return api_response(body, 200, MEDIA_TYPES[format], headers)
+    except ApiError as e:
+        return api_response(json.dumps({'error': e.message}), e.status, 'application/json', {})
+
+
+# hot reload of the workbook, see hotreload.py.
+# DATA_WATCH_SECONDS (default 0, off) polls the workbook in every worker. with RELOAD_TOKEN set,
+# POST /admin/reload (header `Authorization: Bearer <token>`) reloads the worker that answers in
+# the background and touches the trigger file the other workers watch; ?wait=1 answers with the
+# report of the reload instead. GET /admin/reload returns the last report of the worker
+data_watch = float(os.environ.get('DATA_WATCH_SECONDS', 0))
+reload_token = os.environ.get('RELOAD_TOKEN')
+
+
+# whether a cached figure of the default year (state, occupation, figure id) changes with the
+# new aggregates. changed: the changed cells, None if the axes changed
+def figure_changed(old, new, changed):
+    if changed is None:
+        return lambda state, occupation, figure_id: True
+    occupations, areas = changed.any(axis = 0), changed.any(axis = 1)
+    ranges = {
+        'salary_number': old.income_range != new.income_range,
+        'employment_number': old.employment_range != new.employment_range,
+    }
+    def affected(state, occupation, figure_id):
+        a, o = new.area_index.get(state), new.occ_index.get(occupation)
+        if a is None or o is None:
+            return True
+        if figure_id in ranges:
+            return ranges[figure_id] or changed[a, o]
+        # by-state figures of the occupation, by-occupation figures of the state, the others
+        # are placeholders
+        if state == new.total_area:
+            return occupations[o]
+        if occupation == new.total_occupation:
+            return areas[a]
+        return False
+    return affected
+
+
+# swaps a new version of the workbook in. callbacks that started before the swap finish with the
+# old dataset; the cached figures that did not change are moved to the new version, the others
+# and every growth figure of the default year are dropped
+def reload_data():
+    global data, agg, data_version, occupation_list, short_titles
+    current = years.get(default_year)
+    version = source_hash(workbook)
+    if version == current.version:
+        return {'status': 'unchanged', 'version': version}
+    report = {'status': 'reloaded', 'version': version, 'previous_version': current.version}
+    report['rss_before'] = memory_report().get('rss', 0)
+
+    phase_start = time.perf_counter()
+    refresh_cache(workbook, version)
+    report['parse_seconds'] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
+    if query_backend == 'sqlite':
+        # the cached figures of the default year are dropped, the cells are not compared
+        new_data, new_agg, changed = None, query_database(workbook, version), None
+    else:
+        raw, new_agg = read_dataset(workbook, version)
+        new_data = compact(raw) if raw is not None else None
+        del raw
+        if new_agg is None:
+            new_agg = rebuild_aggregates(current.agg, new_data)
+        changed = changes(current.agg, new_agg)
+    if new_agg.occupations == current.agg.occupations:
+        index, titles = current.index, short_titles
+    else:
+        index, titles = OccupationIndex(new_agg.occupations), {o: short_title(o) for o in new_agg.occupations}
+    report['aggregate_seconds'] = time.perf_counter() - phase_start
+
+    # the dataset is swapped before the version, a render that reads the new version
+    # always selects from the new dataset
+    phase_start = time.perf_counter()
+    years.replace(Dataset(default_year, version, new_agg, index))
+    data, agg, occupation_list, short_titles = new_data, new_agg, new_agg.occupations, titles
+    data_version = version
+    affected = figure_changed(current.agg, new_agg, changed)
+    def move(key):
+        if key[0] == version:
+            return key
+        if key[0] != current.version:
+            return None
+        if len(key) == 4:
+            return None if affected(*key[1:]) else (version,) + key[1:]
+        return None if default_year in key[1:3] else (version,) + key[1:]
+    report['figures_kept'], report['figures_dropped'] = figure_cache.rekey(move)
+    if figure_cache.store is not None:
+        # the figures of the old version are deleted from the shared directory, the workers
+        # that have not reloaded yet miss it until they do
+        old_store, figure_cache.store = figure_cache.store, figure_disk_store(version)
+        old_store.remove()
+    # the layout is served from app.layout on every page load
+    app.layout['state_list'].options = [{'label': i, 'value': i} for i in new_agg.areas]
+    app.layout['occupation_list'].options = [{'label': i, 'value': i} for i in largest_occupations(new_agg)]
+    if clientside:
+        app.layout['bundle'].data = clientside_bundle()
+    report['swap_seconds'] = time.perf_counter() - phase_start
+
+    report['changed_cells'] = int(changed.sum()) if changed is not None else len(new_agg.areas) * len(new_agg.occupations)
+    if query_backend == 'sqlite':
+        report['dataset_bytes'] = os.path.getsize(database_path(workbook))
+    else:
+        report['dataset_bytes'] = int(sum(a.nbytes for a in new_agg.to_arrays().values()))
+        if new_data is not None:
+            report['dataset_bytes'] += int(new_data.memory_usage(deep = True).sum())
+    report['rss_after'] = memory_report().get('rss', 0)
+    return report
+
+
+reloader = Reloader(workbook, reload_data)
+registry.gauge('reload', 'workbook reloads of this worker and the last one: seconds by phase, bytes, cells and figures', ['stat'],
+               collect = lambda: {(k,): v for k, v in reloader.stats().items()})
+
+
+# registered before render_from_store and answer_render, whose responses skip the hooks after
+# them: the workers that only answer render requests still poll the workbook
+@server.before_request
+def watch_data():
+    reloader.watch(data_watch)
+
+
+@server.route('/admin/reload', methods = ['GET', 'POST'])
+def admin_reload():
+    if not reload_token:
+        return server.response_class(status = 404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + reload_token):
+        return server.response_class(json.dumps({'error': 'forbidden'}), status = 403, mimetype = 'application/json')
+    if request.method == 'GET':
+        body, status = {'version': data_version, 'last': reloader.last, 'stats': reloader.stats()}, 200
+    else:
+        reloader.notify()
+        if request.args.get('wait') == '1':
+            report = reloader.run()
+            body, status = (report, 200) if report is not None else ({'status': 'running'}, 409)
+        else:
+            body, status = {'status': 'started' if reloader.start() else 'running'}, 202
+    return server.response_class(json.dumps(body), status = status, mimetype = 'application/json')
+
+
+@server.before_request
+def render_from_store():
+    # a reloaded workbook is not in the store until prerender.py runs again
+    if figure_store is None or clientside or request.path != render_path or figure_store.source_hash != data_version:
+        return None
+    body = request.get_json(silent = True)
+    if not isinstance(body, dict) or body.get('output') != render_output:
+        return None
+    values = {i.get('id'): i.get('value') for i in body.get('inputs', [])}
+    state, occupation = values.get('state_list'), values.get('occupation_list')
+    if not isinstance(state, str) or not isinstance(occupation, str):
+        return None
+    # the store only holds the default year
+    if values.get('year', default_year) != default_year or values.get('compare_year') is not None:
+        return None
+    parts = []
+    for name, tab_figures in figures.items():
+        if render_active_tab and values.get('tabs') != name:
+            continue
+        for figure_id, _ in tab_figures:
+            fig = figure_store.get(state, occupation, figure_id)
+            if fig is None:
+                # fall back to the callback
+                return None
+            parts.append(b'"' + figure_id.encode('utf-8') + b'":{"figure":' + fig + b'}')
+    store_responses.inc()
+    return server.response_class(b'{"multi":true,"response":{' + b','.join(parts) + b'}}', mimetype = 'application/json')
+
+
+# render requests are answered here rather than by dash: the figures are encoded with
+# figure_json as dash would, and the shared placeholders are sent as their pre-encoded bytes.
+# identical render requests in flight are answered once: the first one runs the callback and the
+# others get a copy of its response, encoding included. a response is not shared when the request
+# was dropped for a later one of its page, the requests waiting for it run their own. registered
+# last, a response returned here skips the hooks after it
+def render_response(inputs):
+    values = {i.get('id'): i.get('value') for i in inputs}
+    outputs = render_callback(*[values.get(i.component_id) for i in render_inputs])
+    parts = []
+    for figure_id, fig in zip(figure_ids, outputs):
+        if fig is no_update:
+            continue
+        text = encoded(fig)
+        if text is None:
+            text = figure_json(fig).encode('utf-8')
+        parts.append(b'"' + figure_id.encode('utf-8') + b'":{"figure":' + text + b'}')
+    if not parts:
+        raise PreventUpdate
+    return server.response_class(b'{"multi":true,"response":{' + b','.join(parts) + b'}}', mimetype = 'application/json')
+
+
+@server.before_request
+def answer_render():
+    if clientside or request.path != render_path:
+        return None
+    body = request.get_json(silent = True)
+    if not isinstance(body, dict) or body.get('output') != render_output:
+        return None
+    inputs = body.get('inputs')
+    if not isinstance(inputs, list) or not all(isinstance(i, dict) for i in inputs):
+        return None
+    if not single_flight:
+        return render_response(inputs)
+    start = time.perf_counter()
+    key = (data_version, json.dumps(inputs, sort_keys = True))
+
+    def call(flight):
+        g.flight = flight
+        try:
+            response = render_response(inputs)
+        except PreventUpdate:
+            if g.get('superseded'):
+                raise Abandoned()
+            raise
+        return response.get_data(), response.status_code, list(response.headers)
+
+    try:
+        (content, status, headers), shared = flights.do(key, call)
+    except Abandoned:
+        raise PreventUpdate
+    response = server.response_class(content, status = status, headers = headers)
+    if shared:
+        render_shared.inc()
+        callback_seconds.observe(time.perf_counter() - start, phase = 'wait')
+    return response
+
+
+startup_seconds['total'] = time.perf_counter() - startup_start
+
 
 if __name__ == '__main__':
         app.run_server(debug=False, port=8899)
@@ -0,0 +1,262 @@
+// clientside rendering mode (CLIENTSIDE=1, see clientside.py)
+// builds the eight figures in the browser from the aggregate bundle stored in the layout.
+// it mirrors the figure functions of app.py: same slices, same top 5 order, same histogram bins.
+window.dash_clientside = window.dash_clientside || {};
+window.dash_clientside.oews = (function () {
+    var loaded = null;
+
+    var TYPES = {float32: Float32Array, float64: Float64Array, uint8: Uint8Array, uint32: Uint32Array};
+    var MISSING = 4294967295;
+
+    function decode(array) {
+        var binary = atob(array.data.replace(/-/g, '+').replace(/_/g, '/'));
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new TYPES[array.dtype](bytes.buffer);
+    }
+
+    function load(bundle) {
+        if (loaded !== null && loaded.version === bundle.version) {
+            return loaded;
+        }
+        var nOcc = bundle.occupations.length;
+        var rows = decode(bundle.rows);
+        var raw = decode(bundle.employment_value);
+        var employmentValue = new Float64Array(raw.length);
+        var employment = new Float64Array(raw.length);
+        for (var i = 0; i < raw.length; i++) {
+            employmentValue[i] = raw[i] === MISSING ? NaN : raw[i];
+            employment[i] = raw[i] === MISSING ? 0 : raw[i] * rows[i];
+        }
+        bundle.employment_corrections.forEach(function (c) {
+            employment[c[0] * nOcc + c[1]] = c[2];
+        });
+        loaded = {
+            version: bundle.version,
+            bundle: bundle,
+            nOcc: nOcc,
+            rows: rows,
+            income: decode(bundle.income),
+            employment: employment,
+            employment_value: employmentValue,
+            areaIndex: indexOf(bundle.areas),
+            occIndex: indexOf(bundle.occupations),
+            totalOcc: bundle.occupations.indexOf(bundle.total_occupation)
+        };
+        return loaded;
+    }
+
+    function indexOf(names) {
+        var index = {};
+        names.forEach(function (name, i) { index[name] = i; });
+        return index;
+    }
+
+    function copy(figure) {
+        return JSON.parse(JSON.stringify(figure));
+    }
+
+    function withTemplate(d, figure) {
+        // the shared template, plus the indicator part kept by the gauges and placeholders
+        var template = copy(d.bundle.template);
+        if (figure.layout.template) {
+            template.data = template.data || {};
+            template.data.indicator = figure.layout.template.data.indicator;
+        }
+        figure.layout.template = template;
+        return figure;
+    }
+
+    function num(value) {
+        return isNaN(value) ? null : value;
+    }
+
+    // column slice: areas with rows for the occupation, the states only with excludeTotal
+    function byArea(d, matrix, o, excludeTotal) {
+        var names = [], values = [];
+        for (var a = 0; a < d.bundle.areas.length; a++) {
+            if (d.rows[a * d.nOcc + o] > 0 && (!excludeTotal || d.bundle.states[a])) {
+                names.push(a);
+                values.push(matrix[a * d.nOcc + o]);
+            }
+        }
+        return [names, values];
+    }
+
+    // row slice: detailed occupations with rows in the state
+    function byOccupation(d, matrix, a) {
+        var names = [], values = [];
+        for (var o = 0; o < d.nOcc; o++) {
+            if (d.rows[a * d.nOcc + o] > 0 && o !== d.totalOcc) {
+                names.push(o);
+                values.push(matrix[a * d.nOcc + o]);
+            }
+        }
+        return [names, values];
+    }
+
+    // largest n values, missing last, ties in reverse order (aggregates.top)
+    function top(slice, n) {
+        var valid = [], missing = [];
+        slice[1].forEach(function (v, i) { (isNaN(v) ? missing : valid).push(i); });
+        valid.sort(function (i, j) { return slice[1][i] - slice[1][j] || i - j; });
+        var order = valid.reverse().concat(missing).slice(0, n);
+        return [order.map(function (i) { return slice[0][i]; }), order.map(function (i) { return slice[1][i]; })];
+    }
+
+    // aggregates.nice_size / aggregates.histogram
+    function niceSize(size) {
+        var magnitude = Math.pow(10, Math.floor(Math.log10(size)));
+        var steps = [1, 2, 2.5, 5, 10];
+        for (var i = 0; i < steps.length; i++) {
+            if (steps[i] * magnitude >= size) {
+                return steps[i] * magnitude;
+            }
+        }
+    }
+
+    function histogram(values, weights, nbins) {
+        var v = [], w = [];
+        values.forEach(function (x, i) {
+            if (!isNaN(x) && weights[i] > 0) { v.push(x); w.push(weights[i]); }
+        });
+        if (!v.length) {
+            return [[], []];
+        }
+        var low = Math.min.apply(null, v), high = Math.max.apply(null, v);
+        var size = niceSize(high > low ? (high - low) / nbins : Math.max(Math.abs(high), 1) / 10);
+        var start = Math.floor(low / size) * size;
+        var edges = [];
+        for (var k = 0; k < Math.floor((high - start) / size) + 2; k++) {
+            edges.push(start + size * k);
+        }
+        var counts = edges.slice(1).map(function () { return 0; });
+        v.forEach(function (x, i) {
+            var b = Math.min(Math.floor((x - start) / size), counts.length - 1);
+            counts[b] += w[i];
+        });
+        return [edges, counts];
+    }
+
+    function areaHistogram(d, matrix, o) {
+        var values = [], weights = [];
+        for (var a = 0; a < d.bundle.areas.length; a++) {
+            if (d.bundle.states[a]) {
+                values.push(matrix[a * d.nOcc + o]);
+                weights.push(d.rows[a * d.nOcc + o]);
+            }
+        }
+        return histogram(values, weights, 30);
+    }
+
+    function occupationHistogram(d, matrix, a) {
+        var values = [], weights = [];
+        for (var o = 0; o < d.nOcc; o++) {
+            if (o !== d.totalOcc) {
+                values.push(matrix[a * d.nOcc + o]);
+                weights.push(d.rows[a * d.nOcc + o]);
+            }
+        }
+        return histogram(values, weights, 30);
+    }
+
+    function gauge(d, id, value, title) {
+        var fig = copy(d.bundle.skeletons[id]);
+        fig.data[0].value = isNaN(value) ? null : Math.trunc(value);
+        fig.layout.template.data.indicator[0].title.text = title;
+        return withTemplate(d, fig);
+    }
+
+    function histogramFigure(d, id, hist, title) {
+        var fig = copy(d.bundle.skeletons[id]);
+        var edges = hist[0];
+        fig.data[0].x = edges.slice(1).map(function (e, i) { return (edges[i] + e) / 2; });
+        fig.data[0].y = hist[1];
+        if (edges.length > 1) {
+            fig.data[0].width = edges[1] - edges[0];
+        } else {
+            delete fig.data[0].width;
+        }
+        fig.layout.title.text = title;
+        return withTemplate(d, fig);
+    }
+
+    function tableFigure(d, id, slice, names, title) {
+        var fig = copy(d.bundle.skeletons[id]);
+        var best = top(slice, 5);
+        fig.data[0].cells.values = [best[0].map(function (i) { return names[i]; }), best[1].map(num)];
+        fig.layout.title.text = title;
+        return withTemplate(d, fig);
+    }
+
+    // z vector of the map, the locations of the skeleton are every state in order
+    function mapValues(d, matrix, o) {
+        var z = [];
+        for (var a = 0; a < d.bundle.areas.length; a++) {
+            if (d.bundle.states[a]) {
+                z.push(d.rows[a * d.nOcc + o] > 0 ? num(matrix[a * d.nOcc + o]) : null);
+            }
+        }
+        return z;
+    }
+
+    function mapFigure(d, id, z, title) {
+        var fig = copy(d.bundle.skeletons[id]);
+        fig.data[0].z = z;
+        fig.layout.title.text = title;
+        return withTemplate(d, fig);
+    }
+
+    function placeholder(d, name) {
+        return withTemplate(d, copy(d.bundle.placeholders[name]));
+    }
+
+    function render(state, occupation, bundle) {
+        var d = load(bundle);
+        var a = d.areaIndex[state], o = d.occIndex[occupation];
+        if (a === undefined || o === undefined) {
+            // a cleared dropdown, as select() on the server
+            return [0, 1, 2, 3, 4, 5, 6, 7].map(function () { return placeholder(d, 'data'); });
+        }
+        var title = bundle.titles[o];
+        var us = state === bundle.total_area;
+        var all = occupation === bundle.total_occupation;
+        var areas = bundle.areas, occupations = bundle.occupations;
+
+        var salary = [
+            gauge(d, 'salary_number', d.income[a * d.nOcc + o], 'Annual Median Income of ' + title + ' in ' + state),
+            us ? histogramFigure(d, 'salary_histogram', areaHistogram(d, d.income, o), 'Annual Median Income of ' + title + ' in ' + state + ' by State')
+                : all ? histogramFigure(d, 'salary_histogram', occupationHistogram(d, d.income, a), 'Annual Median Income of ' + title + ' in ' + state + ' by Occupation')
+                : placeholder(d, 'histogram'),
+            us ? tableFigure(d, 'salary_table', byArea(d, d.income, o, true), areas, 'Top 5 States by Annual Median Income of ' + title)
+                : all ? tableFigure(d, 'salary_table', byOccupation(d, d.income, a), occupations, 'Top 5 Occupations by Annual Median Income of ' + state)
+                : placeholder(d, 'table'),
+            us ? mapFigure(d, 'salary_map', mapValues(d, d.income, o), 'Annual Median Income of ' + occupation + ' in U.S.')
+                : placeholder(d, 'map')
+        ];
+
+        var table;
+        if (us) {
+            table = tableFigure(d, 'employment_table', byArea(d, d.employment, o, true), areas, 'Top 5 States by Total # of Employment of ' + title);
+        } else if (all) {
+            table = tableFigure(d, 'employment_table', byOccupation(d, d.employment, a), occupations, '');
+            table.layout.title = {text: 'Top 5 Occupations by Total # of Employment of ' + state};
+        } else {
+            table = placeholder(d, 'table');
+        }
+        var employment = [
+            gauge(d, 'employment_number', d.employment[a * d.nOcc + o], 'Total # of Employment of ' + title + ' in ' + state),
+            us ? histogramFigure(d, 'employment_histogram', areaHistogram(d, d.employment_value, o), 'Total # of Employment of ' + title + ' in ' + state + ' by State')
+                : all ? histogramFigure(d, 'employment_histogram', occupationHistogram(d, d.employment_value, a), 'Total # of Employment of ' + title + ' in ' + state + ' by Occupation')
+                : placeholder(d, 'histogram'),
+            table,
+            us ? mapFigure(d, 'employment_map', mapValues(d, d.employment, o), 'Total # of Employment of ' + title + ' in U.S.')
+                : placeholder(d, 'map')
+        ];
+        return salary.concat(employment);
+    }
+
+    return {render: render};
+})();
@@ -0,0 +1,75 @@
+# table and histogram latency as the area axis grows, e.g. from the 52 state areas to the
+# hundreds of metropolitan areas of the MSA files. the extra areas are synthetic: copies of
+# the state rows under new titles with jittered values, ranked, binned and mapped as states so
+# the by-state table and histogram see every one of them. reports the median time of the
+# by-state table (sorting the slice vs the precomputed ranks), the by-occupation table and
+# the by-state histogram per callback, for 1x and 10x the areas.
+# usage: python benchmarks/bench_areas.py [factor ...]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pandas as pd
+
+import app
+from aggregates import Aggregates, top
+
+
+def with_metros(data, factor, seed=0):
+    # the state rows factor - 1 more times, as metropolitan areas
+    rng = np.random.default_rng(seed)
+    states = data[data['AREA_TITLE'] != 'U.S.']
+    parts = [data.assign(AREA_TITLE = data['AREA_TITLE'].astype(str))]
+    for i in range(1, factor):
+        part = states.assign(AREA_TITLE = states['AREA_TITLE'].astype(str) + ' Metro {}'.format(i))
+        for column in ['Annual Median Income', 'Total Employment']:
+            part[column] = np.round(part[column].to_numpy() * rng.uniform(0.5, 1.5, len(part)))
+        parts.append(part)
+    return pd.concat(parts, ignore_index = True)
+
+
+def median_us(func, calls):
+    times = []
+    for args in calls:
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1e6
+
+
+def run(factor, sample = 300, seed = 0):
+    data = with_metros(app.data, factor)
+    start = time.perf_counter()
+    # app.build_aggregates ranks only the real states, here every area but the total is one
+    area_list, occupation_list = app.aggregate_axes(data)
+    agg = Aggregates(data, area_list, occupation_list, states = [a for a in area_list if a != 'U.S.'])
+    build = time.perf_counter() - start
+    rng = np.random.default_rng(seed)
+    occupations = rng.choice(agg.occupations, sample)
+    areas = rng.choice(agg.areas, sample)
+    by_state = [(agg.select('U.S.', o),) for o in occupations]
+    by_occupation = [(agg.select(a, 'All Occupations'),) for a in areas]
+    return {
+        'areas': len(agg.areas),
+        'rows': len(data),
+        'build_s': build,
+        'select_us': median_us(lambda o: agg.select('U.S.', o), [(o,) for o in occupations]),
+        'state_table_sort_us': median_us(lambda sel: top(*sel.by_area(agg.income)), by_state),
+        'state_table_us': median_us(lambda sel: sel.top_by_area('income'), by_state),
+        'occupation_table_sort_us': median_us(lambda sel: top(*sel.by_occupation(agg.income)), by_occupation),
+        'occupation_table_us': median_us(lambda sel: sel.top_by_occupation('income'), by_occupation),
+        'state_histogram_us': median_us(lambda sel: sel.area_histogram('income'), by_state),
+    }
+
+
+if __name__ == '__main__':
+    factors = [int(f) for f in sys.argv[1:]] or [1, 10]
+    columns = ['areas', 'rows', 'build_s', 'select_us', 'state_table_sort_us', 'state_table_us',
+               'occupation_table_sort_us', 'occupation_table_us', 'state_histogram_us']
+    print(' '.join('{:>12}'.format(c[:12]) for c in columns))
+    for factor in factors:
+        result = run(factor)
+        print(' '.join('{:>12.2f}'.format(result[c]) if isinstance(result[c], float) else '{:>12}'.format(result[c]) for c in columns))
@@ -0,0 +1,175 @@
+# callback benchmark: calls the eight figure functions of app.py directly over a sample of the
+# (state, occupation) grid, or the full grid, and reports per function
+#   latency p50 / p95 / p99 (ms), memory allocated per call (tracemalloc peak, KiB),
+#   json size of the figure (bytes)
+# results are written as json; --baseline compares them with a stored run and exits with
+# status 1 when a function got slower (or its json larger) than --threshold times the
+# baseline. latencies within --min-delta ms of the baseline are taken as noise.
+# --backend picks the query backend of app.py (QUERY_BACKEND), e.g. a memory run saved with
+# --output compared with --backend sqlite --baseline.
+#
+# usage: python benchmarks/bench_callbacks.py [--full] [--sample N] [--repeat N] [--backend memory|sqlite]
+#                                             [--output results.json] [--baseline baseline.json]
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+# the backend has to be set before app.py is imported
+if '--backend' in sys.argv[:-1]:
+    os.environ['QUERY_BACKEND'] = sys.argv[sys.argv.index('--backend') + 1]
+
+import app
+from cache import figure_json
+
+
+def grid():
+    return [(s, o) for s in app.agg.areas for o in app.occupation_list]
+
+
+def sample(n, seed=0):
+    # every kind of selection: U.S. by occupation, states with all occupations, and
+    # detailed state/occupation pairs (the placeholders), in proportion to the grid
+    rng = random.Random(seed)
+    us = [('U.S.', o) for o in app.occupation_list]
+    states = [(s, 'All Occupations') for s in app.agg.areas if s != 'U.S.']
+    detailed = [(s, o) for s in app.agg.areas if s != 'U.S.' for o in app.occupation_list[1:]]
+    picked = [('U.S.', 'All Occupations')]
+    picked += rng.sample(us, min(len(us), max(1, n // 4)))
+    picked += rng.sample(states, min(len(states), max(1, n // 4)))
+    picked += rng.sample(detailed, max(1, n - len(picked)))
+    return picked
+
+
+def functions():
+    # select builds the slice shared by the eight figures of a callback, it is timed on its
+    # own and the figures are timed on a prebuilt selection
+    funcs = [('select', None)]
+    for tab in app.figures.values():
+        for _, figure in tab:
+            funcs.append((figure.__name__, figure))
+    return funcs
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) else 0.0
+
+
+def measure(combos, repeat):
+    results = {}
+    selections = {c: app.select(*c) for c in combos}
+    for name, figure in functions():
+        if figure is None:
+            call = app.select
+        else:
+            call = lambda s, o, figure=figure: figure(selections[(s, o)])
+        times = []
+        sizes = []
+        for state, occupation in combos:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                out = call(state, occupation)
+                times.append(time.perf_counter() - start)
+            if name != 'select':
+                sizes.append(len(figure_json(out)))
+
+        # allocations in a separate pass, tracemalloc slows every allocation down
+        allocations = []
+        tracemalloc.start()
+        for state, occupation in combos:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            call(state, occupation)
+            allocations.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+
+        times = np.array(times) * 1000
+        results[name] = {
+            'calls': len(times),
+            'p50_ms': percentile(times, 50),
+            'p95_ms': percentile(times, 95),
+            'p99_ms': percentile(times, 99),
+            'mean_ms': float(times.mean()),
+            'alloc_peak_kib': percentile(allocations, 50) / 1024,
+            'alloc_peak_max_kib': max(allocations) / 1024,
+            'json_bytes_mean': float(np.mean(sizes)) if sizes else 0.0,
+            'json_bytes_max': int(max(sizes)) if sizes else 0,
+        }
+    return results
+
+
+def compare(results, baseline, threshold, min_delta):
+    # functions whose p50, p95 or json size exceed threshold x the baseline
+    regressions = []
+    print('{:<20} {:>10} {:>10} {:>8} {:>10} {:>10} {:>8}'.format(
+        'function', 'base p50', 'p50', 'ratio', 'base p95', 'p95', 'ratio'))
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratios = {}
+        for key in ['p50_ms', 'p95_ms', 'json_bytes_mean']:
+            ratios[key] = result[key] / base[key] if base[key] else 1.0
+        print('{:<20} {:>10.3f} {:>10.3f} {:>8.2f} {:>10.3f} {:>10.3f} {:>8.2f}'.format(
+            name, base['p50_ms'], result['p50_ms'], ratios['p50_ms'], base['p95_ms'], result['p95_ms'], ratios['p95_ms']))
+        slower = any(ratios[key] > threshold and result[key] - base[key] > min_delta for key in ['p50_ms', 'p95_ms'])
+        if slower or ratios['json_bytes_mean'] > threshold:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'benchmark the figure callbacks of app.py')
+    parser.add_argument('--full', action = 'store_true', help = 'every state/occupation combination')
+    parser.add_argument('--sample', type = int, default = 400, help = 'combinations sampled otherwise')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--repeat', type = int, default = 3, help = 'timed calls per combination')
+    parser.add_argument('--output', default = None, help = 'write the results as json')
+    parser.add_argument('--baseline', default = None, help = 'results json of a previous run')
+    parser.add_argument('--threshold', type = float, default = 1.25, help = 'allowed slowdown vs the baseline')
+    parser.add_argument('--min-delta', type = float, default = 0.05, help = 'ms below which a slowdown is noise')
+    parser.add_argument('--backend', choices = ['memory', 'sqlite'], default = app.query_backend, help = 'query backend of app.py')
+    args = parser.parse_args()
+
+    combos = grid() if args.full else sample(args.sample, args.seed)
+    results = measure(combos, args.repeat)
+
+    print('{:<20} {:>8} {:>9} {:>9} {:>9} {:>11} {:>11}'.format(
+        'function', 'calls', 'p50 ms', 'p95 ms', 'p99 ms', 'alloc KiB', 'json bytes'))
+    for name, r in results.items():
+        print('{:<20} {:>8} {:>9.3f} {:>9.3f} {:>9.3f} {:>11.1f} {:>11.0f}'.format(
+            name, r['calls'], r['p50_ms'], r['p95_ms'], r['p99_ms'], r['alloc_peak_kib'], r['json_bytes_mean']))
+
+    run = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'data_version': app.data_version,
+            'backend': app.query_backend,
+            'combinations': len(combos),
+            'full': args.full,
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent = 2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold, args.min_delta)
+        if regressions:
+            print('slower than {}x the baseline: {}'.format(args.threshold, ', '.join(regressions)))
+            sys.exit(1)
@@ -0,0 +1,86 @@
+# figure factory: the plain dicts of figures.py vs the same figures built as go.Figure.
+# checks that plotly validates every dict to itself (the dicts are valid figures), then reports
+# build + serialize latency of the eight figures of a selection, the shared placeholders at the
+# size of their pre-encoded bytes, which the responses send as they are. that the dicts are the figures
+# the plotly code used to build is tested in tests/test_figures.py.
+# usage: python benchmarks/bench_figures.py [repeat]
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+
+import app
+from cache import figure_json, plotly_json
+from figures import encoded
+
+CASES = [('U.S.', 'All Occupations'), ('U.S.', 'Cashiers'), ('California', 'All Occupations'), ('Wyoming', 'Cashiers')]
+
+
+def normalize(text):
+    # same json up to number formatting, missing or empty values and typed array encoding
+    def walk(x):
+        if isinstance(x, dict) and set(x) == {'dtype', 'bdata'}:
+            return walk(np.frombuffer(base64.b64decode(x['bdata']), dtype=x['dtype']).tolist())
+        if isinstance(x, dict):
+            return {k: walk(v) for k, v in x.items() if v is not None and v != {}}
+        if isinstance(x, list):
+            return [walk(v) for v in x]
+        if isinstance(x, float):
+            return None if x != x else round(x, 6)
+        return x
+    return walk(json.loads(text))
+
+
+def validated_json(figure):
+    # what the figure functions used to return: go.Figure, serialized with the json encoder.
+    # placeholders become a dict first, go.Figure does not take them
+    return json.dumps(go.Figure(plotly_json(figure)), cls=PlotlyJSONEncoder)
+
+
+def check():
+    mismatches = 0
+    for state, occupation in CASES:
+        sel = app.select(state, occupation)
+        for tab in app.figures.values():
+            for figure_id, figure in tab:
+                raw = figure(sel)
+                if normalize(figure_json(raw)) != normalize(validated_json(raw)):
+                    mismatches += 1
+                    print('mismatch', state, occupation, figure_id)
+    return mismatches
+
+
+def size(serialize, figure):
+    # bytes of a figure in the response, placeholders are not serialized again
+    text = encoded(figure)
+    return len(text if text is not None else serialize(figure))
+
+
+def run(serialize, sel, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total = sum(size(serialize, figure(sel)) for tab in app.figures.values() for _, figure in tab)
+        times.append(time.perf_counter() - start)
+    return total, np.median(times) * 1000
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    mismatches = check()
+    print('figures matching go.Figure: {}'.format('all' if not mismatches else '{} mismatches'.format(mismatches)))
+    print('{:<36} {:>14} {:>10} {:>12} {:>10}'.format('case', 'go.Figure bytes', 'ms', 'dict bytes', 'ms'))
+    for state, occupation in CASES:
+        sel = app.select(state, occupation)
+        before = run(validated_json, sel, repeat)
+        after = run(figure_json, sel, repeat)
+        print('{:<36} {:>14} {:>10.2f} {:>12} {:>10.2f}'.format(
+            state + ' / ' + occupation, before[0], before[1], after[0], after[1]))
+    sys.exit(1 if mismatches else 0)
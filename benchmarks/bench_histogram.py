@@ -0,0 +1,51 @@
+# histograms: px.histogram over the rows of the slice (binned in the browser) vs bins computed
+# on the server. reports response bytes and build + serialize latency per figure.
+# usage: python benchmarks/bench_histogram.py [repeat]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+import app
+from cache import figure_json
+from figures import bars
+
+CASES = [('U.S.', 'All Occupations'), ('U.S.', 'Cashiers'), ('California', 'All Occupations'), ('Wyoming', 'All Occupations')]
+
+
+def rows_histogram(sel, name, label):
+    # the previous implementation: every row of the slice is sent to the browser
+    matrix = getattr(app.agg, name)
+    values = sel.area_rows(matrix) if sel.state == 'U.S.' else sel.occupation_rows(matrix)
+    return px.histogram(pd.DataFrame({label: values}), x=label, nbins=30)
+
+
+def server_histogram(sel, name, label):
+    hist = sel.area_histogram(name) if sel.state == 'U.S.' else sel.occupation_histogram(name)
+    return bars(hist, label, '')
+
+
+def run(build, sel, name, label, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = figure_json(build(sel, name, label))
+        times.append(time.perf_counter() - start)
+    return len(text), np.median(times) * 1000
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print('{:<36} {:<18} {:>12} {:>10} {:>12} {:>10}'.format('case', 'metric', 'rows bytes', 'rows ms', 'server bytes', 'server ms'))
+    for state, occupation in CASES:
+        sel = app.select(state, occupation)
+        for name, label in [('income', 'Annual Median Income'), ('employment_value', 'Total Employment')]:
+            before = run(rows_histogram, sel, name, label, repeat)
+            after = run(server_histogram, sel, name, label, repeat)
+            print('{:<36} {:<18} {:>12} {:>10.2f} {:>12} {:>10.2f}'.format(
+                state + ' / ' + occupation, name, before[0], before[1], after[0], after[1]))
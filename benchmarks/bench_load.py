@@ -0,0 +1,338 @@
+# http load test of `gunicorn app:server`
+# starts gunicorn locally with the given worker setup, then replays dropdown changes against
+# /_dash-update-component at increasing concurrency, the same requests the browser sends for
+# the eight figures. reports requests per second, latency percentiles and the memory of every
+# worker after each level. the client runs in separate processes on the same machine, so on a
+# small machine it competes with the workers for cpu. the cpu time the workers spent is
+# reported per answered request.
+# --burst N replays users scrolling through the occupation dropdown instead: every burst is N
+# requests for consecutive options, sent --gap ms apart without waiting, numbered like the
+# requests of a page. the latency is the one of the last request of a burst and the earlier ones
+# may be dropped (status 204). run it with and without --env SINGLE_FLIGHT=0 --env
+# DROP_SUPERSEDED=0 to measure the saving, and with --env FIGURE_CACHE_ENTRIES=1 to measure it on
+# renders rather than on cache hits.
+#
+# usage: python benchmarks/bench_load.py [--workers 3] [--threads 1] [--worker-class sync]
+#                                        [--concurrency 1,2,4,8,16] [--duration 10]
+#                                        [--burst N] [--gap 30] [--popular 0.5]
+#                                        [--env KEY=VALUE ...] [--output results.json]
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+from bench_memory import ROOT, children, smaps
+
+
+def wait_ready(proc, port, workers, timeout=180):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('gunicorn exited with status {}'.format(proc.returncode))
+        try:
+            status, _ = request(port, 'GET', '/')
+            if status == 200 and len(children(proc.pid)) >= workers:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError('gunicorn did not start in {}s'.format(timeout))
+
+
+def request(port, method, path, body=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def find_props(layout, component_id):
+    # props of a component from the layout json, as the browser gets them
+    if isinstance(layout, dict):
+        if layout.get('props', {}).get('id') == component_id:
+            return layout['props']
+        for value in layout.values():
+            found = find_props(value, component_id)
+            if found is not None:
+                return found
+    elif isinstance(layout, list):
+        for value in layout:
+            found = find_props(value, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+def find_options(layout, component_id):
+    # dropdown options
+    return [o['value'] for o in find_props(layout, component_id)['options']]
+
+
+def search_occupations(port, callback, layout):
+    # the layout only lists a few occupations, the others are found by typing in the
+    # dropdown: every letter is sent to the search callback, its states (the selected
+    # occupation, and the year with several years of data) as the page loads
+    state = [{'id': s['id'], 'property': s['property'], 'value': (find_props(layout, s['id']) or {}).get(s['property'])}
+             for s in callback.get('state', [])]
+    occupations = []
+    for letter in 'abcdefghijklmnopqrstuvwxyz':
+        _, body = request(port, 'POST', '/_dash-update-component', json.dumps({
+            'output': callback['output'],
+            'outputs': {'id': 'occupation_list', 'property': 'options'},
+            'inputs': [{'id': 'occupation_list', 'property': 'search_value', 'value': letter}],
+            'state': state,
+            'changedPropIds': ['occupation_list.search_value'],
+        }).encode('utf-8'))
+        options = json.loads(body)['response']['occupation_list']['options']
+        occupations.extend(o['value'] for o in options if o['value'] not in occupations)
+    return occupations
+
+
+def dashboard(port, search=True):
+    # the render callback, its outputs, the options of the dropdowns and the values of its
+    # inputs when the page loads (the tab, and the years with several years of data)
+    _, layout = request(port, 'GET', '/_dash-layout')
+    _, dependencies = request(port, 'GET', '/_dash-dependencies')
+    layout = json.loads(layout)
+    dependencies = json.loads(dependencies)
+    callback = next(c for c in dependencies if 'figure' in c['output'])
+    callback['values'] = {i['id']: (find_props(layout, i['id']) or {}).get(i['property']) for i in callback['inputs']}
+    states = find_options(layout, 'state_list')
+    occupations = find_options(layout, 'occupation_list')
+    found = next((c for c in dependencies if c['output'] == 'occupation_list.options'), None)
+    if search and found is not None:
+        occupations += [o for o in search_occupations(port, found, layout) if o not in occupations]
+    return callback, states, occupations
+
+
+def render_body(callback, state, occupation, changed):
+    outputs = [{'id': i.split('.')[0], 'property': 'figure'} for i in callback['output'].strip('.').split('...')]
+    values = dict(callback['values'], state_list = state, occupation_list = occupation)
+    return {
+        'output': callback['output'],
+        'outputs': outputs,
+        'inputs': [{'id': i['id'], 'property': i['property'], 'value': values.get(i['id'])} for i in callback['inputs']],
+        'changedPropIds': [changed],
+        'state': [],
+    }
+
+
+def payloads(port, count, seed=0):
+    # dropdown changes of a user clicking through the dashboard: every request changes either
+    # the location or the occupation of the previous one
+    callback, states, occupations = dashboard(port)
+    rng = random.Random(seed)
+    state, occupation = 'U.S.', 'All Occupations'
+    bodies = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            state, changed = rng.choice(states), 'state_list.value'
+        else:
+            occupation, changed = rng.choice(occupations), 'occupation_list.value'
+        bodies.append(json.dumps(render_body(callback, state, occupation, changed)).encode('utf-8'))
+    return bodies
+
+
+def bursts(port, count, length, popular, seed=0):
+    # users scrolling through the occupation dropdown as the layout lists it: a share of them
+    # (popular) from the top of the list in the U.S., the others from a random option of a
+    # random state. the page id is set when a burst is sent
+    callback, states, occupations = dashboard(port, search = False)
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        if rng.random() < popular:
+            state, first = 'U.S.', 0
+        else:
+            state, first = rng.choice(states), rng.randrange(len(occupations))
+        burst = []
+        for i in range(length):
+            body = render_body(callback, state, occupations[(first + i) % len(occupations)], 'occupation_list.value')
+            body['sequence'] = i + 1
+            burst.append(body)
+        result.append(burst)
+    return result
+
+
+def client(args):
+    # one simulated user: sends its requests back to back until the deadline
+    port, bodies, deadline = args
+    latencies, errors, sent = [], 0, 0
+    while time.time() < deadline:
+        body = bodies[sent % len(bodies)]
+        sent += 1
+        start = time.perf_counter()
+        try:
+            status, _ = request(port, 'POST', '/_dash-update-component', body)
+        except OSError:
+            status = None
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+    return latencies, errors
+
+
+def burst_client(args):
+    # one simulated user scrolling: sends the requests of a burst gap seconds apart, each on its
+    # own connection like the browser, then waits for all of them
+    port, bursts, gap, deadline = args
+    latencies, dropped, errors, sent = [], 0, 0, 0
+    while time.time() < deadline:
+        burst = bursts[sent % len(bursts)]
+        session = '{}-{}'.format(os.getpid(), sent)
+        sent += 1
+        results = [None] * len(burst)
+
+        def send(i, body):
+            start = time.perf_counter()
+            try:
+                status, _ = request(port, 'POST', '/_dash-update-component', json.dumps(dict(body, session = session)).encode('utf-8'))
+            except OSError:
+                status = None
+            results[i] = (status, time.perf_counter() - start)
+
+        threads = []
+        for i, body in enumerate(burst):
+            thread = threading.Thread(target = send, args = (i, body))
+            thread.start()
+            threads.append(thread)
+            time.sleep(gap)
+        for thread in threads:
+            thread.join()
+        for status, _ in results[:-1]:
+            if status == 204:
+                dropped += 1
+            elif status != 200:
+                errors += 1
+        # the user waits for the figures of the last option only
+        status, elapsed = results[-1]
+        if status == 200:
+            latencies.append(elapsed)
+        else:
+            errors += 1
+    return latencies, errors, dropped
+
+
+def run_level(port, bodies, concurrency, duration, gap=None):
+    # bodies are bursts when gap is set
+    deadline = time.time() + duration
+    if gap is None:
+        chunks = [(port, bodies[i::concurrency], deadline) for i in range(concurrency)]
+    else:
+        chunks = [(port, bodies[i::concurrency], gap, deadline) for i in range(concurrency)]
+    start = time.time()
+    with multiprocessing.Pool(concurrency) as pool:
+        results = pool.map(client if gap is None else burst_client, chunks)
+    elapsed = time.time() - start
+    latencies = np.array([t for r in results for t in r[0]]) * 1000
+    errors = sum(r[1] for r in results)
+    level = {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+        'p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else None,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+    }
+    if gap is not None:
+        # requests counts the bursts, dropped the requests answered with no update
+        level['dropped'] = sum(r[2] for r in results)
+    return level
+
+
+def worker_cpu(pid):
+    # user + system seconds of the workers
+    seconds = 0.0
+    for worker in children(pid):
+        try:
+            with open('/proc/{}/stat'.format(worker)) as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        seconds += (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return seconds
+
+
+def worker_memory(pid):
+    memory = []
+    for worker in children(pid):
+        try:
+            report = smaps(worker)
+        except OSError:
+            continue
+        memory.append({'pid': worker, 'rss_mb': report.get('rss', 0) / 2 ** 20, 'pss_mb': report.get('pss', 0) / 2 ** 20})
+    return memory
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'load test /_dash-update-component under gunicorn')
+    parser.add_argument('--workers', type = int, default = 3)
+    parser.add_argument('--threads', type = int, default = 1)
+    parser.add_argument('--worker-class', default = 'sync')
+    parser.add_argument('--concurrency', default = '1,2,4,8,16', help = 'comma separated client counts')
+    parser.add_argument('--duration', type = float, default = 10, help = 'seconds per concurrency level')
+    parser.add_argument('--requests', type = int, default = 5000, help = 'distinct dropdown changes replayed')
+    parser.add_argument('--warmup', type = float, default = 2, help = 'seconds of load before measuring')
+    parser.add_argument('--port', type = int, default = 8960)
+    parser.add_argument('--burst', type = int, default = 0, help = 'requests per burst of dropdown scrolling, 0 for single changes')
+    parser.add_argument('--gap', type = float, default = 30, help = 'ms between the requests of a burst')
+    parser.add_argument('--popular', type = float, default = 0.5, help = 'share of the bursts scrolling the same options')
+    parser.add_argument('--env', action = 'append', default = [], help = 'KEY=VALUE for the app, e.g. SHARED_DATA=1')
+    parser.add_argument('--output', default = None, help = 'write the results as json')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update(item.split('=', 1) for item in args.env)
+    command = [
+        'gunicorn', 'app:server',
+        '--workers', str(args.workers),
+        '--threads', str(args.threads),
+        '--worker-class', args.worker_class,
+        '--bind', '127.0.0.1:{}'.format(args.port),
+    ]
+    proc = subprocess.Popen(command, cwd = ROOT, env = env, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    levels = []
+    try:
+        wait_ready(proc, args.port, args.workers)
+        gap = args.gap / 1000 if args.burst else None
+        if args.burst:
+            bodies = bursts(args.port, args.requests // args.burst, args.burst, args.popular)
+        else:
+            bodies = payloads(args.port, args.requests)
+        if args.warmup:
+            run_level(args.port, bodies, 1, args.warmup, gap)
+        unit = 'bursts' if args.burst else 'requests'
+        print('{:>11} {:>9} {:>7} {:>8} {:>9} {:>9} {:>9} {:>9} {:>11} {:>15}'.format(
+            'concurrency', unit, 'errors', 'dropped', 'per s', 'p50 ms', 'p95 ms', 'p99 ms', 'cpu ms/' + unit[:-1], 'rss MB/worker'))
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            cpu = worker_cpu(proc.pid)
+            level = run_level(args.port, bodies, concurrency, args.duration, gap)
+            level['cpu_seconds'] = worker_cpu(proc.pid) - cpu
+            level['workers'] = worker_memory(proc.pid)
+            levels.append(level)
+            rss = [w['rss_mb'] for w in level['workers']]
+            print('{:>11} {:>9} {:>7} {:>8} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>11.2f} {:>15}'.format(
+                concurrency, level['requests'], level['errors'], level.get('dropped', '-'), level['rps'],
+                level['p50_ms'] or 0, level['p95_ms'] or 0, level['p99_ms'] or 0,
+                level['cpu_seconds'] * 1000 / max(level['requests'], 1),
+                ' '.join('{:.0f}'.format(r) for r in rss)))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'command': command, 'env': args.env, 'duration': args.duration, 'burst': args.burst, 'levels': levels}, f, indent = 2)
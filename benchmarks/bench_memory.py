@@ -0,0 +1,61 @@
+# per-worker memory of `gunicorn app:server`, with and without preloading the app in the master
+# and with and without SHARED_DATA. preloading alone shares every page the workers inherit and
+# do not write to (copy-on-write after fork); SHARED_DATA maps the aggregates from a file. the
+# 2x2 runs tell the two apart
+# usage: python benchmarks/bench_memory.py [workers]
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def smaps(pid):
+    report = {}
+    with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                report[parts[0].rstrip(':').lower()] = int(parts[1]) * 1024
+    return report
+
+
+def children(pid):
+    with open('/proc/{}/task/{}/children'.format(pid, pid)) as f:
+        return [int(p) for p in f.read().split()]
+
+
+def measure(workers, shared, preload, port=8950):
+    # PRELOAD overrides the preloading gunicorn.conf.py picks from SHARED_DATA
+    env = dict(os.environ, SHARED_DATA = '1' if shared else '0', PRELOAD = '1' if preload else '0')
+    proc = subprocess.Popen(
+        ['gunicorn', 'app:server', '--workers', str(workers), '--bind', '127.0.0.1:{}'.format(port)],
+        cwd = ROOT, env = env, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            try:
+                urllib.request.urlopen('http://127.0.0.1:{}/'.format(port), timeout = 5).read()
+                if len(children(proc.pid)) >= workers:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.5)
+        time.sleep(2)
+        reports = [smaps(pid) for pid in children(proc.pid)]
+    finally:
+        proc.terminate()
+        proc.wait()
+    return reports
+
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for preload in [False, True]:
+        for shared in [False, True]:
+            reports = measure(workers, shared, preload)
+            mb = lambda key: sum(r.get(key, 0) for r in reports) / len(reports) / 2 ** 20
+            print('preload={}  SHARED_DATA={}  workers={}  rss {:6.1f} MB  pss {:6.1f} MB  private {:6.1f} MB per worker'.format(
+                int(preload), int(shared), len(reports), mb('rss'), mb('pss'), mb('private_dirty') + mb('private_clean')))
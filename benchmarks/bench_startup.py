@@ -0,0 +1,37 @@
+# startup benchmark: parsing the workbook vs reading the .npz cache
+# usage: python benchmarks/bench_startup.py [repeat]
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import loader
+
+
+def timeit(f, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', loader.SOURCE)
+
+    excel, quality = loader.read_workbook(path)
+    loader.write_cache(excel, quality, loader.cache_path(path), loader.source_hash(path))
+    cached = loader.load_data(path)
+    # the workbook is read with categorical titles, the cache expands them back to strings
+    pd.testing.assert_frame_equal(loader.data_frame(loader.data_arrays(excel)), cached, check_dtype=False)
+
+    t_excel = timeit(lambda: loader.read_workbook(path), min(repeat, 2))
+    t_cache = timeit(lambda: loader.load_data(path), repeat)
+    print('read_workbook   {:8.1f} ms'.format(t_excel * 1000))
+    print('load_data (npz) {:8.1f} ms'.format(t_cache * 1000))
+    print('speedup         {:8.1f}x'.format(t_excel / t_cache))
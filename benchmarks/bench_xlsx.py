@@ -0,0 +1,95 @@
+# peak memory / time of pd.read_excel vs the streaming reader on growing workbooks
+# the bundled rows are repeated into synthetic BLS-like workbooks with extra columns.
+# usage: python benchmarks/bench_xlsx.py [factor ...]   (default 1 4)
+import os
+import subprocess
+import sys
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import loader
+from xlsx import iter_rows
+
+# a few of the columns the full BLS files carry besides the ones the app reads
+EXTRA = ['NAICS', 'NAICS_TITLE', 'I_GROUP', 'OWN_CODE', 'H_MEAN', 'A_MEAN', 'MEAN_PRSE', 'H_PCT10', 'A_PCT10', 'A_PCT90']
+
+CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>'''
+ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="All May 2021 data" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>'''
+
+
+def cell(value):
+    if isinstance(value, (int, float)):
+        return '<c><v>{}</v></c>'.format(value)
+    return '<c t="inlineStr"><is><t>{}</t></is></c>'.format(escape(str(value)))
+
+
+def write_workbook(path, factor):
+    rows = list(iter_rows(os.path.join(ROOT, loader.SOURCE)))
+    header, body = rows[0], rows[1:]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', CONTENT_TYPES)
+        zf.writestr('_rels/.rels', ROOT_RELS)
+        zf.writestr('xl/workbook.xml', WORKBOOK)
+        zf.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            f.write(('<row>' + ''.join(cell(h) for h in EXTRA + header) + '</row>').encode('utf-8'))
+            for copy in range(factor):
+                for n, row in enumerate(body):
+                    extra = [n % 99, 'Cross-industry', 'cross-industry', copy, 25.5, 53040, 0.4, 11.2, 23300, 98500]
+                    f.write(('<row>' + ''.join(cell(v) for v in extra + row) + '</row>').encode('utf-8'))
+            f.write(b'</sheetData></worksheet>')
+    return factor * len(body)
+
+
+MEASURE = '''
+import resource, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+if {method!r} == 'read_excel':
+    import pandas as pd
+    data = pd.read_excel({path!r}, usecols=['AREA_TITLE', 'OCC_TITLE', 'A_MEDIAN', 'TOT_EMP'])
+else:
+    import loader
+    data, quality = loader.read_workbook({path!r})
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+
+def measure(method, path):
+    out = subprocess.check_output([sys.executable, '-c', MEASURE.format(root=ROOT, method=method, path=path)])
+    seconds, maxrss = out.split()
+    return float(seconds), int(maxrss) / 1024
+
+
+if __name__ == '__main__':
+    factors = [int(f) for f in sys.argv[1:]] or [1, 4]
+    with tempfile.TemporaryDirectory() as tmp:
+        for factor in factors:
+            path = os.path.join(tmp, 'oews_x{}.xlsx'.format(factor))
+            rows = write_workbook(path, factor)
+            for method in ['read_excel', 'streaming']:
+                seconds, peak = measure(method, path)
+                print('{:>9} rows  {:<10}  {:7.2f} s  peak rss {:7.1f} MB'.format(rows, method, seconds, peak))
@@ -0,0 +1,215 @@
+# figure cache
+# the dataset is static, so a (state, occupation, figure id) always renders the same figure.
+# rendered figures are kept in a bounded LRU cache in every worker and, optionally, in a
+# directory shared by all the gunicorn workers of a dyno.
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from plotly.io.json import to_json_plotly
+from plotly.utils import PlotlyJSONEncoder
+
+# orjson serializes the figures several times faster than json + PlotlyJSONEncoder.
+# dash picks it up as well for the callback responses when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def plotly_json(figure):
+    # plain dict of a figure, figures may be go.Figure objects or dicts already
+    if hasattr(figure, 'to_plotly_json'):
+        return figure.to_plotly_json()
+    return figure
+
+
+def figure_json(figure):
+    # plotly json of a figure, the same text dash sends to the browser
+    if orjson is not None:
+        return to_json_plotly(figure, engine='orjson')
+    return json.dumps(figure, cls=PlotlyJSONEncoder, separators=(',', ':'))
+
+
+class DiskStore:
+    # one json file per key under path/namespace, written atomically so that
+    # workers reading the directory never see a partial file. with max_bytes, the least
+    # recently used files are deleted when the directory grows past it
+
+    def __init__(self, path, namespace='', max_bytes=0):
+        self.path = os.path.join(path, namespace) if namespace else path
+        self.namespaced = bool(namespace)
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        # bytes written by this worker since the directory was last measured
+        self.written = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        if max_bytes:
+            self.prune()
+
+    def _file(self, key):
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, name + '.json')
+
+    def get(self, key):
+        file = self._file(key)
+        try:
+            with open(file, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            return None
+        if self.max_bytes:
+            # the modification time orders the files for prune()
+            try:
+                os.utime(file)
+            except OSError:
+                pass
+        return text
+
+    def set(self, key, text):
+        file = self._file(key)
+        tmp = '{}.{}.tmp'.format(file, os.getpid())
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, file)
+        except OSError:
+            # the shared store is best effort, the in-memory cache still works
+            return
+        if self.max_bytes:
+            with self.lock:
+                self.written += len(text)
+                # every worker writes to the directory, its size is measured again after
+                # 1/16 of max_bytes written by this one
+                if self.written * 16 >= self.max_bytes:
+                    self.prune()
+
+    def prune(self):
+        # deletes the least recently used files until the directory holds 90% of max_bytes,
+        # if it holds more than max_bytes. returns the bytes left
+        files = []
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.json'):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            pass
+        total = sum(size for _, size, _ in files)
+        if total > self.max_bytes:
+            for _, size, file in sorted(files):
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(file)
+                except OSError:
+                    # deleted by another worker
+                    pass
+                total -= size
+                self.evictions += 1
+        self.written = 0
+        return total
+
+    def remove(self):
+        # deletes the namespace directory, once no worker reads it any more
+        if self.namespaced:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+class FigureCache:
+
+    def __init__(self, max_entries=2048, max_bytes=None, store=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store = store
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.store_hits = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        if self.store is not None:
+            text = self.store.get(key)
+            if text is not None:
+                with self.lock:
+                    self.store_hits += 1
+                    self.hits += 1
+                figure = json.loads(text)
+                self._put(key, figure, len(text))
+                return figure
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, figure):
+        # figures are stored as plain dicts so that hits skip plotly's to_dict copy
+        figure = plotly_json(figure)
+        size = 0
+        if self.max_bytes or self.store is not None:
+            text = figure_json(figure)
+            size = len(text)
+            if self.store is not None:
+                self.store.set(key, text)
+        self._put(key, figure, size)
+        return figure
+
+    def _put(self, key, figure, size):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[key] = (figure, size)
+            self.bytes += size
+            # least recently used entries are dropped first
+            while self.entries and (
+                    (self.max_entries and len(self.entries) > self.max_entries)
+                    or (self.max_bytes and self.bytes > self.max_bytes)):
+                _, (_, dropped) = self.entries.popitem(last=False)
+                self.bytes -= dropped
+                self.evictions += 1
+
+    def rekey(self, move):
+        # moves every entry to the key move(key) returns, in the same lru order, and drops the
+        # entries it returns None for. returns the number of entries kept and dropped
+        with self.lock:
+            entries = OrderedDict()
+            for key, (figure, size) in self.entries.items():
+                new = move(key)
+                if new is None:
+                    self.bytes -= size
+                else:
+                    entries[new] = (figure, size)
+            dropped = len(self.entries) - len(entries)
+            self.entries = entries
+        return len(entries), dropped
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'store_hits': self.store_hits,
+                'store_evictions': self.store.evictions if self.store is not None else 0,
+                'hit_rate': self.hits / requests if requests else 0.0,
+            }
@@ -0,0 +1,67 @@
+# clientside rendering mode
+# the whole dashboard state (52 areas x ~1,150 occupations x 2 metrics) is shipped to the browser
+# once as a bundle of base64 typed arrays, and the eight figures are built by the clientside
+# callback in assets/clientside.js. dropdown changes then never reach the server.
+#
+# the figures are not re-described in javascript: the bundle carries skeletons, the figures
+# rendered by app.py for one selection, and the browser only swaps the values and titles in.
+import base64
+
+import numpy as np
+
+# employment is sent as uint32, this marks a missing value
+MISSING = np.iinfo(np.uint32).max
+
+
+def encode(array, dtype):
+    # little endian typed array, as the browser reads it. url-safe base64: the plotly json
+    # encoder escapes every '/' into six characters
+    array = np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': np.dtype(dtype).name, 'data': base64.urlsafe_b64encode(array.tobytes()).decode('ascii')}
+
+
+def strip_template(figure):
+    # the plotly template is the bulk of every figure, it is sent once for the whole bundle.
+    # the gauges and placeholders keep their indicator part, which holds their title
+    figure = dict(figure, layout=dict(figure['layout']))
+    template = figure['layout'].pop('template', None) or {}
+    indicator = template.get('data', {}).get('indicator')
+    if indicator is not None:
+        figure['layout']['template'] = {'data': {'indicator': indicator}}
+    return figure, template
+
+
+def build_bundle(agg, titles, skeletons, placeholders, version):
+    # agg: the Aggregates, titles: occupation -> short title,
+    # skeletons / placeholders: figure id / placeholder name -> plotly json of a rendered figure
+    template = None
+    stripped = {}
+    for name, figure in list(skeletons.items()) + list(placeholders.items()):
+        stripped[name], figure_template = strip_template(figure)
+        if template is None and 'indicator' not in figure_template.get('data', {}):
+            template = figure_template
+
+    employment_value = np.where(np.isnan(agg.employment_value), MISSING, agg.employment_value)
+    # total employment is the row value times the rows of the cell, except where duplicated
+    # rows carry different values; those few cells are sent as corrections
+    derived = np.where(np.isnan(agg.employment_value), 0, agg.employment_value * agg.rows)
+    corrections = [[int(a), int(o), float(agg.employment[a, o])] for a, o in np.argwhere(derived != agg.employment)]
+    rows_dtype = 'uint8' if agg.rows.max() <= np.iinfo(np.uint8).max else 'uint32'
+
+    return {
+        'version': version,
+        'areas': agg.areas,
+        'occupations': agg.occupations,
+        'titles': [titles[o] for o in agg.occupations],
+        'total_area': agg.total_area,
+        'total_occupation': agg.total_occupation,
+        # 1 for the state-level areas (maps, by-state tables and histograms)
+        'states': agg.state_mask.astype(int).tolist(),
+        'income': encode(agg.income, 'float32'),
+        'employment_value': encode(employment_value, 'uint32'),
+        'employment_corrections': corrections,
+        'rows': encode(agg.rows, rows_dtype),
+        'template': template,
+        'skeletons': {name: stripped[name] for name in skeletons},
+        'placeholders': {name: stripped[name] for name in placeholders},
+    }
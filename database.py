@@ -0,0 +1,262 @@
+# sqlite query backend
+# the aggregates in an indexed sqlite file next to the workbook (OEWS_2021_Data.sqlite) instead of
+# dense matrices in every worker. only the titles of the axes and the gauge ranges are kept in
+# memory, the cells of a selection are read with a few queries on the (area, occupation) and
+# (occupation, area) indexes. sqlite maps the file, so its pages are kept once in the page cache
+# for all the workers of a dyno. each thread of a worker has its own connection, and the
+# connection keeps the compiled statements of the queries below.
+# Database and DatabaseSelection implement the query interface of aggregates.py.
+import json
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+import numpy as np
+
+from aggregates import histogram
+
+SCHEMA = [
+    'CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)',
+    'CREATE TABLE areas (id INTEGER PRIMARY KEY, title TEXT NOT NULL, state INTEGER NOT NULL)',
+    'CREATE TABLE occupations (id INTEGER PRIMARY KEY, title TEXT NOT NULL)',
+    # only the cells with rows, the matrices have NaN / 0 for the others. state and detail are
+    # the area and occupation levels, so that the slices are read without a join
+    'CREATE TABLE cells ('
+    ' area INTEGER NOT NULL, occupation INTEGER NOT NULL, state INTEGER NOT NULL, detail INTEGER NOT NULL,'
+    ' income REAL, employment REAL NOT NULL, employment_value REAL, rows INTEGER NOT NULL,'
+    ' PRIMARY KEY (area, occupation)) WITHOUT ROWID',
+    'CREATE INDEX cells_occupation ON cells (occupation, area)',
+]
+METRICS = ['income', 'employment', 'employment_value']
+# value of a cell without rows
+MISSING = {'income': np.nan, 'employment': 0.0, 'employment_value': np.nan}
+
+COLUMNS = 'area, occupation, income, employment, rows'
+CELL = 'SELECT ' + COLUMNS + ' FROM cells WHERE area = ? AND occupation = ?'
+AREA_CELLS = 'SELECT ' + COLUMNS + ' FROM cells WHERE area = ? AND detail = 1 ORDER BY occupation'
+OCCUPATION_CELLS = 'SELECT ' + COLUMNS + ' FROM cells WHERE occupation = ? ORDER BY area'
+# the order of aggregates.top: largest values first with ties in reverse order of position,
+# then the missing values in order of position
+TOP = 'ORDER BY {0} IS NULL, {0} DESC, CASE WHEN {0} IS NULL THEN {1} ELSE -{1} END LIMIT ?'
+QUERIES = {
+    name: {
+        'value': 'SELECT {} FROM cells WHERE area = ? AND occupation = ?'.format(name),
+        'by_area': 'SELECT area, {}, rows FROM cells WHERE occupation = ? AND state = 1 ORDER BY area'.format(name),
+        'by_occupation': 'SELECT occupation, {}, rows FROM cells WHERE area = ? AND detail = 1 ORDER BY occupation'.format(name),
+        'top_areas': 'SELECT ' + COLUMNS + ' FROM cells WHERE occupation = ? AND state = 1 ' + TOP.format(name, 'area'),
+        'top_occupations': 'SELECT ' + COLUMNS + ' FROM cells WHERE area = ? AND detail = 1 ' + TOP.format(name, 'occupation'),
+    }
+    for name in METRICS
+}
+
+
+def database_path(path):
+    return os.path.splitext(path)[0] + '.sqlite'
+
+
+def nullable(values):
+    # NaN as NULL
+    return [None if v != v else v for v in values.tolist()]
+
+
+def write_database(path, agg, version):
+    # the file is written next to its final path and moved in place, so that workers
+    # opening it meanwhile keep the old one
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    connection = sqlite3.connect(tmp)
+    with connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+        meta = {
+            'version': version,
+            'total_area': agg.total_area,
+            'total_occupation': agg.total_occupation,
+            'income_range': [float(v) for v in agg.income_range],
+            'employment_range': [float(v) for v in agg.employment_range],
+            'top_n': agg.top_n,
+        }
+        connection.executemany('INSERT INTO meta VALUES (?, ?)', [(k, json.dumps(v)) for k, v in meta.items()])
+        connection.executemany('INSERT INTO areas VALUES (?, ?, ?)', [
+            (i, a, int(s)) for i, (a, s) in enumerate(zip(agg.areas, agg.state_mask))])
+        connection.executemany('INSERT INTO occupations VALUES (?, ?)', list(enumerate(agg.occupations)))
+        a, o = np.nonzero(agg.rows > 0)
+        connection.executemany('INSERT INTO cells VALUES (?, ?, ?, ?, ?, ?, ?, ?)', zip(
+            a.tolist(), o.tolist(), agg.state_mask[a].astype(int).tolist(), agg.detail_mask[o].astype(int).tolist(),
+            nullable(agg.income[a, o]), agg.employment[a, o].tolist(), nullable(agg.employment_value[a, o]),
+            agg.rows[a, o].tolist()))
+    connection.close()
+    os.replace(tmp, path)
+
+
+def connect(path):
+    connection = sqlite3.connect('file:{}?mode=ro'.format(quote(os.path.abspath(path))), uri=True, check_same_thread=False)
+    connection.execute('PRAGMA mmap_size = 268435456')
+    return connection
+
+
+def open_database(path, version):
+    # the database of a workbook, None if it is missing or was built from another version
+    try:
+        connection = connect(path)
+        try:
+            row = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return None
+    if row is None or json.loads(row[0]) != version:
+        return None
+    return Database(path)
+
+
+class Database:
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        connection = connect(path)
+        try:
+            meta = {k: json.loads(v) for k, v in connection.execute('SELECT key, value FROM meta')}
+            areas = connection.execute('SELECT title, state FROM areas ORDER BY id').fetchall()
+            occupations = connection.execute('SELECT title FROM occupations ORDER BY id').fetchall()
+        finally:
+            # the connections are opened by the threads that query, after any fork
+            connection.close()
+        self.version = meta['version']
+        self.total_area = meta['total_area']
+        self.total_occupation = meta['total_occupation']
+        self.income_range = meta['income_range']
+        self.employment_range = meta['employment_range']
+        self.top_n = meta['top_n']
+        self.areas = [a for a, _ in areas]
+        self.occupations = [o for o, in occupations]
+        self.area_index = {a: i for i, a in enumerate(self.areas)}
+        self.occ_index = {o: i for i, o in enumerate(self.occupations)}
+        self.area_names = np.array(self.areas, dtype=object)
+        self.occ_names = np.array(self.occupations, dtype=object)
+        self.state_mask = np.array([bool(s) for _, s in areas])
+        self.detail_mask = self.occ_names != self.total_occupation
+        # position of every state in the maps
+        self.state_position = np.cumsum(self.state_mask) - 1
+
+    def connection(self):
+        # one connection per thread of this process
+        local = self.local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection, local.pid = connect(self.path), os.getpid()
+        return local.connection
+
+    def query(self, sql, *params):
+        return self.connection().execute(sql, params).fetchall()
+
+    def select(self, state, occupation, title=None, growth=None, period=None):
+        return DatabaseSelection(self, state, occupation, title, growth, period)
+
+    def slice(self, name, kind, position):
+        # (positions, values, rows) of the cells with rows of a by_area / by_occupation slice
+        rows = self.query(QUERIES[name][kind], int(position))
+        if not rows:
+            return np.array([], dtype=np.int64), np.array([]), np.array([], dtype=np.int64)
+        positions, values, counts = zip(*rows)
+        return np.array(positions, dtype=np.int64), np.array(values, dtype=float), np.array(counts, dtype=np.int64)
+
+    def _cells(self, rows):
+        columns = list(zip(*rows)) or [[]] * 5
+        return {
+            'area': np.array(columns[0], dtype=np.int64),
+            'occupation': np.array(columns[1], dtype=np.int64),
+            'income': np.array(columns[2], dtype=float),
+            'employment': np.array(columns[3], dtype=float),
+            'rows': np.array(columns[4], dtype=np.int64),
+        }
+
+    def cells(self, a=None, o=None):
+        # see Aggregates.cells
+        if a is not None and o is not None:
+            return self._cells(self.query(CELL, int(a), int(o)))
+        if a is not None:
+            return self._cells(self.query(AREA_CELLS, int(a)))
+        return self._cells(self.query(OCCUPATION_CELLS, int(o)))
+
+    def top_cells(self, name, n, a=None, o=None):
+        # see Aggregates.top_cells
+        if o is not None:
+            return self._cells(self.query(QUERIES[name]['top_areas'], int(o), n))
+        return self._cells(self.query(QUERIES[name]['top_occupations'], int(a), n))
+
+    def growth_from(self, old):
+        # the growth of a selection is read from the older database slice by slice
+        return old
+
+
+class DatabaseSelection:
+    # Selection on a Database
+
+    def __init__(self, db, state, occupation, title=None, growth=None, period=None):
+        self.agg = db
+        self.state = state
+        self.occupation = occupation
+        self.title = occupation if title is None else title
+        # the Database of the compared year
+        self.growth = growth
+        self.period = period
+        self.a = db.area_index[state]
+        self.o = db.occ_index[occupation]
+
+    def value(self, name):
+        rows = self.agg.query(QUERIES[name]['value'], self.a, self.o)
+        if not rows or rows[0][0] is None:
+            return MISSING[name]
+        return rows[0][0]
+
+    def area_histogram(self, name):
+        _, values, counts = self.agg.slice(name, 'by_area', self.o)
+        return histogram(values, counts)
+
+    def occupation_histogram(self, name):
+        _, values, counts = self.agg.slice(name, 'by_occupation', self.a)
+        return histogram(values, counts)
+
+    def top_by_area(self, name):
+        cells = self.agg.top_cells(name, self.agg.top_n, o=self.o)
+        return self.agg.area_names[cells['area']], cells[name]
+
+    def top_by_occupation(self, name):
+        cells = self.agg.top_cells(name, self.agg.top_n, a=self.a)
+        return self.agg.occ_names[cells['occupation']], cells[name]
+
+    def map_values(self, name):
+        areas, values, _ = self.agg.slice(name, 'by_area', self.o)
+        z = np.full(int(self.agg.state_mask.sum()), np.nan)
+        z[self.agg.state_position[areas]] = values
+        return z
+
+    def _growth(self, name, names, after, kind, position):
+        # after / before - 1 of the cells with rows in both years, by title
+        before = np.full(len(names), np.nan)
+        old = self.growth
+        if position is not None:
+            positions, values, _ = old.slice(name, kind, position)
+            titles = (old.area_names if kind == 'by_area' else old.occ_names)[positions]
+            lookup = dict(zip(titles, values))
+            before = np.array([lookup.get(i, np.nan) for i in names], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = after / before - 1
+        return np.where(before != 0, change, np.nan)
+
+    def growth_by_area(self, name):
+        areas, after, _ = self.agg.slice(name, 'by_area', self.o)
+        names = self.agg.area_names[areas]
+        return names, self._growth(name, names, after, 'by_area', self.growth.occ_index.get(self.occupation))
+
+    def growth_by_occupation(self, name):
+        occupations, after, _ = self.agg.slice(name, 'by_occupation', self.a)
+        names = self.agg.occ_names[occupations]
+        return names, self._growth(name, names, after, 'by_occupation', self.growth.area_index.get(self.state))
+
+    def growth_map(self, name):
+        names = self.agg.area_names[self.agg.state_mask]
+        return self._growth(name, names, self.map_values(name), 'by_area', self.growth.occ_index.get(self.occupation))
@@ -0,0 +1,161 @@
+# static-site export of the dashboard
+# the callbacks are deterministic, so the whole dashboard can be written out once and served by
+# any static file server. the export holds
+#   index.html                 the page of the app, with static/loader.js loaded first
+#   _dash-component-suites/    the dash and plotly scripts the page references, as served by dash
+#   data/layout.json           the layout, with every occupation in the dropdown (no search callback)
+#   data/dependencies.json     the render callback only
+#   data/template.json         the plotly template, shared by every figure
+#   data/placeholders.json     the 'No Histogram' / 'No Table' / ... figures
+#   data/figures/<area>/<occupation>.json
+#                              the figures of one selection without their template, placeholders
+#                              by name. the names are encodeURIComponent'ed into file names
+# static/loader.js answers the requests of the dash renderer from these files.
+#
+# only the default year is exported, with the figures rendered by the server.
+#
+# usage: python export.py [--output site] [--processes N] [--limit N] [--gzip]
+import argparse
+import gzip
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+LOADER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'loader.js')
+SCRIPT = re.compile(r'<(?:script|link)[^>]*(?:src|href)="(/[^"]+)"')
+
+
+def file_name(name):
+    # encodeURIComponent(name), the loader requests encodeURIComponent of this again
+    return quote(name, safe="!~*'()")
+
+
+def write(path, data, compress=False):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if compress:
+        # for servers that send precompressed files (nginx gzip_static)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, 9, mtime=0))
+    return len(data)
+
+
+def export_chunk(args):
+    # runs in the pool: writes the figure files of each combination
+    output, combinations, compress = args
+    import app
+    from cache import figure_json, plotly_json
+    from clientside import strip_template
+    from figures import placeholders
+
+    names = {id(figure): name for name, figure in placeholders.items()}
+    written = 0
+    for state, occupation in combinations:
+        sel = app.select(state, occupation)
+        response = {}
+        for tab_figures in app.figures.values():
+            for figure_id, figure in tab_figures:
+                fig = figure(sel)
+                if id(fig) in names:
+                    response[figure_id] = names[id(fig)]
+                else:
+                    response[figure_id] = strip_template(plotly_json(fig))[0]
+        path = os.path.join(output, 'data', 'figures', file_name(state), file_name(occupation) + '.json')
+        written += write(path, figure_json(response).encode('utf-8'), compress)
+    return len(combinations), written
+
+
+def page(dash_app, client, output, compress):
+    # index.html and every script / stylesheet of the app, fetched from the app itself: the ones
+    # of the page under their fingerprinted urls, and all the component files (the chunks loaded
+    # on demand, e.g. plotly.js for the graphs) under their plain paths
+    html = client.get('/').get_data(as_text=True)
+    urls = set(SCRIPT.findall(html))
+    for package, paths in dash_app.registered_paths.items():
+        prefix = dash_app.config.requests_pathname_prefix + '_dash-component-suites/' + package + '/'
+        urls.update(prefix + path for path in paths if not path.endswith('.map'))
+    written = 0
+    for url in sorted(urls):
+        response = client.get(url)
+        if response.status_code == 200:
+            written += write(os.path.join(output, url.split('?')[0].lstrip('/')), response.get_data(), compress)
+    # the loader has to patch fetch before the dash renderer starts
+    html = html.replace('<script', '<script src="/static/loader.js"></script>\n<script', 1)
+    written += write(os.path.join(output, 'index.html'), html.encode('utf-8'))
+    os.makedirs(os.path.join(output, 'static'), exist_ok=True)
+    shutil.copy(LOADER, os.path.join(output, 'static', 'loader.js'))
+    return written
+
+
+def layout(client, occupations):
+    # the layout as the browser gets it, with every occupation as an option since there is no
+    # server to search them
+    def patch(node):
+        if isinstance(node, dict):
+            props = node.get('props', {})
+            if props.get('id') == 'occupation_list':
+                props['options'] = [{'label': i, 'value': i} for i in occupations]
+            for value in node.values():
+                patch(value)
+        elif isinstance(node, list):
+            for value in node:
+                patch(value)
+    tree = json.loads(client.get('/_dash-layout').get_data())
+    patch(tree)
+    return tree
+
+
+def export(output, processes=None, limit=None, compress=False, chunk_size=256):
+    import app
+    from cache import figure_json, plotly_json
+    from clientside import strip_template
+    from figures import placeholders
+
+    start = time.perf_counter()
+    client = app.server.test_client()
+    written = page(app.app, client, output, compress)
+
+    dependencies = json.loads(client.get('/_dash-dependencies').get_data())
+    dependencies = [d for d in dependencies if d['output'] != 'occupation_list.options']
+    template = strip_template(plotly_json(app.salary_hist(app.select('U.S.', 'All Occupations'))))[1]
+    data = {
+        'layout.json': figure_json(layout(client, app.occupation_list)),
+        'dependencies.json': json.dumps(dependencies),
+        'template.json': figure_json(template),
+        'placeholders.json': figure_json({name: strip_template(plotly_json(f))[0] for name, f in placeholders.items()}),
+    }
+    for name, text in data.items():
+        written += write(os.path.join(output, 'data', name), text.encode('utf-8'), compress)
+
+    combinations = [(s, o) for s in app.agg.areas for o in app.occupation_list]
+    if limit:
+        combinations = combinations[:limit]
+    chunks = [(output, combinations[i:i + chunk_size], compress) for i in range(0, len(combinations), chunk_size)]
+    files = 0
+    with ProcessPoolExecutor(processes) as pool:
+        for count, size in pool.map(export_chunk, chunks):
+            files += count
+            written += size
+    return {
+        'combinations': len(combinations),
+        'figure_files': files,
+        'bytes': written,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'export the dashboard as static files')
+    parser.add_argument('--output', default = 'site')
+    parser.add_argument('--processes', type = int, default = None)
+    parser.add_argument('--limit', type = int, default = None, help = 'only export the first N combinations')
+    parser.add_argument('--gzip', action = 'store_true', help = 'also write a .gz of every file')
+    args = parser.parse_args()
+    # the export needs the render callback on the server side
+    os.environ['CLIENTSIDE'] = '0'
+    print(export(args.output, args.processes, args.limit, args.gzip))
@@ -0,0 +1,148 @@
+# figure factory
+# go.Figure validates every property when it is built and again when it is serialized, which
+# is most of a callback once the data access is cheap. the figures of the dashboard only come
+# in a few kinds, so they are written out here as the plain dicts plotly would produce, with
+# the default template built once. the dicts are serialized as they are by dash.
+import json
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from cache import figure_json
+
+# plotly json of the default template, shared by every figure
+template = go.Figure().to_plotly_json()['layout'].get('template', {})
+
+
+def title_font(text, size=18):
+    return {'text': text, 'font': {'size': size}}
+
+
+def indicator_template(text, size):
+    # the gauges carry their title in the template, as update_layout(template = ...) did
+    data = dict(template.get('data', {}), indicator=[{'title': title_font(text, size), 'type': 'indicator'}])
+    return dict(template, data=data)
+
+
+def gauge(value, title, axis_range, color, prefix=None, tickcolor=None):
+    number = {'font': {'color': color, 'size': 80}}
+    if prefix is not None:
+        number['prefix'] = prefix
+    axis = {'range': list(axis_range), 'tickwidth': 1}
+    if tickcolor is not None:
+        axis['tickcolor'] = tickcolor
+    trace = {
+        'domain': {'column': 1, 'row': 0},
+        'gauge': {'axis': axis, 'bar': {'color': color}},
+        'mode': 'gauge+number',
+        'number': number,
+        'type': 'indicator',
+    }
+    # an empty gauge has no value at all
+    if value is not None:
+        trace['value'] = value
+    return {'data': [trace], 'layout': {'template': indicator_template(title, 18)}}
+
+
+def placeholder_figure(text):
+    return {
+        'data': [{'number': {'font': {'size': 1}}, 'type': 'indicator'}],
+        'layout': {'template': indicator_template(text, 80)},
+    }
+
+
+class Placeholder:
+    # a shared placeholder figure, read-only: it only holds its encoded json. the render
+    # responses send the bytes as they are, plotly and dash get a fresh dict of it
+    __slots__ = ('json',)
+
+    def __init__(self, figure):
+        object.__setattr__(self, 'json', figure_json(figure).encode('utf-8'))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('placeholders are shared and read-only')
+
+    def to_plotly_json(self):
+        return json.loads(self.json)
+
+
+# the figures shown in place of a histogram, table or map that does not apply to the selection
+# (most selections). they are built and serialized once and shared by every response
+placeholders = {text: Placeholder(placeholder_figure(text)) for text in ['No Histogram', 'No Table', 'No Map', 'No Data', 'No Comparison']}
+
+
+def placeholder(text):
+    return placeholders[text]
+
+
+def encoded(figure):
+    # pre-encoded json of a shared placeholder, None for any other figure
+    return figure.json if isinstance(figure, Placeholder) else None
+
+
+def bars(hist, label, title, xaxis_title=None, color='#636efa', plot_bgcolor=None):
+    # histogram from bins computed on the server, one bar per bin
+    edges, counts = hist
+    trace = {
+        'hovertemplate': label + '=%{x}<br>count=%{y}<extra></extra>',
+        'marker': {'color': color},
+        'x': (edges[:-1] + edges[1:]) / 2,
+        'y': counts,
+        'type': 'bar',
+    }
+    # bins have the same width
+    if len(edges) > 1:
+        trace['width'] = float(edges[1] - edges[0])
+    layout = {
+        'template': template,
+        'xaxis': {'title': {'text': xaxis_title or label}},
+        'yaxis': {'title': {'text': 'count'}},
+        'bargap': 0,
+        'title': title_font(title),
+    }
+    if plot_bgcolor is not None:
+        layout['plot_bgcolor'] = plot_bgcolor
+    return {'data': [trace], 'layout': layout}
+
+
+def top_table(top, columns, header_color, cell_color, value_format, title):
+    # two column table of the top 5 (names, values), title is the layout title
+    names, values = top
+    return {
+        'data': [{
+            'cells': {
+                'align': 'left',
+                'fill': {'color': cell_color},
+                'format': ['', value_format],
+                'values': [list(names), values.tolist()],
+            },
+            'header': {'align': 'left', 'fill': {'color': header_color}, 'values': list(columns)},
+            'type': 'table',
+        }],
+        'layout': {'template': template, 'title': title},
+    }
+
+
+class Choropleth:
+    # map of the states, built once with plotly: the locations and the layout are fixed,
+    # a figure only fills in the z vector and the title
+
+    def __init__(self, codes, label, scale, midpoint=None):
+        self.skeleton = px.choropleth(
+            pd.DataFrame({'state_code': codes, label: np.zeros(len(codes))}),
+            locations='state_code',
+            locationmode='USA-states',
+            scope='usa',
+            color=label,
+            color_continuous_scale=scale,
+            color_continuous_midpoint=midpoint,
+        ).to_plotly_json()
+
+    def __call__(self, z, title):
+        # the skeleton is shared, not copied
+        return {
+            'data': [dict(self.skeleton['data'][0], z=z)],
+            'layout': dict(self.skeleton['layout'], title=title_font(title)),
+        }
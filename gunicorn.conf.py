@@ -0,0 +1,19 @@
+# gunicorn settings, read automatically by `gunicorn app:server`
+import gc
+import os
+
+# with SHARED_DATA=1 the app is imported once in the master and forked into the workers,
+# PRELOAD=0/1 overrides it either way
+preload_app = os.environ.get('PRELOAD', os.environ.get('SHARED_DATA', '0')) == '1'
+
+
+def pre_fork(server, worker):
+    # objects created while preloading are moved out of the garbage collector's reach,
+    # so collections in the workers don't write to (and un-share) their pages
+    if server.cfg.preload_app:
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    from shared import memory_report
+    worker.log.info('worker %s memory: %s', worker.pid, memory_report())
@@ -0,0 +1,142 @@
+# hot reload of the workbook
+# a new OEWS_2021_Data.xlsx is picked up without restarting the workers. each worker watches the
+# workbook and a trigger file (touched by the admin endpoint of app.py) and, when either changes,
+# builds the new dataset in a background thread and swaps it in. callbacks keep the dataset they
+# started with, so none of them waits for the reload.
+# the workbook is parsed once per dyno: the first worker to see the change rebuilds the .npz
+# cache in a child process, so the parsing does not hold the worker's GIL, and the other workers
+# wait for it on a file lock and read the cache.
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+from loader import cache_current, cache_path
+
+# file locks need fcntl, without it every worker may parse the workbook itself
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOADER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'loader.py')
+
+
+def trigger_path(path):
+    return os.path.splitext(path)[0] + '.reload'
+
+
+def signature(paths):
+    # (mtime, size) of each file, None if it is missing
+    result = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            result.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            result.append(None)
+    return tuple(result)
+
+
+class FileLock:
+    # exclusive lock on a file shared by the workers of a dyno
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.file = open(self.path, 'a')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+
+def refresh_cache(path, digest):
+    # makes the .npz of the workbook current, parsing it in a child process if it is stale
+    with FileLock(cache_path(path) + '.lock'):
+        if not cache_current(path, digest):
+            subprocess.run([sys.executable, LOADER, path], check=True, stdout=subprocess.DEVNULL)
+
+
+class Reloader:
+    # runs reload() in the background, one at a time. reload returns a report (dict) that is
+    # kept with the time it took
+
+    def __init__(self, path, reload):
+        self.path = path
+        self.trigger = trigger_path(path)
+        self.reload = reload
+        self.lock = threading.Lock()
+        self.last = {}
+        self.reloads = 0
+        self.failures = 0
+        self.watching = None
+        self.seen = signature([self.path, self.trigger])
+
+    def run(self):
+        # the report of the reload, None if another one is running
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            start = time.perf_counter()
+            try:
+                report = self.reload()
+            except Exception as e:
+                self.failures += 1
+                traceback.print_exc()
+                report = {'status': 'failed', 'error': '{}: {}'.format(type(e).__name__, e)}
+            report['seconds'] = time.perf_counter() - start
+            if report['status'] == 'reloaded':
+                self.reloads += 1
+            # a check that found nothing new keeps the report of the last reload
+            if report['status'] != 'unchanged':
+                self.last = report
+            return report
+        finally:
+            self.lock.release()
+
+    def start(self):
+        # runs the reload in a thread, False if one is running already
+        if self.lock.locked():
+            return False
+        threading.Thread(target=self.run, name='reload', daemon=True).start()
+        return True
+
+    def notify(self):
+        # touches the trigger file, so that the workers watching it reload as well
+        with open(self.trigger, 'a'):
+            os.utime(self.trigger)
+        # this worker reloads on its own
+        self.seen = signature([self.path, self.trigger])
+
+    def watch(self, interval):
+        # polls the workbook and the trigger file every interval seconds in this process.
+        # safe to call on every request: the thread is started once per (forked) process
+        if not interval or self.watching == os.getpid():
+            return
+        self.watching = os.getpid()
+        threading.Thread(target=self._poll, args=(interval,), name='reload-watch', daemon=True).start()
+
+    def _poll(self, interval):
+        while True:
+            time.sleep(interval)
+            current = signature([self.path, self.trigger])
+            if current != self.seen and current[0] is not None:
+                self.seen = current
+                self.run()
+
+    def stats(self):
+        stats = {'reloads': self.reloads, 'failures': self.failures, 'running': int(self.lock.locked())}
+        for k, v in self.last.items():
+            if isinstance(v, (int, float)):
+                stats['last_' + k] = v
+        return stats
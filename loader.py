@@ -0,0 +1,228 @@
+# data loading
+# reading OEWS_2021_Data.xlsx with pd.read_excel takes ~2.2s, so the cleaned
+# table is converted once into a columnar .npz file next to the workbook.
+# the .npz stores the sha256 of the workbook it was built from and is rebuilt
+# whenever the workbook changes.
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from xlsx import read_chunks
+
+
+SOURCE = 'OEWS_2021_Data.xlsx'
+
+
+def source_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(path):
+    return os.path.splitext(path)[0] + '.npz'
+
+
+# BLS footnote markers used in place of a value
+SUPPRESSION_CODES = {
+    '*': 'wage estimate not available',
+    '**': 'employment estimate not available',
+    '#': 'wage >= $208,000 per year',
+    '~': 'less than 0.5% of establishments',
+}
+VALUE_COLUMNS = {'A_MEDIAN': 'Annual Median Income', 'TOT_EMP': 'Total Employment'}
+# columns read from the workbook, the full BLS files have many more
+COLUMNS = ['AREA', 'AREA_TITLE', 'AREA_TYPE', 'OCC_CODE', 'OCC_TITLE', 'O_GROUP', 'TOT_EMP', 'A_MEDIAN']
+
+
+def parse_values(values):
+    # one vectorized pass: numbers are kept, anything else becomes NaN with a reason.
+    # the column is factorized first, so only the distinct cells are parsed
+    codes, uniques = pd.factorize(pd.Series(values))
+    parsed = pd.to_numeric(pd.Series(uniques, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+    labels = pd.Series(uniques, dtype=object).map(SUPPRESSION_CODES).fillna('invalid').to_numpy(dtype=object)
+    labels[~np.isnan(parsed)] = 'valid'
+
+    # factorize gives -1 to missing cells, they point at an extra NaN / 'missing' slot
+    parsed = np.append(parsed, np.nan)
+    labels = np.append(labels, 'missing')
+    label_codes, label_names = pd.factorize(labels)
+    reasons = pd.Series(pd.Categorical.from_codes(label_codes[codes], label_names))
+    return parsed[codes], reasons
+
+
+def clean(raw):
+    # cleaned table plus a data-quality summary: rows per reason for each value column
+    data = raw[['AREA_TITLE', 'OCC_TITLE']].copy()
+    quality = {}
+    for column, name in VALUE_COLUMNS.items():
+        data[name], reasons = parse_values(raw[column])
+        quality[name] = reasons.value_counts()
+    return data, quality_table(pd.DataFrame(quality))
+
+
+def quality_table(counts):
+    counts = counts.fillna(0).astype(np.int64)
+    order = ['valid'] + list(SUPPRESSION_CODES.values()) + ['missing', 'invalid']
+    counts = counts.reindex([r for r in order if r in counts.index and (r == 'valid' or counts.loc[r].any())])
+    counts.index.name = 'reason'
+    return counts
+
+
+def read_workbook(path, chunk_rows=100000):
+    # slow path: stream the workbook and clean it chunk by chunk. each chunk is reduced to
+    # categorical titles and float values before the next one is read
+    parts = []
+    quality = None
+    for chunk in read_chunks(path, COLUMNS, chunk_rows):
+        data, counts = clean(chunk)
+        for column in ['AREA_TITLE', 'OCC_TITLE']:
+            data[column] = data[column].astype('category')
+        parts.append(data)
+        quality = counts if quality is None else quality.add(counts, fill_value=0)
+    if not parts:
+        raise ValueError('{} has no rows'.format(path))
+    data = pd.concat(parts, ignore_index=True)
+    for column in ['AREA_TITLE', 'OCC_TITLE']:
+        # categories are unioned in order of appearance, like factorize
+        data[column] = pd.Series(union_categoricals([p[column] for p in parts]))
+    return data, quality_table(quality)
+
+
+def data_arrays(data):
+    # cleaned table as numpy arrays: integer codes for the titles, floats for the values
+    area_codes, areas = pd.factorize(data['AREA_TITLE'])
+    occ_codes, occupations = pd.factorize(data['OCC_TITLE'])
+    return {
+        'areas': np.array(list(areas), dtype=str),
+        'occupations': np.array(list(occupations), dtype=str),
+        'area_codes': area_codes.astype(np.int16),
+        'occ_codes': occ_codes.astype(np.int16),
+        'income': data['Annual Median Income'].to_numpy(dtype=np.float64),
+        'employment': data['Total Employment'].to_numpy(dtype=np.float64),
+    }
+
+
+def data_frame(arrays, categorical=False):
+    # inverse of data_arrays, with categorical title columns the codes are not expanded to strings
+    if categorical:
+        area = pd.Categorical.from_codes(arrays['area_codes'], arrays['areas'])
+        occ = pd.Categorical.from_codes(arrays['occ_codes'], arrays['occupations'])
+    else:
+        area = arrays['areas'][arrays['area_codes']]
+        occ = arrays['occupations'][arrays['occ_codes']]
+    return pd.DataFrame({
+        'AREA_TITLE': area,
+        'OCC_TITLE': occ,
+        'Annual Median Income': arrays['income'],
+        'Total Employment': arrays['employment'],
+    })
+
+
+def write_cache(data, quality, cache, digest):
+    # write to a temporary file first so that concurrent workers never see a half written cache
+    tmp = '{}.{}.tmp'.format(cache, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.savez(
+            f,
+            source_hash = np.array(digest),
+            quality_reasons = np.array(list(quality.index), dtype=str),
+            quality_columns = np.array(list(quality.columns), dtype=str),
+            quality_counts = quality.to_numpy(dtype=np.int64),
+            **data_arrays(data)
+        )
+    os.replace(tmp, cache)
+
+
+def read_cache(cache, digest):
+    # returns None if the cache is missing, unreadable or built from another workbook
+    try:
+        with np.load(cache) as f:
+            if str(f['source_hash']) != digest:
+                return None
+            return data_frame(f)
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def cache_current(path, digest):
+    # whether the .npz of a workbook was built from the workbook with this sha256
+    try:
+        with np.load(cache_path(path)) as f:
+            return str(f['source_hash']) == digest
+    except (OSError, KeyError, ValueError):
+        return False
+
+
+def compact(data):
+    # titles as categoricals (int8/int16 codes instead of a python string per row) and value
+    # columns downcast to float32 when every value is exactly representable in float32.
+    # total employment goes up to ~141 million, past float32's exact integers, so it stays float64
+    data = data.copy()
+    for column in ['AREA_TITLE', 'OCC_TITLE']:
+        if not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype('category')
+    for column in ['Annual Median Income', 'Total Employment']:
+        values = data[column].to_numpy(dtype=np.float64)
+        small = values.astype(np.float32)
+        if np.array_equal(small.astype(np.float64), values, equal_nan=True):
+            data[column] = small
+    return data
+
+
+def memory_table(before, after):
+    # bytes per column before and after compact()
+    table = pd.DataFrame({
+        'before': before.memory_usage(index=False, deep=True),
+        'after': after.memory_usage(index=False, deep=True),
+    })
+    table.loc['total'] = table.sum()
+    table['ratio'] = (table['after'] / table['before']).round(3)
+    return table
+
+
+def build_cache(path=SOURCE):
+    data, quality = read_workbook(path)
+    write_cache(data, quality, cache_path(path), source_hash(path))
+    return data
+
+
+def load_quality(path=SOURCE):
+    # data-quality summary of the cleaning, read from the cache (rebuilt if stale)
+    digest = source_hash(path)
+    for _ in range(2):
+        try:
+            with np.load(cache_path(path)) as f:
+                if str(f['source_hash']) == digest:
+                    quality = pd.DataFrame(f['quality_counts'], index=f['quality_reasons'], columns=f['quality_columns'])
+                    quality.index.name = 'reason'
+                    return quality
+        except (OSError, KeyError, ValueError):
+            pass
+        build_cache(path)
+    raise ValueError('could not build the cache of {}'.format(path))
+
+
+def load_data(path=SOURCE):
+    # fast path: read the .npz cache, fall back to the workbook if it is stale
+    data = read_cache(cache_path(path), source_hash(path))
+    if data is None:
+        data = build_cache(path)
+    return data
+
+
+if __name__ == '__main__':
+    # build step: python loader.py [OEWS_2021_Data.xlsx] [--report]
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    path = args[0] if args else SOURCE
+    data = build_cache(path)
+    print('wrote {}'.format(cache_path(path)))
+    print(load_quality(path))
+    if '--report' in sys.argv:
+        print(memory_table(data, compact(data)))
@@ -0,0 +1,148 @@
+# in-process metrics in the prometheus text format
+# counters, gauges and histograms with labels, rendered by the /metrics endpoint of app.py.
+# every gunicorn worker keeps its own values; the pid label tells the workers apart when a
+# scrape lands on one of them.
+import bisect
+import cProfile
+import io
+import os
+import pstats
+import threading
+
+# seconds, from 100us (a cached figure) to 10s (a cold start)
+BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+# bytes, from a placeholder figure to the clientside bundle
+BYTE_BUCKETS = [1000, 4000, 16000, 64000, 256000, 1000000, 4000000]
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = ('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple((k, labels[k]) for k in self.labels)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in sorted(self.values.items())]
+
+    def render(self, extra=()):
+        # extra: labels added to every sample
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        for name, key, value in self.samples():
+            lines.append('{}{} {}'.format(name, format_labels(tuple(extra) + key), repr(float(value))))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None):
+        # collect: optional function returning {label values tuple: value}, read at scrape time
+        Metric.__init__(self, name, help, labels)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def samples(self):
+        if self.collect is not None:
+            for values, value in self.collect().items():
+                self.set(value, **dict(zip(self.labels, values)))
+        return Metric.samples(self)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        Metric.__init__(self, name, help, labels)
+        self.buckets = list(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self.values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ['+Inf'], counts):
+                cumulative += n
+                samples.append((self.name + '_bucket', key + (('le', bound if bound == '+Inf' else repr(float(bound))),), cumulative))
+            samples.append((self.name + '_sum', key, total))
+            samples.append((self.name + '_count', key, count))
+        return samples
+
+
+class Registry:
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.metrics = []
+
+    def add(self, metric):
+        metric.name = self.prefix + metric.name
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self.add(Gauge(name, help, labels, collect))
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        # text exposition format, every sample carries the pid of the worker
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render([('pid', os.getpid())]))
+        return '\n'.join(lines) + '\n'
+
+
+def profile_summary(profile, limit=30):
+    # the top functions of a cProfile run by cumulative time, as text
+    out = io.StringIO()
+    stats = pstats.Stats(profile, stream=out)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+def start_profile():
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
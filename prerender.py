@@ -0,0 +1,151 @@
+# offline pre-render of every (state, occupation) figure
+# 52 locations x ~1,150 occupations is small enough to render ahead of time. every figure is
+# rendered with the functions of app.py, serialized to json, compressed and written into one
+# file with an offset index. the server memory-maps the file and answers the render callback
+# with the stored json, without any pandas or plotly work.
+#
+# file layout:
+#   MAGIC | compressed figures ... | compressed json index | <index offset, index length>
+# identical figures (the "No Map" / "No Table" placeholders, ...) are stored once.
+#
+# usage: python prerender.py [--output OEWS_2021_Data.figures] [--processes N] [--limit N]
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+MAGIC = b'OEWSFIG1'
+FOOTER = struct.Struct('<QQ')
+SEP = '\x1f'
+
+
+def store_path(path):
+    return os.path.splitext(path)[0] + '.figures'
+
+
+def entry_key(state, occupation, figure_id):
+    return SEP.join([state, occupation, figure_id])
+
+
+def render_chunk(args):
+    # runs in the pool: renders the eight figures of each combination
+    combinations, zdict = args
+    import app
+    from cache import figure_json
+    from figures import encoded
+    out = []
+    for state, occupation in combinations:
+        sel = app.select(state, occupation)
+        for tab_figures in app.figures.values():
+            for figure_id, figure in tab_figures:
+                fig = figure(sel)
+                text = encoded(fig) or figure_json(fig).encode('utf-8')
+                digest = hashlib.sha1(text).digest()
+                c = zlib.compressobj(9, zdict=zdict)
+                out.append((entry_key(state, occupation, figure_id), digest, c.compress(text) + c.flush()))
+    return out
+
+
+def build(output, processes=None, limit=None, chunk_size=64):
+    import app
+    from cache import figure_json
+
+    combinations = [(s, o) for s in app.agg.areas for o in app.occupation_list]
+    if limit:
+        combinations = combinations[:limit]
+
+    # preset dictionary shared by every figure: most of a figure is the plotly template
+    sample = app.select('U.S.', 'All Occupations')
+    zdict = ''.join(figure_json(figure(sample)) for _, figure in app.figures['salary'])
+    zdict = zdict.encode('utf-8')[-32768:]
+
+    chunks = [(combinations[i:i + chunk_size], zdict) for i in range(0, len(combinations), chunk_size)]
+    index = {}
+    blobs = {}
+    tmp = '{}.{}.tmp'.format(output, os.getpid())
+    start = time.perf_counter()
+    with open(tmp, 'wb') as f, ProcessPoolExecutor(processes) as pool:
+        f.write(MAGIC)
+        for results in pool.map(render_chunk, chunks):
+            for key, digest, blob in results:
+                if digest not in blobs:
+                    blobs[digest] = (f.tell(), len(blob))
+                    f.write(blob)
+                index[key] = blobs[digest]
+        header = {
+            'source_hash': app.data_version,
+            # the dictionary is cut on a byte boundary, so it is stored as hex
+            'zdict': zdict.hex(),
+            'entries': index,
+        }
+        packed = zlib.compress(json.dumps(header).encode('utf-8'), 9)
+        offset = f.tell()
+        f.write(packed)
+        f.write(FOOTER.pack(offset, len(packed)))
+    os.replace(tmp, output)
+    return {
+        'combinations': len(combinations),
+        'figures': len(index),
+        'unique': len(blobs),
+        'bytes': os.path.getsize(output),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+class FigureStore:
+    # read side: memory-mapped figure file
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError('{} is not a figure store'.format(path))
+        offset, length = FOOTER.unpack(self.map[-FOOTER.size:])
+        header = json.loads(zlib.decompress(self.map[offset:offset + length]))
+        self.source_hash = header['source_hash']
+        self.zdict = bytes.fromhex(header['zdict'])
+        self.entries = header['entries']
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, state, occupation, figure_id):
+        # serialized figure json (bytes) or None
+        entry = self.entries.get(entry_key(state, occupation, figure_id))
+        if entry is None:
+            return None
+        offset, length = entry
+        d = zlib.decompressobj(zdict=self.zdict)
+        return d.decompress(self.map[offset:offset + length]) + d.flush()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def open_store(path, source_hash):
+    # the store is only used when it was rendered from the current workbook
+    try:
+        store = FigureStore(path)
+    except (OSError, ValueError):
+        return None
+    if store.source_hash != source_hash:
+        store.close()
+        return None
+    return store
+
+
+if __name__ == '__main__':
+    from loader import SOURCE
+    parser = argparse.ArgumentParser(description = 'pre-render every state/occupation figure')
+    parser.add_argument('--output', default = store_path(SOURCE))
+    parser.add_argument('--processes', type = int, default = None)
+    parser.add_argument('--limit', type = int, default = None, help = 'only render the first N combinations')
+    args = parser.parse_args()
+    print(build(args.output, args.processes, args.limit))
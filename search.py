@@ -0,0 +1,58 @@
+# occupation search
+# the occupation dropdown gets its options from the server as the user types instead of
+# shipping all ~1,150 titles in the layout. titles are split into lowercase words and every
+# prefix of every word points to the titles containing it, so a query is a few dict lookups
+# and a set intersection.
+import re
+
+WORD = re.compile(r'[a-z0-9]+')
+# prefixes longer than this are checked against the words of the candidates
+MAX_PREFIX = 8
+
+
+def words(text):
+    return WORD.findall(text.lower())
+
+
+class OccupationIndex:
+
+    def __init__(self, titles):
+        # titles in display order, the order of the results among equally good matches
+        self.titles = list(titles)
+        self.words = [words(t) for t in self.titles]
+        prefixes = {}
+        for i, title_words in enumerate(self.words):
+            for position, word in enumerate(title_words):
+                for n in range(1, min(len(word), MAX_PREFIX) + 1):
+                    leading, other = prefixes.setdefault(word[:n], ([], []))
+                    target = leading if position == 0 else other
+                    if not target or target[-1] != i:
+                        target.append(i)
+        # prefix -> titles with a word starting with it, the titles whose first word starts
+        # with it first, and the same titles as a set
+        self.ordered = {}
+        self.sets = {}
+        for prefix, (leading, other) in prefixes.items():
+            leading_set = set(leading)
+            self.ordered[prefix] = leading + [i for i in other if i not in leading_set]
+            self.sets[prefix] = leading_set.union(other)
+
+    def contains(self, i, query_word):
+        if len(query_word) <= MAX_PREFIX:
+            return i in self.sets.get(query_word, ())
+        return any(w.startswith(query_word) for w in self.words[i])
+
+    def search(self, query, limit=50):
+        # titles with a word starting with every word of the query, the titles whose first
+        # word matches the first word of the query come first
+        query_words = words(query)
+        if not query_words:
+            return []
+        first, rest = query_words[0], query_words[1:]
+        results = []
+        for i in self.ordered.get(first[:MAX_PREFIX], ()):
+            if (len(first) <= MAX_PREFIX or self.contains(i, first)) and all(self.contains(i, w) for w in rest):
+                results.append(self.titles[i])
+                if len(results) == limit:
+                    break
+        return results
@@ -0,0 +1,83 @@
+# shared, memory-mapped arrays
+# the aggregates of the dataset are written once into a single file of raw numpy arrays.
+# every gunicorn worker maps the same file read-only, so the arrays live once in the page
+# cache instead of once per worker.
+#
+# file layout:
+#   MAGIC | header length | json header (version, name -> dtype, shape, offset) | aligned array data
+import json
+import mmap
+import os
+import struct
+import resource
+
+import numpy as np
+
+MAGIC = b'OEWSARR1'
+LENGTH = struct.Struct('<Q')
+ALIGN = 64
+
+
+def shared_path(path):
+    return os.path.splitext(path)[0] + '.shared'
+
+
+def publish(path, arrays, version):
+    # write the arrays atomically, workers attaching meanwhile keep the old file
+    header = {'version': version, 'arrays': {}}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        offset = -(-offset // ALIGN) * ALIGN
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+    text = json.dumps(header).encode('utf-8')
+    start = -(-(len(MAGIC) + LENGTH.size + len(text)) // ALIGN) * ALIGN
+
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(LENGTH.pack(len(text)))
+        f.write(text)
+        for name, array in arrays.items():
+            f.seek(start + header['arrays'][name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp, path)
+
+
+def attach(path, version):
+    # read-only views on the mapped file, None if it is missing or from another version
+    try:
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if buffer[:len(MAGIC)] != MAGIC:
+        return None
+    (length,) = LENGTH.unpack(buffer[len(MAGIC):len(MAGIC) + LENGTH.size])
+    header = json.loads(buffer[len(MAGIC) + LENGTH.size:len(MAGIC) + LENGTH.size + length])
+    if header['version'] != version:
+        return None
+    start = -(-(len(MAGIC) + LENGTH.size + length) // ALIGN) * ALIGN
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=start + spec['offset']).reshape(spec['shape'])
+    return arrays
+
+
+def memory_report():
+    # memory of the current process in bytes. pss splits shared pages between the processes
+    # mapping them, so the pss of a worker is its fair share of the dyno's memory
+    report = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    report[parts[0].rstrip(':').lower()] = int(parts[1]) * 1024
+    except OSError:
+        report['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    keys = ['rss', 'pss', 'shared_clean', 'shared_dirty', 'private_clean', 'private_dirty']
+    return {k: report[k] for k in keys if k in report}
@@ -0,0 +1,99 @@
+# single flight and superseded requests
+# scrolling through the occupation dropdown sends one render request per occupation passed, and
+# users arriving together ask for the same popular selections at the same moment. within a
+# worker, a request identical to one in flight waits for its response instead of being run again
+# (SingleFlight), and a render whose page has sent a later request for the same callback is
+# dropped (Sessions): before it starts, or between two figures when nobody else waits for it.
+# both are per process, requests answered by other workers are not seen.
+import threading
+from collections import OrderedDict
+
+
+class Abandoned(Exception):
+    # raised by a render that was superseded while nobody else waited for it
+    pass
+
+
+class Flight:
+    # one call in flight and the requests waiting for it
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.followers = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # concurrent calls with the same key share the result of the first one
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, call):
+        # (result, shared), call(flight) computes the result. the followers of an abandoned
+        # call start it again, one of them leading
+        while True:
+            with self.lock:
+                flight = self.flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self.flights[key] = Flight()
+                    self.calls += 1
+                else:
+                    flight.followers += 1
+            if leader:
+                try:
+                    flight.result = call(flight)
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    with self.lock:
+                        del self.flights[key]
+                    flight.done.set()
+                return flight.result, False
+            flight.done.wait()
+            if isinstance(flight.error, Abandoned):
+                continue
+            if flight.error is not None:
+                raise flight.error
+            with self.lock:
+                self.shared += 1
+            return flight.result, True
+
+    def stats(self):
+        with self.lock:
+            return {'in_flight': len(self.flights), 'calls': self.calls, 'shared': self.shared}
+
+
+class Sessions:
+    # latest sequence number seen from every (page, callback). the numbers come from the
+    # browser, so a request that arrives after a later one of its page is known to be stale
+
+    def __init__(self, max_entries=10000):
+        self.lock = threading.Lock()
+        self.latest = OrderedDict()
+        self.max_entries = max_entries
+
+    def begin(self, session, sequence):
+        # False if a later request of the session came first
+        with self.lock:
+            latest = self.latest.get(session)
+            if latest is not None and latest > sequence:
+                return False
+            self.latest[session] = sequence
+            self.latest.move_to_end(session)
+            while len(self.latest) > self.max_entries:
+                self.latest.popitem(last=False)
+        return True
+
+    def superseded(self, session, sequence):
+        with self.lock:
+            return self.latest.get(session, sequence) > sequence
+
+    def __len__(self):
+        return len(self.latest)
@@ -0,0 +1,79 @@
+// loader of the static export (see export.py)
+// the dash renderer asks the server for the layout, the callbacks and, on every dropdown
+// change, the figures. without a server those requests are answered here from the exported
+// files: data/figures/<area>/<occupation>.json holds the figures of one selection.
+(function () {
+    var serverFetch = window.fetch.bind(window);
+    var shared = null;
+
+    function file(path) {
+        return serverFetch(new URL(path, document.baseURI).href).then(function (response) {
+            if (!response.ok) {
+                throw new Error(path + ': ' + response.status);
+            }
+            return response.json();
+        });
+    }
+
+    function json(data, status) {
+        return new Response(JSON.stringify(data), {status: status || 200, headers: {'Content-Type': 'application/json'}});
+    }
+
+    // the shared template goes back into every figure, the gauges and placeholders keep
+    // their indicator part (clientside.strip_template)
+    function withTemplate(template, figure) {
+        var full = JSON.parse(JSON.stringify(template));
+        if (figure.layout.template) {
+            full.data = full.data || {};
+            full.data.indicator = figure.layout.template.data.indicator;
+        }
+        figure.layout.template = full;
+        return figure;
+    }
+
+    // file name of a title: encodeURIComponent, encoded once more for the url
+    function name(title) {
+        return encodeURIComponent(encodeURIComponent(title));
+    }
+
+    function figures(request) {
+        var values = {};
+        request.inputs.forEach(function (input) { values[input.id] = input.value; });
+        if (shared === null) {
+            shared = Promise.all([file('/data/template.json'), file('/data/placeholders.json')]);
+        }
+        return Promise.all([
+            shared,
+            file('/data/figures/' + name(values.state_list) + '/' + name(values.occupation_list) + '.json')
+        ]).then(function (results) {
+            var template = results[0][0], placeholders = results[0][1], stored = results[1];
+            var response = {};
+            request.outputs.forEach(function (output) {
+                var figure = stored[output.id];
+                if (typeof figure === 'string') {
+                    figure = JSON.parse(JSON.stringify(placeholders[figure]));
+                }
+                response[output.id] = {figure: withTemplate(template, figure)};
+            });
+            return json({multi: true, response: response});
+        }, function () {
+            // no figures for the selection, e.g. a cleared dropdown
+            return new Response('', {status: 204});
+        });
+    }
+
+    window.fetch = function (resource, init) {
+        var url = typeof resource === 'string' ? resource : resource.url;
+        var path = new URL(url, document.baseURI).pathname;
+        if (/\/_dash-layout$/.test(path)) {
+            return file('/data/layout.json').then(json);
+        }
+        if (/\/_dash-dependencies$/.test(path)) {
+            return file('/data/dependencies.json').then(json);
+        }
+        if (/\/_dash-update-component$/.test(path)) {
+            return figures(JSON.parse(init.body));
+        }
+        return serverFetch(resource, init);
+    };
+})();
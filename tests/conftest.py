@@ -0,0 +1,7 @@
+# the app reads the workbook from the working directory, the tests run from the repo root
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,87 @@
+# the data api of app.py: etags and 304s, gzip and the format negotiation
+import gzip
+import io
+import json
+
+import pytest
+
+import api
+import app
+
+CELL = '/api/cell?area=U.S.&occupation=All+Occupations'
+AREA = '/api/area?area=California'
+
+
+@pytest.fixture
+def client():
+    return app.server.test_client()
+
+
+def test_etag_and_not_modified(client):
+    first = client.get(CELL)
+    assert first.status_code == 200 and first.headers['ETag']
+    assert json.loads(first.data)['data'][0]['area'] == 'U.S.'
+    again = client.get(CELL, headers = {'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304 and again.data == b''
+    assert again.headers['ETag'] == first.headers['ETag']
+    # another query, format or etag is answered in full
+    assert client.get(CELL + '&format=csv', headers = {'If-None-Match': first.headers['ETag']}).status_code == 200
+    assert client.get(CELL, headers = {'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_gzip_above_the_threshold(client):
+    plain = client.get(AREA)
+    assert len(plain.data) >= api.GZIP_MIN_BYTES and 'Content-Encoding' not in plain.headers
+    zipped = client.get(AREA, headers = {'Accept-Encoding': 'br, gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.data) == plain.data
+    assert zipped.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    assert 'Accept-Encoding' in zipped.headers['Vary']
+    # either representation the client holds is still valid
+    for tag in [plain.headers['ETag'], zipped.headers['ETag']]:
+        assert client.get(AREA, headers = {'If-None-Match': tag, 'Accept-Encoding': 'gzip'}).status_code == 304
+
+
+@pytest.mark.parametrize('encoding', ['gzip;q=0', 'identity', 'br', ''])
+def test_gzip_refused(client, encoding):
+    response = client.get(AREA, headers = {'Accept-Encoding': encoding})
+    assert 'Content-Encoding' not in response.headers
+    assert json.loads(response.data)['data']
+
+
+def test_small_bodies_are_not_gzipped(client):
+    response = client.get(CELL, headers = {'Accept-Encoding': 'gzip'})
+    assert len(response.data) < api.GZIP_MIN_BYTES and 'Content-Encoding' not in response.headers
+
+
+@pytest.mark.parametrize('query, accept, media_type', [
+    ('', '', 'application/json'),
+    ('', 'text/csv', 'text/csv; charset=utf-8'),
+    ('', 'application/vnd.apache.arrow.stream', 'application/vnd.apache.arrow.stream'),
+    ('&format=csv', '', 'text/csv; charset=utf-8'),
+    # the format parameter wins over the Accept header
+    ('&format=json', 'text/csv', 'application/json'),
+])
+def test_format(client, query, accept, media_type):
+    if 'arrow' in media_type:
+        pytest.importorskip('pyarrow')
+    response = client.get(CELL + query, headers = {'Accept': accept})
+    assert response.status_code == 200 and response.content_type == media_type
+    if media_type == 'text/csv; charset=utf-8':
+        assert response.data.decode('utf-8').splitlines()[0].split(',')[:3] == ['area', 'level', 'occupation']
+    if 'arrow' in media_type:
+        import pyarrow.ipc
+        table = pyarrow.ipc.open_stream(io.BytesIO(response.data)).read_all()
+        assert table.column('area').to_pylist() == ['U.S.']
+
+
+@pytest.mark.parametrize('query, status', [
+    (CELL + '&format=xml', 400),
+    (CELL + '&year=abc', 400),
+    (CELL + '&year=1999', 404),
+    ('/api/unknown', 404),
+])
+def test_errors(client, query, status):
+    response = client.get(query)
+    assert response.status_code == status
+    assert json.loads(response.data)['error']
@@ -0,0 +1,52 @@
+# the directory shared by the workers: bounded by max_bytes, deleted with its version
+import os
+
+from cache import DiskStore
+
+
+def files(path):
+    return sorted(os.listdir(path))
+
+
+def size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in files(path))
+
+
+def test_store_is_bounded(tmp_path):
+    writer = DiskStore(str(tmp_path), 'v1')
+    for i in range(100):
+        writer.set(('U.S.', i), 'x' * 100)
+        # read in the order of the keys, the first key last
+        os.utime(writer._file(('U.S.', i)), (1000 + i, 1000 + i))
+    os.utime(writer._file(('U.S.', 0)), (2000, 2000))
+    store = DiskStore(str(tmp_path), 'v1', max_bytes = 4000)
+    assert size(store.path) == 3600
+    assert store.evictions == 64
+    assert store.get(('U.S.', 0)) == 'x' * 100
+    assert store.get(('U.S.', 99)) == 'x' * 100
+    assert store.get(('U.S.', 1)) is None
+    # the writes measure the directory again every max_bytes / 16
+    for i in range(100, 200):
+        store.set(('U.S.', i), 'x' * 100)
+        assert size(store.path) <= 4000 + 4000 // 16 + 100
+
+
+def test_unbounded_store(tmp_path):
+    store = DiskStore(str(tmp_path), 'v1', max_bytes = 0)
+    for i in range(100):
+        store.set(('U.S.', i), 'x' * 100)
+    assert len(files(store.path)) == 100 and store.evictions == 0
+
+
+def test_remove_deletes_only_the_namespace(tmp_path):
+    old, new = DiskStore(str(tmp_path), 'v1'), DiskStore(str(tmp_path), 'v2')
+    old.set('key', 'old')
+    new.set('key', 'new')
+    old.remove()
+    assert files(str(tmp_path)) == ['v2']
+    assert old.get('key') is None and new.get('key') == 'new'
+    # a worker still on the old version writes nothing and misses
+    old.set('key', 'old')
+    assert old.get('key') is None
+    DiskStore(str(tmp_path)).remove()
+    assert files(str(tmp_path)) == ['v2']
@@ -0,0 +1,210 @@
+# the figure dicts of figures.py against the figures app.py built with plotly.express and
+# plotly.graph_objects before them. the reference functions below are that code, fed from the
+# same selection, so a changed title, colour, hover template, layout or trace shows up here
+import base64
+import json
+import os
+import random
+import sys
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import pytest
+from plotly.utils import PlotlyJSONEncoder
+
+import app
+from cache import figure_json
+
+
+def normalize(figure):
+    # same json up to number formatting, missing or empty values and typed array encoding
+    def walk(x):
+        if isinstance(x, dict) and set(x) == {'dtype', 'bdata'}:
+            return walk(np.frombuffer(base64.b64decode(x['bdata']), dtype = x['dtype']).tolist())
+        if isinstance(x, dict):
+            return {k: walk(v) for k, v in x.items() if v is not None and v != {}}
+        if isinstance(x, list):
+            return [walk(v) for v in x]
+        if isinstance(x, float):
+            return None if x != x else round(x, 6)
+        return x
+    if isinstance(figure, go.Figure):
+        text = json.dumps(figure, cls = PlotlyJSONEncoder)
+    else:
+        text = figure_json(figure)
+    return walk(json.loads(text))
+
+
+def no_figure(text):
+    fig = go.Figure()
+    fig.add_trace(go.Indicator(
+        number = {'font': {'size': 1}
+                },
+        value = None
+        ))
+    fig.update_layout(
+    template = {'data' : {'indicator': [{
+        'title': {'text': text, 'font':{'size': 80}}
+        }]
+    }})
+    return fig
+
+
+def histogram_figure(hist, label, color = '#636efa'):
+    edges, counts = hist
+    fig = go.Figure(go.Bar(
+        x = (edges[:-1] + edges[1:]) / 2,
+        y = counts,
+        width = float(edges[1] - edges[0]) if len(edges) > 1 else None,
+        marker_color = color,
+        hovertemplate = label + '=%{x}<br>count=%{y}<extra></extra>',
+    ))
+    fig.update_layout(xaxis_title = label, yaxis_title = 'count', bargap = 0)
+    return fig
+
+
+def table_figure(top5, columns, header_color, cell_color, format):
+    names, values = top5
+    table = pd.DataFrame({'State': names, columns[1]: values})
+    return go.Figure(data=[go.Table(
+        header=dict(values=list(table.columns),
+                    fill_color=header_color,
+                    align='left'),
+        cells=dict(values=[table.State, table[columns[1]]],
+                   fill_color=cell_color,
+                   align='left',
+                   format=['', format]),
+        )
+    ])
+
+
+def map_figure(label, scale, z, title):
+    codes = app.map_codes
+    template = px.choropleth(
+                        pd.DataFrame({'state_code': codes, label: np.zeros(len(codes))}),
+                        locations= 'state_code',
+                        locationmode="USA-states",
+                        scope="usa",
+                        color=label,
+                        color_continuous_scale=scale
+                        ).to_plotly_json()
+    return {
+        'data': [dict(template['data'][0], z = z)],
+        'layout': dict(template['layout'], title = dict(text = title, font = dict(size = 18))),
+    }
+
+
+def gauge_figure(value, title, range, color, number, tickcolor = None):
+    axis = {'range': range, 'tickwidth': 1}
+    if tickcolor is not None:
+        axis['tickcolor'] = tickcolor
+    fig = go.Figure()
+    fig.add_trace(go.Indicator(
+        mode = "gauge+number",
+        value = value,
+        number=number,
+        domain = {'row': 0, 'column': 1},
+        gauge = {'axis': axis, 'bar': {'color': color}},
+    ))
+    fig.update_layout(
+        template = {'data' : {'indicator': [{
+            'title': {'text': title, 'font':{'size':18}},
+            }]
+         }})
+    return fig
+
+
+def reference(sel):
+    # the eight figures as app.py built them with plotly, in the order of app.figure_ids
+    state, occupation, title = sel.state, sel.occupation, sel.title
+    us, total = state == 'U.S.', occupation == 'All Occupations'
+    figures = {}
+
+    figures['salary_number'] = gauge_figure(
+        app.gauge_value(sel.value('income')), 'Annual Median Income of {} in {}'.format(title, state),
+        sel.agg.income_range, 'blue', {'font_color':'blue', 'font_size':80, 'prefix': '$'}, 'darkblue')
+    if us or total:
+        hist = sel.area_histogram('income') if us else sel.occupation_histogram('income')
+        fig = histogram_figure(hist, "Annual Median Income")
+        fig.update_layout(
+            title = dict(
+                text='Annual Median Income of {} in {} by {}'.format(title, state, 'State' if us else 'Occupation'),
+                font = dict(size = 18),
+                ),
+            xaxis_title="Annual Median Income ($)"
+            )
+    else:
+        fig = no_figure('No Histogram')
+    figures['salary_histogram'] = fig
+    if us or total:
+        top5 = sel.top_by_area('income') if us else sel.top_by_occupation('income')
+        fig = table_figure(top5, ['State', 'Annual Median Income'], 'paleturquoise', 'lavender', "$,")
+        text = 'Top 5 States by Annual Median Income of {}'.format(title) if us else 'Top 5 Occupations by Annual Median Income of {}'.format(state)
+        fig.update_layout(title = dict(text = text, font = dict(size = 18)))
+    else:
+        fig = no_figure('No Table')
+    figures['salary_table'] = fig
+    if us:
+        fig = map_figure('Annual Median Income', 'blues', sel.map_values('income'), 'Annual Median Income of {} in U.S.'.format(occupation))
+    else:
+        fig = no_figure('No Map')
+    figures['salary_map'] = fig
+
+    figures['employment_number'] = gauge_figure(
+        app.gauge_value(sel.value('employment')), 'Total # of Employment of {} in {}'.format(title, state),
+        sel.agg.employment_range, 'red', {'font_color':'red', 'font_size':80})
+    if us or total:
+        hist = sel.area_histogram('employment_value') if us else sel.occupation_histogram('employment_value')
+        fig = histogram_figure(hist, "Total Employment", color = 'indianred')
+        fig.update_layout(plot_bgcolor = "#ffe6e6",
+                          title = dict(
+                                text='Total # of Employment of {} in {} by {}'.format(title, state, 'State' if us else 'Occupation'),
+                                font = dict(size = 18)
+                                )
+                        )
+    else:
+        fig = no_figure('No Histogram')
+    figures['employment_histogram'] = fig
+    if us:
+        fig = table_figure(sel.top_by_area('employment'), ['State', 'Total Employment'], 'Salmon', 'Pink', ",")
+        fig.update_layout(title = dict(text = 'Top 5 States by Total # of Employment of {}'.format(title), font = dict(size = 18)))
+    elif total:
+        fig = table_figure(sel.top_by_occupation('employment'), ['State', 'Total Employment'], 'Salmon', 'Pink', ",")
+        fig.update_layout(title = {'text': 'Top 5 Occupations by Total # of Employment of {}'.format(state)})
+    else:
+        fig = no_figure('No Table')
+    figures['employment_table'] = fig
+    if us:
+        fig = map_figure('Total Employment', 'reds', sel.map_values('employment'), 'Total # of Employment of {} in U.S.'.format(title))
+    else:
+        fig = no_figure('No Map')
+    figures['employment_map'] = fig
+    return figures
+
+
+def selections():
+    # every kind of selection, and a sample of the occupations with long titles
+    rng = random.Random(0)
+    occupations = app.occupation_list[1:]
+    cases = [('U.S.', 'All Occupations'), ('California', 'All Occupations'), ('Wyoming', 'All Occupations')]
+    cases += [('U.S.', o) for o in rng.sample(occupations, 6)]
+    cases += [(s, o) for s, o in zip(rng.sample(list(app.state_list)[1:], 4), rng.sample(occupations, 4))]
+    return cases
+
+
+@pytest.mark.parametrize('state, occupation', selections())
+def test_figures_match_plotly(state, occupation):
+    sel = app.select(state, occupation)
+    expected = reference(sel)
+    for tab in app.figures.values():
+        for figure_id, figure in tab:
+            assert normalize(figure(sel)) == normalize(expected[figure_id]), figure_id
+
+
+def test_benchmark_check():
+    # benchmarks/bench_figures.py: plotly validates every figure, the placeholders included, to itself
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+    import bench_figures
+    assert bench_figures.check() == 0
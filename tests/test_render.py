@@ -0,0 +1,43 @@
+# the render callback of app.py, called directly and through the dash endpoint
+import json
+
+import pytest
+
+import app
+from figures import placeholder
+
+
+def render_request(state, occupation):
+    # the body the browser sends for a dropdown change
+    client = app.server.test_client()
+    dependencies = json.loads(client.get('/_dash-dependencies').data)
+    callback = next(c for c in dependencies if 'figure' in c['output'])
+    values = {'state_list': state, 'occupation_list': occupation, 'tabs': 'salary'}
+    body = {
+        'output': callback['output'],
+        'outputs': [{'id': i, 'property': 'figure'} for i in app.figure_ids],
+        'inputs': [{'id': i['id'], 'property': i['property'], 'value': values[i['id']]} for i in callback['inputs']],
+        'changedPropIds': ['state_list.value'],
+        'state': [],
+    }
+    return client.post('/_dash-update-component', data = json.dumps(body), content_type = 'application/json')
+
+
+@pytest.mark.parametrize('state, occupation', [
+    (None, 'All Occupations'),
+    ('U.S.', None),
+    (None, None),
+    ('Atlantis', 'All Occupations'),
+])
+def test_cleared_dropdown_renders_placeholders(state, occupation):
+    assert app.select(state, occupation) is None
+    outputs = app.render(state, occupation)
+    assert len(outputs) == len(app.figure_ids)
+    assert all(o is placeholder('No Data') for o in outputs)
+
+
+@pytest.mark.parametrize('state, occupation', [(None, 'All Occupations'), ('U.S.', None)])
+def test_cleared_dropdown_request(state, occupation):
+    response = render_request(state, occupation)
+    assert response.status_code == 200
+    assert set(json.loads(response.data)['response']) == set(app.figure_ids)
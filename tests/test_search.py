@@ -0,0 +1,23 @@
+# the occupation dropdown search of app.py
+import pytest
+
+import app
+
+
+def values(options):
+    return [o['value'] for o in options]
+
+
+def test_search_keeps_the_selected_occupation():
+    selected = app.occupation_list[-1]
+    found = values(app.occupation_options('cashier', selected))
+    assert 'Cashiers' in found and found[-1] == selected
+
+
+@pytest.mark.parametrize('search_value', ['', None])
+def test_cleared_search_restores_the_default_options(search_value):
+    layout = [o['value'] for o in app.app.layout['occupation_list'].options]
+    assert values(app.occupation_options(search_value, 'All Occupations')) == layout
+    # a selected occupation found by searching stays an option
+    selected = next(o for o in app.occupation_list if o not in layout)
+    assert values(app.occupation_options(search_value, selected)) == layout + [selected]
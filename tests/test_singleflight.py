@@ -0,0 +1,143 @@
+# single flight and superseded requests of singleflight.py, with threads standing in for the
+# requests of a worker
+import threading
+import time
+
+import pytest
+
+from singleflight import Abandoned, SingleFlight, Sessions
+
+
+def wait_for(condition, timeout = 5):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, 'timed out'
+        time.sleep(0.001)
+
+
+def start(target, *args):
+    # runs target in a thread, the result or the exception ends up in the returned dict
+    outcome = {}
+    def run():
+        try:
+            outcome['result'] = target(*args)
+        except BaseException as e:
+            outcome['error'] = e
+    thread = threading.Thread(target = run)
+    thread.start()
+    outcome['thread'] = thread
+    return outcome
+
+
+def leader_call(flights, key, followers, result = None, error = None):
+    # a call that waits for the followers to join its flight, then returns or raises
+    calls = []
+    def call(flight):
+        calls.append(flight)
+        wait_for(lambda: flight.followers == followers)
+        if error is not None:
+            raise error
+        return result
+    return start(flights.do, key, call), calls
+
+
+def join(*outcomes):
+    for outcome in outcomes:
+        outcome['thread'].join(5)
+        assert not outcome['thread'].is_alive()
+
+
+def test_followers_share_the_result():
+    flights = SingleFlight()
+    leader, calls = leader_call(flights, 'key', 2, result = 'figures')
+    wait_for(lambda: flights.stats()['in_flight'] == 1)
+    followers = [start(flights.do, 'key', lambda flight: pytest.fail('followers do not call')) for _ in range(2)]
+    join(leader, *followers)
+    assert leader['result'] == ('figures', False)
+    assert [f['result'] for f in followers] == [('figures', True)] * 2
+    assert len(calls) == 1
+    assert flights.stats() == {'in_flight': 0, 'calls': 1, 'shared': 2}
+
+
+def test_different_keys_do_not_wait():
+    flights = SingleFlight()
+    leader, _ = leader_call(flights, 'a', 1, result = 'a')
+    wait_for(lambda: flights.stats()['in_flight'] == 1)
+    assert flights.do('b', lambda flight: 'b') == ('b', False)
+    assert flights.do('a', lambda flight: 'a') == ('a', True)
+    join(leader)
+    assert flights.stats()['calls'] == 2
+
+
+def test_abandoned_flight_is_run_again_by_a_follower():
+    # the leader's page sends a later request while another page waits for the same figures:
+    # the leader gives up and the waiting request runs the call itself
+    flights, sessions = SingleFlight(), Sessions()
+    sessions.begin('page', 1)
+    runs = []
+    def call(flight):
+        runs.append(flight)
+        wait_for(lambda: flight.followers == 1)
+        sessions.begin('page', 2)
+        if sessions.superseded('page', 1):
+            raise Abandoned()
+        return 'stale'
+    leader = start(flights.do, 'key', call)
+    wait_for(lambda: flights.stats()['in_flight'] == 1)
+    follower = start(flights.do, 'key', lambda flight: runs.append(flight) or 'figures')
+    join(leader, follower)
+    assert isinstance(leader['error'], Abandoned)
+    assert follower['result'] == ('figures', False)
+    assert len(runs) == 2 and runs[0] is not runs[1]
+    assert flights.stats() == {'in_flight': 0, 'calls': 2, 'shared': 0}
+
+
+def test_error_reaches_the_followers():
+    flights = SingleFlight()
+    error = ValueError('render failed')
+    leader, _ = leader_call(flights, 'key', 2, error = error)
+    wait_for(lambda: flights.stats()['in_flight'] == 1)
+    followers = [start(flights.do, 'key', lambda flight: 'not called') for _ in range(2)]
+    join(leader, *followers)
+    assert leader['error'] is error
+    assert [f['error'] for f in followers] == [error, error]
+    # the next call starts a new flight
+    assert flights.do('key', lambda flight: 'figures') == ('figures', False)
+
+
+def test_sessions_drop_stale_requests():
+    sessions = Sessions()
+    assert sessions.begin(('page', 'render'), 1)
+    assert sessions.begin(('page', 'render'), 3)
+    # a request that arrives after a later one of its page
+    assert not sessions.begin(('page', 'render'), 2)
+    assert sessions.superseded(('page', 'render'), 2)
+    assert not sessions.superseded(('page', 'render'), 3)
+    # other pages and unknown sessions are not superseded
+    assert sessions.begin(('other', 'render'), 1)
+    assert not sessions.superseded(('unknown', 'render'), 1)
+
+
+def test_sessions_superseded_while_running():
+    sessions = Sessions()
+    sessions.begin('page', 1)
+    superseded = []
+    def render(sequence):
+        wait_for(lambda: sessions.superseded('page', sequence))
+        superseded.append(sequence)
+    first = start(render, 1)
+    assert sessions.begin('page', 2)
+    join(first)
+    assert superseded == [1]
+
+
+def test_sessions_keep_the_latest_pages():
+    sessions = Sessions(max_entries = 2)
+    for page in ['a', 'b', 'c']:
+        sessions.begin(page, 5)
+    sessions.begin('b', 6)
+    sessions.begin('d', 1)
+    assert len(sessions) == 2
+    assert not sessions.begin('b', 5)
+    # the least recently seen pages are forgotten, their old requests run again
+    assert sessions.begin('c', 1)
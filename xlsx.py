@@ -0,0 +1,129 @@
+# streaming xlsx reader
+# pd.read_excel loads the whole sheet through openpyxl before any column can be dropped. the
+# BLS national/state/MSA workbooks are far larger than the bundled file, so the sheet xml is
+# read row by row straight from the zip, only the needed columns are kept, and rows are handed
+# out in chunks. memory stays roughly constant regardless of the workbook size (apart from the
+# shared strings table, which holds the distinct texts of the workbook).
+import posixpath
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+import pandas as pd
+
+NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+
+def first_sheet(zf):
+    # path of the first worksheet in workbook order
+    with zf.open('xl/workbook.xml') as f:
+        for _, elem in iterparse(f):
+            if elem.tag == NS + 'sheet':
+                rid = elem.get(REL_NS + 'id')
+                break
+        else:
+            raise ValueError('workbook has no sheets')
+    with zf.open('xl/_rels/workbook.xml.rels') as f:
+        for _, elem in iterparse(f):
+            if elem.tag == PKG_REL_NS + 'Relationship' and elem.get('Id') == rid:
+                target = elem.get('Target')
+                if target.startswith('/'):
+                    return target[1:]
+                return posixpath.normpath(posixpath.join('xl', target))
+    raise ValueError('sheet {} not found'.format(rid))
+
+
+def shared_strings(zf):
+    if 'xl/sharedStrings.xml' not in zf.namelist():
+        return []
+    strings = []
+    with zf.open('xl/sharedStrings.xml') as f:
+        for _, elem in iterparse(f):
+            if elem.tag == NS + 'si':
+                # plain text, or rich text split in runs (phonetic hints are not part of the text)
+                t = elem.find(NS + 't')
+                if t is not None:
+                    strings.append(t.text or '')
+                else:
+                    strings.append(''.join(t.text or '' for t in elem.findall(NS + 'r/' + NS + 't')))
+                elem.clear()
+    return strings
+
+
+def column_index(ref):
+    # 'AB12' -> 27
+    index = 0
+    for ch in ref:
+        if ch.isdigit():
+            break
+        index = index * 26 + ord(ch) - 64
+    return index - 1
+
+
+def cell_value(cell, strings):
+    kind = cell.get('t')
+    if kind == 'inlineStr':
+        return ''.join(t.text or '' for t in cell.iter(NS + 't'))
+    v = cell.find(NS + 'v')
+    if v is None or v.text is None:
+        return None
+    if kind == 's':
+        return strings[int(v.text)]
+    if kind in ('str', 'e'):
+        return v.text
+    if kind == 'b':
+        return v.text == '1'
+    number = float(v.text)
+    return int(number) if number.is_integer() else number
+
+
+def iter_rows(path, sheet=None, wanted=None):
+    # every row of the sheet as a list of cell values. wanted is an optional set of column
+    # indexes, cells of other columns are not decoded; the caller may fill it in after
+    # reading the header row
+    with zipfile.ZipFile(path) as zf:
+        strings = shared_strings(zf)
+        with zf.open(sheet or first_sheet(zf)) as f:
+            parent = None
+            for event, elem in iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if elem.tag == NS + 'sheetData':
+                        parent = elem
+                    continue
+                if elem.tag != NS + 'row':
+                    continue
+                row = []
+                for position, cell in enumerate(elem.iter(NS + 'c')):
+                    ref = cell.get('r')
+                    index = column_index(ref) if ref else position
+                    if wanted and index not in wanted:
+                        continue
+                    if index >= len(row):
+                        row.extend([None] * (index - len(row) + 1))
+                    row[index] = cell_value(cell, strings)
+                yield row
+                # drop the parsed row so the tree never grows
+                elem.clear()
+                if parent is not None:
+                    parent.clear()
+
+
+def read_chunks(path, columns, chunk_rows=100000, sheet=None):
+    # DataFrames of at most chunk_rows rows with the requested columns that exist in the sheet
+    wanted = set()
+    rows = iter_rows(path, sheet, wanted)
+    header = [str(h).strip() if h is not None else None for h in next(rows, [])]
+    keep = [(c, header.index(c)) for c in columns if c in header]
+    if not keep:
+        raise ValueError('none of the columns {} are in {}'.format(columns, path))
+    wanted.update(i for _, i in keep)
+    names = [c for c, _ in keep]
+    chunk = []
+    for row in rows:
+        chunk.append([row[i] if i < len(row) else None for _, i in keep])
+        if len(chunk) >= chunk_rows:
+            yield pd.DataFrame(chunk, columns=names, dtype=object)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk, columns=names, dtype=object)
@@ -0,0 +1,123 @@
+# multi-year datasets
+# one OEWS workbook per year (OEWS_<year>_Data.xlsx). a year is loaded on first use from its
+# .npz cache (see loader.py) and only a few years are kept in memory, the least recently used
+# one is dropped when another year is loaded. year-over-year growth is computed by the aggregates
+# of the later year (growth_from), aligned by area and occupation title.
+import os
+import re
+import threading
+from collections import OrderedDict
+
+YEAR_FILE = re.compile(r'^OEWS_(\d{4})_Data\.xlsx$')
+
+
+def discover(directory='.'):
+    # year -> workbook path of every OEWS_<year>_Data.xlsx in the directory
+    years = {}
+    for name in os.listdir(directory):
+        match = YEAR_FILE.match(name)
+        if match:
+            years[int(match.group(1))] = os.path.join(directory, name)
+    return dict(sorted(years.items()))
+
+
+class Dataset:
+    # one year: the aggregates and the occupation search index
+
+    def __init__(self, year, version, agg, index=None):
+        self.year = year
+        self.version = version
+        self.agg = agg
+        self.index = index
+
+
+class YearRegistry:
+
+    def __init__(self, paths, load, max_resident=3):
+        # paths: year -> workbook, load: function(year, path) -> Dataset
+        self.paths = dict(paths)
+        self.load = load
+        self.max_resident = max_resident
+        self.resident = OrderedDict()
+        self.pinned = set()
+        self.growths = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.year_locks = {year: threading.Lock() for year in self.paths}
+
+    @property
+    def years(self):
+        return list(self.paths)
+
+    def pin(self, dataset):
+        # a dataset loaded at startup, never evicted
+        with self.lock:
+            self.paths.setdefault(dataset.year, None)
+            self.year_locks.setdefault(dataset.year, threading.Lock())
+            self.resident[dataset.year] = dataset
+            self.pinned.add(dataset.year)
+
+    def replace(self, dataset):
+        # swaps in a new version of a pinned year, the growths computed from the old one go
+        with self.lock:
+            self.resident[dataset.year] = dataset
+            for pair in [p for p in self.growths if dataset.year in p]:
+                del self.growths[pair]
+
+    def get(self, year):
+        with self.lock:
+            dataset = self.resident.get(year)
+            if dataset is not None:
+                self.resident.move_to_end(year)
+                return dataset
+        if year not in self.paths:
+            raise KeyError(year)
+        # one load per year, requests for other years are not blocked meanwhile
+        with self.year_locks[year]:
+            with self.lock:
+                dataset = self.resident.get(year)
+            if dataset is None:
+                dataset = self.load(year, self.paths[year])
+                with self.lock:
+                    self.loads += 1
+                    self.resident[year] = dataset
+                    self._evict()
+        return dataset
+
+    def _evict(self):
+        # least recently used years first, pinned years stay
+        while len(self.resident) > self.max_resident:
+            victim = next((y for y in self.resident if y not in self.pinned), None)
+            if victim is None:
+                break
+            del self.resident[victim]
+            self.evictions += 1
+            for pair in [p for p in self.growths if victim in p]:
+                del self.growths[pair]
+
+    def growth(self, old_year, new_year):
+        # growth from old_year to new_year, kept while both years are resident
+        key = (old_year, new_year)
+        with self.lock:
+            result = self.growths.get(key)
+            if result is not None:
+                self.growths.move_to_end(key)
+                return result
+        old, new = self.get(old_year), self.get(new_year)
+        result = new.agg.growth_from(old.agg)
+        with self.lock:
+            if old_year in self.resident and new_year in self.resident:
+                self.growths[key] = result
+                while len(self.growths) > self.max_resident * 2:
+                    self.growths.popitem(last=False)
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                'years': len(self.paths),
+                'resident': len(self.resident),
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }